@@ -0,0 +1,266 @@
+"""
+Runtime configuration for the BitNet server.
+
+Reads ``MODEL_VARIANT``, ``CONTEXT_SIZE``, ``THREADS`` and ``BATCH_THREADS``
+from the environment (the CDK stack sets them), plus ``SERVER_BIN`` for
+running against another llama-server binary or a local stand-in. Detects
+how many CPUs the function can actually use, from the scheduler affinity
+mask and the cgroup CPU quota.
+
+``THREADS`` and ``BATCH_THREADS`` accept a number, ``auto`` (one thread per
+available CPU) or ``probe``. ``probe`` runs a short ``llama-bench`` sweep over
+candidate thread counts and picks the fastest for generation (``-t``) and for
+prompt processing (``-tb``) separately. Probe results are cached under
+``/tmp``, so a server restart in the same container does not probe again.
+
+``MODEL_LOAD_MODE`` picks how llama-server loads the weights: ``mmap`` (the
+default), ``mlock`` (mmap and lock the pages in memory) or ``no-mmap`` (read
+the file into allocated memory). ``MODEL_PREFETCH`` (``read``, ``fadvise`` or
+``off``) and ``MODEL_PREFETCH_THREADS`` control the page-cache prefetch that
+runs while the server spawns (see ``prefetch.py``).
+
+``MODEL_VARIANT`` names a GGUF layout in ``model_registry.py`` (``i2_s`` by
+default, or ``tl1``) and resolves to its path under /app/models. An explicit
+``MODEL_PATH`` overrides that path.
+"""
+
+import json
+import logging
+import math
+import os
+import subprocess
+import time
+
+import model_registry
+
+logger = logging.getLogger()
+
+DEFAULT_MODEL_PATH = model_registry.model_path(model_registry.DEFAULT_VARIANT)
+DEFAULT_SERVER_BIN = "/app/bin/llama-server"
+DEFAULT_BENCH_BIN = "/app/bin/llama-bench"
+DEFAULT_PROBE_CACHE = "/tmp/bitnet-thread-probe.json"
+
+# MODEL_LOAD_MODE -> extra llama-server flags
+LOAD_MODE_FLAGS = {
+    "mmap": [],
+    "mlock": ["--mlock"],
+    "no-mmap": ["--no-mmap"],
+}
+
+
+def cgroup_cpu_limit():
+    """Return the cgroup CPU quota in CPUs, or None when unlimited."""
+    # cgroup v2: "<quota> <period>" or "max <period>"
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            return int(quota) / int(period)
+        return None
+    except (OSError, ValueError):
+        pass
+    # cgroup v1: quota of -1 means unlimited
+    try:
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+            quota = int(f.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+            period = int(f.read())
+        if quota > 0 and period > 0:
+            return quota / period
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def available_cpus():
+    """Number of CPUs this process can run on, honouring affinity and cgroup quota."""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    quota = cgroup_cpu_limit()
+    if quota is not None:
+        # A fractional quota still lets one more thread make progress
+        cpus = min(cpus, max(1, math.ceil(quota)))
+    return max(1, cpus)
+
+
+def thread_candidates(cpus):
+    """Thread counts worth probing: powers of two up to ``cpus``, plus ``cpus``."""
+    candidates = []
+    n = 1
+    while n < cpus:
+        candidates.append(n)
+        n *= 2
+    candidates.append(cpus)
+    return candidates
+
+
+def probe_threads(model_path, candidates, bench_bin=DEFAULT_BENCH_BIN, n_prompt=64, n_gen=16, timeout=120):
+    """Benchmark ``candidates`` with llama-bench.
+
+    Returns ``(generation_threads, batch_threads, results)`` where ``results``
+    maps each thread count to its prompt and generation tokens/s.
+    """
+    command = [
+        bench_bin,
+        "-m", model_path,
+        "-t", ",".join(str(n) for n in candidates),
+        "-p", str(n_prompt),
+        "-n", str(n_gen),
+        "-r", "1",
+        "-o", "json"
+    ]
+    logger.info(f"Probing thread counts {candidates} with llama-bench...")
+    started = time.perf_counter()
+    output = subprocess.run(command, capture_output=True, text=True, timeout=timeout, check=True).stdout
+
+    results = {}
+    for run in json.loads(output):
+        threads = run["n_threads"]
+        entry = results.setdefault(threads, {"prompt_tps": None, "gen_tps": None})
+        if run.get("n_prompt", 0) > 0 and run.get("n_gen", 0) == 0:
+            entry["prompt_tps"] = run["avg_ts"]
+        elif run.get("n_gen", 0) > 0 and run.get("n_prompt", 0) == 0:
+            entry["gen_tps"] = run["avg_ts"]
+
+    generation = max(results, key=lambda n: results[n]["gen_tps"] or 0)
+    batch = max(results, key=lambda n: results[n]["prompt_tps"] or 0)
+    logger.info(f"Thread probe took {time.perf_counter() - started:.1f}s: {results}")
+    return generation, batch, results
+
+
+class RuntimeConfig:
+    """Model, context and threading configuration for llama-server."""
+
+    def __init__(self, model_path=DEFAULT_MODEL_PATH, context_size=2048, threads="auto", batch_threads=None,
+                 server_bin=DEFAULT_SERVER_BIN, bench_bin=DEFAULT_BENCH_BIN, probe_cache=DEFAULT_PROBE_CACHE,
+                 load_mode="mmap", prefetch="read", prefetch_threads=8, model_variant=None):
+        self.server_bin = server_bin
+        self.model_path = model_path
+        self.model_variant = model_variant
+        self.context_size = context_size
+        self.threads_setting = str(threads)
+        self.batch_threads_setting = str(batch_threads or threads)
+        self.bench_bin = bench_bin
+        self.probe_cache = probe_cache
+        if load_mode not in LOAD_MODE_FLAGS:
+            logger.warning(f"Unknown MODEL_LOAD_MODE {load_mode!r}, using mmap")
+            load_mode = "mmap"
+        self.load_mode = load_mode
+        self.prefetch = prefetch
+        self.prefetch_threads = prefetch_threads
+        self.cpus = available_cpus()
+        self.cpu_quota = cgroup_cpu_limit()
+        # Resolved by resolve_threads()
+        self.threads = None
+        self.batch_threads = None
+        self.thread_source = None
+        self.probe_results = None
+
+    @classmethod
+    def from_env(cls):
+        variant = os.environ.get("MODEL_VARIANT", model_registry.DEFAULT_VARIANT)
+        if variant not in model_registry.VARIANTS:
+            logger.warning(f"Unknown MODEL_VARIANT {variant!r}, using {model_registry.DEFAULT_VARIANT}")
+            variant = model_registry.DEFAULT_VARIANT
+        return cls(
+            model_path=os.environ.get("MODEL_PATH") or model_registry.model_path(variant),
+            model_variant=variant,
+            context_size=int(os.environ.get("CONTEXT_SIZE", "2048")),
+            threads=os.environ.get("THREADS", "auto"),
+            batch_threads=os.environ.get("BATCH_THREADS"),
+            server_bin=os.environ.get("SERVER_BIN", DEFAULT_SERVER_BIN),
+            bench_bin=os.environ.get("LLAMA_BENCH_BIN", DEFAULT_BENCH_BIN),
+            probe_cache=os.environ.get("THREAD_PROBE_CACHE", DEFAULT_PROBE_CACHE),
+            load_mode=os.environ.get("MODEL_LOAD_MODE", "mmap"),
+            prefetch=os.environ.get("MODEL_PREFETCH", "read"),
+            prefetch_threads=int(os.environ.get("MODEL_PREFETCH_THREADS", "8"))
+        )
+
+    def resolve_threads(self):
+        """Turn the THREADS/BATCH_THREADS settings into concrete thread counts."""
+        if self.threads is not None:
+            return self
+        settings = (self.threads_setting, self.batch_threads_setting)
+
+        if "probe" in settings:
+            probed = self._probe()
+            if probed is not None:
+                generation, batch = probed
+                self.threads = generation if settings[0] == "probe" else self._fixed(settings[0])
+                self.batch_threads = batch if settings[1] == "probe" else self._fixed(settings[1])
+                self.thread_source = "probe"
+                return self
+            logger.warning("Thread probe unavailable, falling back to one thread per CPU")
+
+        self.threads = self._fixed(settings[0])
+        self.batch_threads = self._fixed(settings[1])
+        self.thread_source = "env" if all(s.isdigit() for s in settings) else "auto"
+        return self
+
+    def _fixed(self, setting):
+        if setting.isdigit() and int(setting) > 0:
+            return int(setting)
+        return self.cpus
+
+    def _probe(self):
+        cache_key = f"{os.path.basename(self.model_path)}:{self.cpus}"
+        try:
+            with open(self.probe_cache) as f:
+                cached = json.load(f)
+            if cached.get("key") == cache_key:
+                self.probe_results = cached["results"]
+                return cached["threads"], cached["batch_threads"]
+        except (OSError, ValueError, KeyError):
+            pass
+
+        if not os.path.exists(self.bench_bin):
+            return None
+        try:
+            generation, batch, results = probe_threads(self.model_path, thread_candidates(self.cpus),
+                                                       bench_bin=self.bench_bin)
+        except Exception as e:
+            logger.warning(f"Thread probe failed: {str(e)}")
+            return None
+
+        self.probe_results = {str(n): r for n, r in results.items()}
+        try:
+            with open(self.probe_cache, "w") as f:
+                json.dump({"key": cache_key, "threads": generation, "batch_threads": batch,
+                           "results": self.probe_results}, f)
+        except OSError:
+            pass
+        return generation, batch
+
+    def load_flags(self):
+        """llama-server flags for the model load mode."""
+        return list(LOAD_MODE_FLAGS[self.load_mode])
+
+    def thread_env(self):
+        """Thread-count variables for the server process, matching ``threads``."""
+        threads = str(self.threads or 1)
+        return {
+            "OMP_NUM_THREADS": threads,
+            "OMP_THREAD_LIMIT": threads,
+            "MKL_NUM_THREADS": threads,
+            "NUMEXPR_NUM_THREADS": threads,
+            "OPENBLAS_NUM_THREADS": threads
+        }
+
+    def as_dict(self):
+        config = {
+            "model_variant": self.model_variant,
+            "model_path": self.model_path,
+            "context_size": self.context_size,
+            "threads": self.threads,
+            "batch_threads": self.batch_threads,
+            "thread_source": self.thread_source,
+            "cpus": self.cpus,
+            "cpu_quota": self.cpu_quota,
+            "load_mode": self.load_mode,
+            "prefetch": self.prefetch
+        }
+        if self.probe_results is not None:
+            config["probe"] = self.probe_results
+        return config
@@ -0,0 +1,122 @@
+"""
+Deadline-aware generation budgets.
+
+Lambda kills an invocation at its timeout and bills every second up to it,
+so a generation that cannot finish in time is pure waste. ``Deadline`` turns
+the invocation's remaining time into an absolute deadline (less a reserve
+for building the response). ``ThroughputScheduler`` keeps an exponentially
+weighted average of the prompt and generation tokens/s this container
+actually achieves. Together they clamp ``n_predict`` to what fits before the
+deadline. A request that is expected to finish in time runs as a blocking
+request; one that was clamped, or whose time cannot be estimated yet, is
+streamed, and the handler stops consuming the stream once the deadline
+passes, which makes the engine abandon the rest of the generation.
+"""
+
+import math
+import threading
+import time
+
+# Rough characters per token, to estimate prompt length before tokenizing
+CHARS_PER_TOKEN = 4
+
+
+class Deadline:
+    """Absolute deadline for one invocation, from the Lambda context."""
+
+    def __init__(self, remaining_ms, reserve_ms=1500):
+        self.started = time.perf_counter()
+        self.initial_ms = remaining_ms
+        self.reserve_ms = reserve_ms
+        self._at = self.started + (remaining_ms - reserve_ms) / 1000
+
+    @classmethod
+    def from_context(cls, context, reserve_ms=1500):
+        """A deadline for ``context``, or None outside Lambda (no remaining-time clock)."""
+        if context is None or not hasattr(context, "get_remaining_time_in_millis"):
+            return None
+        return cls(context.get_remaining_time_in_millis(), reserve_ms=reserve_ms)
+
+    def remaining_ms(self):
+        return max((self._at - time.perf_counter()) * 1000, 0)
+
+    def remaining_s(self):
+        return self.remaining_ms() / 1000
+
+    def expired(self):
+        return time.perf_counter() >= self._at
+
+
+class ThroughputScheduler:
+    """Per-container throughput estimates, used to size generation to a deadline."""
+
+    def __init__(self, alpha=0.3, safety=0.9):
+        self.alpha = alpha
+        self.safety = safety
+        self.prompt_tps = None
+        self.gen_tps = None
+        # Per-request time outside prompt and generation (queueing, HTTP, JSON)
+        self.overhead_ms = None
+        self.observations = 0
+        self._lock = threading.Lock()
+
+    def observe(self, timings, request_ms=None):
+        """Fold a finished request's llama-server ``timings`` into the averages."""
+        if not timings:
+            return
+        with self._lock:
+            self.prompt_tps = self._update(self.prompt_tps, timings.get("prompt_n"), timings.get("prompt_ms"))
+            self.gen_tps = self._update(self.gen_tps, timings.get("predicted_n"), timings.get("predicted_ms"))
+            if request_ms is not None:
+                overhead = max(request_ms - (timings.get("prompt_ms") or 0) - (timings.get("predicted_ms") or 0), 0)
+                self.overhead_ms = overhead if self.overhead_ms is None else \
+                    self.alpha * overhead + (1 - self.alpha) * self.overhead_ms
+            self.observations += 1
+
+    def _update(self, average, tokens, ms):
+        # Very short runs are dominated by fixed overhead and say little about throughput
+        if not tokens or not ms or tokens < 4:
+            return average
+        rate = tokens * 1000 / ms
+        return rate if average is None else self.alpha * rate + (1 - self.alpha) * average
+
+    def plan(self, prompt, n_predict, deadline):
+        """Clamp ``n_predict`` so the generation fits before ``deadline``.
+
+        Returns a dict with the ``n_predict`` to use, whether it was
+        ``clamped``, the ``expected_ms`` of the request, and whether it must
+        ``stream`` so it can be stopped at the deadline: when it was clamped,
+        or may not finish in time. Without a throughput estimate yet,
+        nothing is clamped and the request streams.
+        """
+        remaining_ms = deadline.remaining_ms()
+        plan = {
+            "remaining_ms": round(remaining_ms),
+            "requested_n_predict": n_predict,
+            "n_predict": n_predict,
+            "clamped": False,
+            "expected_ms": None,
+            "stream": True,
+            "gen_tps_estimate": round(self.gen_tps, 3) if self.gen_tps else None
+        }
+        if not self.gen_tps:
+            return plan
+
+        fixed_ms = self.overhead_ms or 0
+        if self.prompt_tps:
+            fixed_ms += math.ceil(len(prompt) / CHARS_PER_TOKEN) * 1000 / self.prompt_tps
+        affordable = max(int((remaining_ms * self.safety - fixed_ms) / 1000 * self.gen_tps), 0)
+        if n_predict < 0 or n_predict > affordable:
+            plan["n_predict"] = affordable
+            plan["clamped"] = True
+        plan["expected_ms"] = round(fixed_ms + plan["n_predict"] * 1000 / self.gen_tps)
+        plan["stream"] = plan["clamped"] or plan["expected_ms"] > remaining_ms
+        return plan
+
+    def stats(self):
+        return {
+            "prompt_tps": round(self.prompt_tps, 3) if self.prompt_tps else None,
+            "gen_tps": round(self.gen_tps, 3) if self.gen_tps else None,
+            "overhead_ms": round(self.overhead_ms, 3) if self.overhead_ms is not None else None,
+            "observations": self.observations
+        }
@@ -0,0 +1,409 @@
+"""
+In-process inference engine (``ENGINE=inproc``).
+
+Loads BitNet's llama.cpp into the handler process through
+``libbitnet_engine.so`` (built from ``native/bitnet_engine.c`` by the
+Dockerfile) and tokenizes, evaluates and samples directly. This removes the
+HTTP hop to llama-server, the JSON encoding of its responses and the second
+process's memory.
+
+``InProcessEngine`` has the same interface as ``BitNetServer``, so the
+handler's startup, completion, streaming and batch paths work with either.
+It has a single context, so concurrent requests (batches) are served one at a
+time. Like llama-server's ``cache_prompt``, it keeps the previous request's
+tokens in the KV cache and only evaluates what differs.
+
+Only this engine supports prompt-lookup speculative decoding (see
+``speculative.py``): drafts are verified by sampling at every drafted
+position and keeping the drafts that match, so the output follows the same
+distribution as plain decoding.
+"""
+
+import ctypes
+import logging
+import os
+import random
+import threading
+import time
+
+from prefetch import ModelPrefetch
+from server_log import ServerLog
+from speculative import NgramDrafter
+
+logger = logging.getLogger()
+
+DEFAULT_ENGINE_LIB = "/app/lib/libbitnet_engine.so"
+
+# llama-server's defaults for sampling parameters the handler does not set
+SAMPLING_DEFAULTS = {
+    "temperature": 0.8,
+    "top_k": 40,
+    "top_p": 0.95,
+    "min_p": 0.05,
+    "repeat_penalty": 1.0,
+    "seed": -1,
+}
+REPEAT_LAST_N = 64
+LOG_CALLBACK = ctypes.CFUNCTYPE(None, ctypes.c_int, ctypes.c_char_p)
+
+
+def load_library(path):
+    """Load the engine shim and declare its signatures."""
+    lib = ctypes.CDLL(path)
+    i32, i32p = ctypes.c_int32, ctypes.POINTER(ctypes.c_int32)
+    signatures = {
+        "be_set_log": (None, [LOG_CALLBACK]),
+        "be_load": (ctypes.c_void_p, [ctypes.c_char_p, i32, i32, i32, i32, i32, i32]),
+        "be_free": (None, [ctypes.c_void_p]),
+        "be_n_ctx": (i32, [ctypes.c_void_p]),
+        "be_n_vocab": (i32, [ctypes.c_void_p]),
+        "be_tokenize": (i32, [ctypes.c_void_p, ctypes.c_char_p, i32, i32p, i32, i32]),
+        "be_token_to_piece": (i32, [ctypes.c_void_p, i32, ctypes.c_char_p, i32]),
+        "be_is_eog": (i32, [ctypes.c_void_p, i32]),
+        "be_kv_trim": (i32, [ctypes.c_void_p, i32]),
+        "be_decode": (i32, [ctypes.c_void_p, i32p, i32, i32, i32]),
+        "be_sample": (i32, [ctypes.c_void_p, i32, ctypes.c_float, i32, ctypes.c_float, ctypes.c_float,
+                            ctypes.c_float, i32p, i32, ctypes.POINTER(ctypes.c_uint64)]),
+    }
+    for name, (restype, argtypes) in signatures.items():
+        function = getattr(lib, name)
+        function.restype = restype
+        function.argtypes = argtypes
+    return lib
+
+
+def token_array(tokens):
+    return (ctypes.c_int32 * len(tokens))(*tokens)
+
+
+class InProcessEngine:
+    """llama.cpp loaded in-process, behind the ``BitNetServer`` interface."""
+
+    supports_speculative = True
+    # The shim exposes generation only; the embeddings action needs llama-server
+    supports_embeddings = False
+
+    def __init__(self, config, lib_path=None, n_batch=512, server_log=None):
+        self.config = config
+        self.lib_path = lib_path or os.environ.get("ENGINE_LIB", DEFAULT_ENGINE_LIB)
+        self.model_path = config.model_path
+        self.context_size = config.context_size
+        self.n_batch = n_batch
+        self.n_slots = 1
+        self.server_ready = False
+        self.phase = "created"
+        # llama.cpp's own log output, captured like llama-server's
+        self.server_log = server_log or ServerLog()
+        self.prefetch = None
+        self.cold_start = None
+        self._cold_start_reported = False
+        self._lib = None
+        self._handle = None
+        self._log_callback = None
+        self._log_pending = ""
+        # Tokens whose KV state is in the context, in order
+        self._tokens = []
+        self._lock = threading.Lock()
+        self._started = None
+
+    def start_server(self):
+        """Load the library and the model."""
+        try:
+            self._started = time.perf_counter()
+            self.phase = "configuring"
+            self.config.resolve_threads()
+            logger.info(f"In-process engine: {self.model_path}, {self.config.threads} generation / "
+                        f"{self.config.batch_threads} batch threads, load mode {self.config.load_mode}")
+            configure_ms = (time.perf_counter() - self._started) * 1000
+
+            self.phase = "spawning"
+            spawn_started = time.perf_counter()
+            self._lib = load_library(self.lib_path)
+            self._log_callback = LOG_CALLBACK(self._on_log)
+            self._lib.be_set_log(self._log_callback)
+            spawn_ms = (time.perf_counter() - spawn_started) * 1000
+
+            self.phase = "loading_model"
+            self.prefetch = ModelPrefetch(self.model_path, mode=self.config.prefetch,
+                                          workers=self.config.prefetch_threads).start()
+            load_started = time.perf_counter()
+            self._handle = self._lib.be_load(
+                self.model_path.encode("utf-8"),
+                self.context_size,
+                self.n_batch,
+                self.config.threads,
+                self.config.batch_threads,
+                int(self.config.load_mode != "no-mmap"),
+                int(self.config.load_mode == "mlock")
+            )
+            if not self._handle:
+                raise Exception(f"Failed to load model {self.model_path}")
+            model_load_ms = (time.perf_counter() - load_started) * 1000
+            self.context_size = self._lib.be_n_ctx(self._handle)
+            self._tokens = []
+
+            self.server_ready = True
+            self.phase = "ready"
+            self.cold_start = {
+                "configure_ms": round(configure_ms, 2),
+                "spawn_ms": round(spawn_ms, 2),
+                "model_load_ms": round(model_load_ms, 2),
+                "ready_ms": round((time.perf_counter() - spawn_started) * 1000, 2),
+                "first_request_ms": None,
+                "prefetch": self.prefetch.report(),
+                "engine": "inproc"
+            }
+            self._cold_start_reported = False
+            logger.info(f"In-process engine ready in {self.cold_start['ready_ms']:.0f} ms")
+        except Exception as e:
+            logger.error(f"Failed to start in-process engine in phase {self.phase}: {str(e)}")
+            self.server_log.flush(f"startup failed during {self.phase}")
+            raise
+
+    def _on_log(self, level, text):
+        # llama.cpp logs in fragments; hand complete lines to the server log
+        self._log_pending += text.decode("utf-8", "replace")
+        *lines, self._log_pending = self._log_pending.split("\n")
+        for line in lines:
+            self.server_log.feed(line)
+
+    def alive(self, grace=0):
+        """Whether the engine can serve; a native crash takes the whole runtime down with it."""
+        return self.server_ready
+
+    def restart(self):
+        self.stop_server()
+        self.start_server()
+
+    def stop_server(self):
+        """Free the model and context."""
+        self.phase = "stopped"
+        self.server_ready = False
+        with self._lock:
+            if self._handle:
+                self._lib.be_free(self._handle)
+                self._handle = None
+            self._tokens = []
+
+    def _record_first_request(self, started):
+        if self.cold_start is not None and self.cold_start["first_request_ms"] is None:
+            self.cold_start["first_request_ms"] = round((time.perf_counter() - started) * 1000, 2)
+            self.cold_start["total_ms"] = round((time.perf_counter() - self._started) * 1000, 2)
+
+    def take_cold_start_report(self):
+        """Return the cold-start report once, after the first request completes."""
+        if self._cold_start_reported or self.cold_start is None or self.cold_start["first_request_ms"] is None:
+            return None
+        self._cold_start_reported = True
+        return self.cold_start
+
+    def tokenize(self, text, add_special=True):
+        data = text.encode("utf-8")
+        capacity = len(data) + 8
+        while True:
+            buffer = (ctypes.c_int32 * capacity)()
+            n = self._lib.be_tokenize(self._handle, data, len(data), buffer, capacity, int(add_special))
+            if n >= 0:
+                return list(buffer[:n])
+            capacity = -n
+
+    def count_tokens(self, text):
+        return len(self.tokenize(text))
+
+    def token_to_piece(self, token):
+        buffer = ctypes.create_string_buffer(64)
+        n = self._lib.be_token_to_piece(self._handle, token, buffer, len(buffer))
+        if n < 0:
+            buffer = ctypes.create_string_buffer(-n)
+            n = self._lib.be_token_to_piece(self._handle, token, buffer, len(buffer))
+        return buffer.raw[:n]
+
+    def _evaluate(self, tokens, n_past, all_logits=False):
+        """Evaluate ``tokens`` at ``n_past``; returns the batch index of the last token's logits."""
+        status = self._lib.be_decode(self._handle, token_array(tokens), len(tokens), n_past, int(all_logits))
+        if status != 0:
+            raise Exception(f"llama_decode failed with status {status}")
+        self._tokens = self._tokens[:n_past] + list(tokens)
+        return (len(tokens) - 1) % self.n_batch
+
+    def _sample(self, index, sampling, rng, history=None):
+        """Sample from the logits at batch ``index``; ``history`` feeds the repeat penalty."""
+        last = (self._tokens if history is None else history)[-REPEAT_LAST_N:]
+        token = self._lib.be_sample(
+            self._handle, index,
+            float(sampling["temperature"]), int(sampling["top_k"]), float(sampling["top_p"]),
+            float(sampling["min_p"]), float(sampling["repeat_penalty"]),
+            token_array(last), len(last), ctypes.byref(rng)
+        )
+        if token < 0:
+            # be_sample returns -1 when the decode kept no logits at ``index``
+            raise Exception(f"No logits to sample at batch index {index}")
+        return token
+
+    def _prepare_prompt(self, prompt):
+        """Tokenize ``prompt`` and reuse the longest prefix already in the KV cache."""
+        tokens = self.tokenize(prompt)
+        if len(tokens) >= self.context_size:
+            raise Exception(f"Prompt of {len(tokens)} tokens does not fit the context size of {self.context_size}")
+        reused = 0
+        for cached, token in zip(self._tokens, tokens):
+            if cached != token:
+                break
+            reused += 1
+        # The last prompt token is always evaluated, to get logits for sampling
+        reused = min(reused, len(tokens) - 1)
+        self._lib.be_kv_trim(self._handle, reused)
+        self._tokens = self._tokens[:reused]
+        return tokens, reused
+
+    def generate(self, prompt, n_predict=50, sampling=None, speculative=None):
+        """Generate a completion, yielding token chunks and then a final result.
+
+        Intermediate chunks are ``{"content": piece, "stop": False}``; the final
+        one has ``stop`` set and the same fields as a llama-server response.
+        ``speculative`` (options from ``speculative.parse_options``) turns on
+        prompt-lookup drafting.
+        """
+        if not self.server_ready:
+            raise Exception("Server is not ready")
+        sampling = dict(SAMPLING_DEFAULTS, **(sampling or {}))
+        seed = sampling["seed"]
+        rng = ctypes.c_uint64(seed if isinstance(seed, int) and seed >= 0 else random.getrandbits(64))
+        pending_bytes = [b""]
+
+        def piece_of(token):
+            # Multi-byte characters can span tokens; only emit whole UTF-8
+            pending_bytes[0] += self.token_to_piece(token)
+            try:
+                piece = pending_bytes[0].decode("utf-8")
+            except UnicodeDecodeError:
+                return ""
+            pending_bytes[0] = b""
+            return piece
+
+        with self._lock:
+            started = time.perf_counter()
+            prompt_tokens, reused = self._prepare_prompt(prompt)
+            index = self._evaluate(prompt_tokens[reused:], reused)
+            prompt_ms = (time.perf_counter() - started) * 1000
+
+            drafter = NgramDrafter(prompt_tokens, **speculative) if speculative else None
+            drafted = accepted_total = 0
+            limit = n_predict if n_predict >= 0 else self.context_size
+            generated = 0
+            next_token = None
+            stop_type = "limit"
+            truncated = False
+            generation_started = time.perf_counter()
+            while generated < limit:
+                if next_token is None:
+                    token = self._sample(index, sampling, rng)
+                else:
+                    # Already sampled while verifying the previous draft
+                    token, next_token = next_token, None
+                if self._lib.be_is_eog(self._handle, token):
+                    stop_type = "eos"
+                    break
+                generated += 1
+                piece = piece_of(token)
+                if piece:
+                    yield {"content": piece, "stop": False}
+                if len(self._tokens) >= self.context_size:
+                    truncated = True
+                    break
+
+                draft = []
+                if drafter is not None:
+                    drafter.append(token)
+                    room = min(limit - generated, self.context_size - len(self._tokens) - 1)
+                    draft = drafter.draft(room)
+                if not draft:
+                    index = self._evaluate([token], len(self._tokens))
+                    continue
+
+                # Evaluate the token and the whole draft in one pass, then keep
+                # the drafts that sampling at each position agrees with
+                n_past = len(self._tokens)
+                self._evaluate([token] + draft, n_past, all_logits=True)
+                drafted += len(draft)
+                accepted = 0
+                for i, candidate in enumerate(draft):
+                    sampled = self._sample(i, sampling, rng, history=self._tokens[:n_past + 1 + i])
+                    if (sampled != candidate or generated >= limit
+                            or self._lib.be_is_eog(self._handle, sampled)):
+                        next_token = sampled
+                        break
+                    accepted += 1
+                    generated += 1
+                    drafter.append(candidate)
+                    piece = piece_of(candidate)
+                    if piece:
+                        yield {"content": piece, "stop": False}
+                else:
+                    # Every draft matched: the last position yields one more token
+                    next_token = self._sample(len(draft), sampling, rng)
+                accepted_total += accepted
+                keep = n_past + 1 + accepted
+                self._lib.be_kv_trim(self._handle, keep)
+                self._tokens = self._tokens[:keep]
+            predicted_ms = (time.perf_counter() - generation_started) * 1000
+            if pending_bytes[0]:
+                yield {"content": pending_bytes[0].decode("utf-8", "replace"), "stop": False}
+
+        evaluated = len(prompt_tokens) - reused
+        self._record_first_request(started)
+        result = {
+            "content": "",
+            "id_slot": 0,
+            "stop": True,
+            "model": self.model_path,
+            "tokens_predicted": generated,
+            "tokens_evaluated": len(prompt_tokens),
+            "tokens_cached": reused,
+            "generation_settings": dict(sampling, n_ctx=self.context_size, n_predict=n_predict),
+            "prompt": prompt,
+            "stopped_eos": stop_type == "eos",
+            "stopped_limit": stop_type == "limit",
+            "stopped_word": False,
+            "stop_type": stop_type,
+            "stopping_word": "",
+            "truncated": truncated,
+            "timings": {
+                "prompt_n": evaluated,
+                "prompt_ms": round(prompt_ms, 3),
+                "prompt_per_token_ms": round(prompt_ms / evaluated, 3) if evaluated else 0,
+                "prompt_per_second": round(evaluated * 1000 / prompt_ms, 3) if prompt_ms else 0,
+                "predicted_n": generated,
+                "predicted_ms": round(predicted_ms, 3),
+                "predicted_per_token_ms": round(predicted_ms / generated, 3) if generated else 0,
+                "predicted_per_second": round(generated * 1000 / predicted_ms, 3) if predicted_ms else 0
+            }
+        }
+        if drafter is not None:
+            result["generation_settings"]["speculative"] = speculative
+            result["timings"].update({
+                "draft_n": drafted,
+                "draft_n_accepted": accepted_total,
+                "draft_acceptance": round(accepted_total / drafted, 3) if drafted else None
+            })
+        yield result
+
+    def make_request(self, prompt, n_predict=50, sampling=None, timeout=None, speculative=None, slot=None):
+        """Run a completion to the end and return the llama-server shaped result.
+
+        There is one sequence, so ``slot`` is accepted for interface
+        compatibility and the context's common prefix is always reused.
+        """
+        pieces = []
+        for chunk in self.generate(prompt, n_predict, sampling, speculative):
+            if chunk["stop"]:
+                return dict(chunk, content="".join(pieces))
+            pieces.append(chunk["content"])
+
+    def stream_request(self, prompt, n_predict=50, sampling=None, timeout=None, speculative=None, slot=None):
+        """Yield completion chunks as tokens are sampled, like llama-server's stream.
+
+        ``timeout`` is accepted for interface compatibility; closing the
+        generator is what stops generation early.
+        """
+        return self.generate(prompt, n_predict, sampling, speculative)
@@ -2,25 +2,39 @@ import json
 import subprocess
 import threading
 import time
-import requests
 import os
 import signal
 import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from config import RuntimeConfig
+from deadline import Deadline, ThroughputScheduler
+from embeddings import FORMATS as EMBEDDING_FORMATS, POOLING_MODES, embed, pack, parse_inputs
+from engine import InProcessEngine
+from metrics import InvocationMetrics
+from prefetch import ModelPrefetch, PREFETCH_MODES, resident_fraction
+from prefix_cache import PrefixCache
+from response_cache import ResponseCache, is_deterministic
+from response_format import encode, parse_encoding, parse_fields, shape
+from server_log import ServerLog
+from sessions import SessionOverflow, SessionStore
+from speculative import parse_options as parse_speculative
+from supervisor import ServerSupervisor
+from transport import ServerStatusError, ServerTransport, TransportError, TransportTimeout
 
 # Configure logging
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-# Set OpenMP environment variables to completely disable shared memory usage
-os.environ['OMP_NUM_THREADS'] = '1'
-os.environ['OMP_THREAD_LIMIT'] = '1'
+# Set OpenMP environment variables to completely disable shared memory usage.
+# Thread counts are not forced here: the server process gets them from the
+# runtime configuration (THREADS / BATCH_THREADS).
 os.environ['OMP_DYNAMIC'] = 'FALSE'
 os.environ['OMP_PROC_BIND'] = 'FALSE'
 os.environ['OMP_PLACES'] = 'threads'
 os.environ['OMP_WAIT_POLICY'] = 'PASSIVE'
 os.environ['OMP_MAX_ACTIVE_LEVELS'] = '1'
 # GNU OpenMP specific settings to disable shared memory
-os.environ['GOMP_CPU_AFFINITY'] = '0'
 os.environ['GOMP_STACKSIZE'] = '2M'
 # LLVM OpenMP specific settings to disable shared memory
 os.environ['KMP_DUPLICATE_LIB_OK'] = 'TRUE'
@@ -29,161 +43,379 @@ os.environ['KMP_TOPOLOGY_METHOD'] = 'all'
 # Try to disable shared memory completely
 os.environ['OMP_NESTED'] = 'FALSE'
 os.environ['OMP_MAX_TASK_PRIORITY'] = '0'
-# Force single-threaded execution
-os.environ['MKL_NUM_THREADS'] = '1'
-os.environ['NUMEXPR_NUM_THREADS'] = '1'
-os.environ['OPENBLAS_NUM_THREADS'] = '1'
-logger.info("OpenMP configured for single-threaded operation with shared memory disabled")
+logger.info("OpenMP configured with shared memory disabled")
+
+# Model, context size and thread settings from the environment
+runtime_config = RuntimeConfig.from_env()
+logger.info(f"Runtime configuration: {runtime_config.cpus} CPUs available "
+            f"(cgroup quota: {runtime_config.cpu_quota}), THREADS={runtime_config.threads_setting}")
+
+# Sampling parameters a request may override, and their defaults
+SAMPLING_PARAMS = ('temperature', 'top_p', 'top_k', 'min_p', 'repeat_penalty', 'seed')
+DEFAULT_SAMPLING = {"temperature": 0.8, "top_p": 0.95}
+
+# Parallel llama-server slots (-np) for batch requests. llama-server splits the
+# context across slots, so the slot count is capped to keep at least
+# MIN_SLOT_CONTEXT tokens per slot.
+PARALLEL_SLOTS = int(os.environ.get('PARALLEL_SLOTS', '1'))
+MIN_SLOT_CONTEXT = int(os.environ.get('MIN_SLOT_CONTEXT', '512'))
+MAX_BATCH_SIZE = int(os.environ.get('MAX_BATCH_SIZE', '64'))
+
+# "init" starts llama-server in a background thread at module import, so the
+# model loads during the Lambda INIT phase; "lazy" waits for the first invocation.
+STARTUP_MODE = os.environ.get('STARTUP_MODE', 'lazy')
+# Seconds an invocation waits for a pending startup before giving up
+STARTUP_TIMEOUT = float(os.environ.get('STARTUP_TIMEOUT', '300'))
+
+# A crashed llama-server is restarted in place, at most this many times per
+# window; past that the container fails requests until Lambda replaces it
+SUPERVISOR_MAX_RESTARTS = int(os.environ.get('SUPERVISOR_MAX_RESTARTS', '3'))
+SUPERVISOR_WINDOW_S = float(os.environ.get('SUPERVISOR_WINDOW_S', '300'))
+
+# Prompt-prefix KV cache: a JSON list of prefixes to keep evaluated in a slot,
+# where llama-server writes slot snapshots, and an optional read-only directory
+# of snapshots baked into the image that seeds a fresh container
+PROMPT_PREFIXES_FILE = os.environ.get('PROMPT_PREFIXES_FILE')
+PREFIX_CACHE_DIR = os.environ.get('PREFIX_CACHE_DIR', '/tmp/bitnet-slots')
+PREFIX_SEED_DIR = os.environ.get('PREFIX_SEED_DIR', '/app/prefix-cache')
+PREFIX_CACHE_MAX_MB = int(os.environ.get('PREFIX_CACHE_MAX_MB', '256'))
+
+# Multi-turn sessions ("session_id"): how many to keep, how long an idle one
+# lives, what to do when a conversation outgrows its slot ("shift" the oldest
+# history out, or "error"), and the disk budget for snapshots of sessions
+# that lost their slot to another session
+SESSION_MAX = int(os.environ.get('SESSION_MAX', '256'))
+SESSION_IDLE_S = float(os.environ.get('SESSION_IDLE_S', '1800'))
+SESSION_OVERFLOW = os.environ.get('SESSION_OVERFLOW', 'shift')
+SESSION_SNAPSHOT_MAX_MB = int(os.environ.get('SESSION_SNAPSHOT_MAX_MB', '256'))
+
+# Completion result cache for deterministic requests; requests opt in with
+# "cache": true, or RESPONSE_CACHE=1 opts every deterministic request in
+RESPONSE_CACHE = os.environ.get('RESPONSE_CACHE', '0') == '1'
+RESPONSE_CACHE_ENTRIES = int(os.environ.get('RESPONSE_CACHE_ENTRIES', '256'))
+RESPONSE_CACHE_DIR = os.environ.get('RESPONSE_CACHE_DIR', '/tmp/bitnet-response-cache')
+RESPONSE_CACHE_MAX_MB = int(os.environ.get('RESPONSE_CACHE_MAX_MB', '64'))
+
+# Response shaping: which result fields to return ("all", "compact" or a
+# comma-separated list of paths such as "content,timings.predicted_n"), the
+# body encoding ("json", "object", "gzip" or "msgpack") and the smallest JSON
+# body worth gzipping. Events override the first two with "fields" and "encoding".
+# Fields default to "all" so existing clients and the benchmarks keep the
+# timings and metadata blocks they read; set "compact" to trim every response
+RESPONSE_FIELDS = os.environ.get('RESPONSE_FIELDS', 'all')
+RESPONSE_ENCODING = os.environ.get('RESPONSE_ENCODING', 'json')
+RESPONSE_GZIP_MIN_BYTES = int(os.environ.get('RESPONSE_GZIP_MIN_BYTES', '1024'))
+
+# Embeddings (action "embeddings"): EMBEDDINGS=1 starts llama-server with
+# --embedding. Inputs go to the server in batches of up to
+# EMBEDDING_BATCH_TOKENS tokens; one input may have up to EMBEDDING_MAX_TOKENS,
+# which also sets llama-server's physical batch (-ub). EMBEDDING_POOLING is
+# how llama-server pools each input's token vectors ("mean" or "last").
+EMBEDDINGS = os.environ.get('EMBEDDINGS', '0') == '1'
+EMBEDDING_BATCH_TOKENS = int(os.environ.get('EMBEDDING_BATCH_TOKENS', '2048'))
+EMBEDDING_MAX_TOKENS = int(os.environ.get('EMBEDDING_MAX_TOKENS', '512'))
+EMBEDDING_POOLING = os.environ.get('EMBEDDING_POOLING', 'mean')
+MAX_EMBEDDING_INPUTS = int(os.environ.get('MAX_EMBEDDING_INPUTS', '1024'))
+
+# Budget generation against the invocation's remaining time: n_predict is
+# clamped to what the measured throughput allows, and generation stops at the
+# deadline (less DEADLINE_RESERVE_MS) with partial output instead of running
+# into the Lambda timeout
+DEADLINE_AWARE = os.environ.get('DEADLINE_AWARE', '1') == '1'
+DEADLINE_RESERVE_MS = int(os.environ.get('DEADLINE_RESERVE_MS', '1500'))
+# Upper bound on a single request to the engine
+REQUEST_TIMEOUT = 720  # 12 minutes timeout for inference (within 15min Lambda limit)
+
+# One CloudWatch Embedded Metric Format line per invocation
+EMF_METRICS = os.environ.get('EMF_METRICS', '1') == '1'
+
+# "http" runs llama-server as a subprocess; "inproc" loads llama.cpp into this
+# process through libbitnet_engine.so (ENGINE_LIB)
+ENGINE = os.environ.get('ENGINE', 'http')
+ENGINE_LIB = os.environ.get('ENGINE_LIB', '/app/lib/libbitnet_engine.so')
+# Prompt-lookup speculative decoding for every request (ENGINE=inproc only);
+# requests turn it on or off with "speculative": true/false or an options object
+SPECULATIVE = os.environ.get('SPECULATIVE', '0') == '1'
+# llama-server started with --embedding refuses /completion, so with
+# EMBEDDINGS=1 a function serves embeddings only
+COMPLETIONS_DISABLED = ('Completions are disabled: EMBEDDINGS=1 starts llama-server with --embedding, '
+                        'which refuses them. Use a separate function without EMBEDDINGS=1'
+                        if EMBEDDINGS and ENGINE == 'http' else None)
+
+# llama-server output: recent lines kept in memory, lines at or above
+# SERVER_LOG_LEVEL (or matching SERVER_LOG_INCLUDE) logged immediately, and
+# lines matching SERVER_LOG_EXCLUDE dropped
+SERVER_LOG_LINES = int(os.environ.get('SERVER_LOG_LINES', '200'))
+SERVER_LOG_LEVEL = os.environ.get('SERVER_LOG_LEVEL', 'warning')
+SERVER_LOG_INCLUDE = os.environ.get('SERVER_LOG_INCLUDE') or None
+SERVER_LOG_EXCLUDE = os.environ.get('SERVER_LOG_EXCLUDE') or None
+
+def new_server_log(on_event=None):
+    """Bounded capture of the inference engine's log output."""
+    return ServerLog(
+        capacity=SERVER_LOG_LINES,
+        level=SERVER_LOG_LEVEL,
+        include=SERVER_LOG_INCLUDE,
+        exclude=SERVER_LOG_EXCLUDE,
+        on_event=on_event
+    )
 
 class BitNetServer:
-    def __init__(self):
+    # Speculative decoding needs draft verification inside the decode loop,
+    # which llama-server's /completion does not expose
+    supports_speculative = False
+    supports_embeddings = EMBEDDINGS
+    
+    def __init__(self, config=None):
+        self.config = config or runtime_config
         self.process = None
         self.server_ready = False
+        self.phase = "created"
         self.port = 8080
+        self.model_path = self.config.model_path
+        self.context_size = self.config.context_size
+        self.n_slots = max(1, min(PARALLEL_SLOTS, self.context_size // MIN_SLOT_CONTEXT))
+        # An embedded input is evaluated in one physical batch, within one slot's context
+        self.embedding_max_tokens = min(EMBEDDING_MAX_TOKENS, self.context_size // self.n_slots)
+        self.embedding_pooling = EMBEDDING_POOLING if EMBEDDING_POOLING in POOLING_MODES else "mean"
+        # Optional Unix domain socket; needs a llama-server build that accepts a *.sock --host
+        self.socket_path = os.environ.get('SERVER_SOCKET_PATH') or None
+        self.transport = ServerTransport(port=self.port, socket_path=self.socket_path,
+                                         pool_size=max(4, self.n_slots))
+        self.prefix_cache = PrefixCache(
+            self.transport,
+            n_slots=self.n_slots,
+            snapshot_dir=PREFIX_CACHE_DIR,
+            seed_dir=PREFIX_SEED_DIR,
+            max_bytes=PREFIX_CACHE_MAX_MB * 1024 * 1024,
+            namespace=f"{os.path.basename(self.model_path)}:{self.context_size}"
+        )
+        if PROMPT_PREFIXES_FILE:
+            self.prefix_cache.register_from_file(PROMPT_PREFIXES_FILE)
+        self.server_log = new_server_log(on_event=self._watch_startup)
+        # Set by the log thread as soon as llama-server reports it is up
+        self._startup_signal = threading.Event()
+        self._spawn_started = None
+        self._model_loaded_at = None
+        self.prefetch = None
+        self.cold_start = None
+        self._cold_start_reported = False
+        
+    def start_server(self, restart=False):
+        """Start the BitNet server process.
         
-    def start_server(self):
-        """Start the BitNet server process."""
+        A restart skips the model prefetch, since the previous process left
+        the model in the page cache, and keeps the original cold-start report.
+        """
         try:
-            logger.info("Starting BitNet server...")
-            logger.info(f"Model path: /app/models/BitNet-b1.58-2B-4T/ggml-model-i2_s.gguf")
-            logger.info(f"Server will listen on 127.0.0.1:{self.port}")
+            logger.info("Restarting BitNet server..." if restart else "Starting BitNet server...")
+            logger.info(f"Model path: {self.model_path}")
+            logger.info(f"Server will listen on {self.socket_path or f'127.0.0.1:{self.port}'}")
+            logger.info(f"Parallel slots: {self.n_slots} ({self.context_size // self.n_slots} context tokens each)")
+            
+            self._startup_signal.clear()
+            self._model_loaded_at = None
+            self._spawn_started = time.perf_counter()
+            
+            # Pick thread counts; THREADS=probe benchmarks candidates first
+            self.phase = "configuring"
+            self.config.resolve_threads()
+            logger.info(f"Threads: {self.config.threads} generation, {self.config.batch_threads} batch "
+                        f"({self.config.thread_source})")
+            logger.info(f"Model load mode: {self.config.load_mode}, prefetch: {self.config.prefetch}")
+            configure_ms = (time.perf_counter() - self._spawn_started) * 1000
+            
+            self._spawn_started = time.perf_counter()
+            self.phase = "spawning"
+            
+            # Pull the model into the page cache in parallel while the server
+            # spawns, so its mmap page faults hit memory
+            if not restart:
+                self.prefetch = ModelPrefetch(self.model_path, mode=self.config.prefetch,
+                                              workers=self.config.prefetch_threads).start()
             
             # Start the llama-server process with Lambda-optimized parameters
             self.process = subprocess.Popen([
-                "/app/bin/llama-server",
-                "-m", "/app/models/BitNet-b1.58-2B-4T/ggml-model-i2_s.gguf",
-                "-c", "2048",  # ctx_size
-                "-t", "1",     # single thread for Lambda
+                self.config.server_bin,
+                "-m", self.model_path,
+                "-c", str(self.context_size),  # ctx_size, shared by all slots
+                "-np", str(self.n_slots),  # parallel slots
+                "-t", str(self.config.threads),  # generation threads
+                "-tb", str(self.config.batch_threads),  # prompt/batch processing threads
                 "-n", "4096",  # n_predict
                 "-ngl", "0",   # no GPU layers
                 "--temp", "0.8",  # temperature
-                "--host", "127.0.0.1",
+                "--host", self.socket_path or "127.0.0.1",
                 "--port", str(self.port),
-                "-cb"  # Enable continuous batching
-            ], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1)
+                "--slot-save-path", PREFIX_CACHE_DIR,
+                "-cb",  # Enable continuous batching
+                *self.config.load_flags(),  # --mlock / --no-mmap
+                *self._embedding_flags()
+            ], stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+               env=dict(os.environ, **self.config.thread_env()))
+            spawn_ms = (time.perf_counter() - self._spawn_started) * 1000
+            self.phase = "loading_model"
             
-            # Start a thread to capture and log server output
-            import threading
-            def log_server_output():
+            # Start a thread to capture server output into the bounded log
+            process = self.process
+            def capture_server_output():
                 try:
-                    for line in iter(self.process.stdout.readline, ''):
-                        if line.strip():
-                            logger.info(f"BitNet Server: {line.strip()}")
+                    self.server_log.capture(process.stdout)
                 except Exception as e:
                     logger.error(f"Error reading server output: {str(e)}")
+                finally:
+                    # Wake the waiter so it notices the process has exited
+                    self._startup_signal.set()
+                    if self.process is process and self.phase not in ("stopped", "failed"):
+                        self.server_log.flush("server output closed unexpectedly")
             
-            output_thread = threading.Thread(target=log_server_output, daemon=True)
+            output_thread = threading.Thread(target=capture_server_output, daemon=True)
             output_thread.start()
             
             logger.info("BitNet server process started, waiting for it to be ready...")
             
             # Wait for server to be ready
             self._wait_for_server()
+            ready_ms = (time.perf_counter() - self._spawn_started) * 1000
+            model_load_ms = None
+            if self._model_loaded_at is not None:
+                model_load_ms = (self._model_loaded_at - self._spawn_started) * 1000
+            if not restart:
+                self.cold_start = {
+                    "configure_ms": round(configure_ms, 2),
+                    "spawn_ms": round(spawn_ms, 2),
+                    "model_load_ms": round(model_load_ms, 2) if model_load_ms is not None else None,
+                    "ready_ms": round(ready_ms, 2),
+                    "first_request_ms": None,
+                    "prefetch": self.prefetch.report()
+                }
+                self._cold_start_reported = False
+            self.phase = "ready"
             logger.info("BitNet server started successfully")
             
-        except Exception as e:
-            logger.error(f"Failed to start BitNet server: {str(e)}")
-            if self.process and self.process.poll() is None:
-                # Get any error output
+            # Prefixes are evaluated through /completion, which --embedding refuses
+            if self.prefix_cache.entries and not COMPLETIONS_DISABLED:
                 try:
-                    stdout, stderr = self.process.communicate(timeout=5)
-                    if stdout:
-                        logger.error(f"Server stdout: {stdout}")
-                    if stderr:
-                        logger.error(f"Server stderr: {stderr}")
-                except:
-                    pass
+                    logger.info(f"Prefix cache warmed: {self.prefix_cache.warm()}")
+                except Exception as e:
+                    logger.warning(f"Prefix cache warm-up failed: {str(e)}")
+            
+        except Exception as e:
+            logger.error(f"Failed to start BitNet server in phase {self.phase}: {str(e)}")
+            self.server_log.flush(f"startup failed during {self.phase}")
             raise
     
+    def _embedding_flags(self):
+        """llama-server flags for the embeddings action; the server pools, so one vector per input comes back."""
+        if not self.supports_embeddings:
+            return []
+        return ["--embedding", "--pooling", self.embedding_pooling,
+                "-b", str(max(2048, self.embedding_max_tokens)), "-ub", str(self.embedding_max_tokens)]
+    
+    def _watch_startup(self, event):
+        """Record startup milestones from the server log's load events."""
+        if self.server_ready or event["type"] != "load":
+            return
+        if event["stage"] == "model_loaded" and self._model_loaded_at is None:
+            self._model_loaded_at = time.perf_counter()
+            self.phase = "health_check"
+            self._startup_signal.set()
+        elif event["stage"] == "listening":
+            self._startup_signal.set()
+    
     def _wait_for_server(self, max_wait=300):  # 5 minutes for server startup in Lambda
-        """Wait for the server to be ready to accept requests."""
+        """Wait for the server to be ready to accept requests.
+        
+        Health checks back off from 50 ms up to 1 s, and any startup milestone
+        seen by the log thread triggers an immediate check, so readiness is
+        detected within milliseconds of llama-server reporting it.
+        """
         start_time = time.time()
         logger.info(f"Waiting for server to be ready (max {max_wait} seconds)...")
         
+        delay = 0.05
         attempt = 0
         while time.time() - start_time < max_wait:
             attempt += 1
-            elapsed = int(time.time() - start_time)
+            elapsed = time.time() - start_time
             
-            if attempt % 10 == 1:  # Log every 10th attempt
-                logger.info(f"Health check attempt {attempt}, elapsed: {elapsed}s")
+            if self.process.poll() is not None:
+                raise Exception(f"Server exited with code {self.process.returncode} during startup")
             
             try:
-                response = requests.get(f"http://127.0.0.1:{self.port}/health", timeout=30)  # 30 seconds for health check
+                response = self.transport.get("/health", timeout=30)  # 30 seconds for health check
                 if response.status_code == 200:
                     self.server_ready = True
-                    logger.info(f"Server is ready! Took {elapsed} seconds")
+                    logger.info(f"Server is ready! Took {elapsed:.2f} seconds ({attempt} health checks)")
                     return
-                elif response.status_code == 503:
-                    # Server is running but model might still be warming up
-                    # Let's try a simple completion request to see if it actually works
-                    logger.info(f"Server returned 503, testing completion endpoint...")
-                    try:
-                        test_response = requests.post(
-                            f"http://127.0.0.1:{self.port}/completion",
-                            json={"prompt": "test", "n_predict": 1},
-                            timeout=60
-                        )
-                        if test_response.status_code == 200:
-                            self.server_ready = True
-                            logger.info(f"Server is ready via completion test! Took {elapsed} seconds")
-                            return
-                        else:
-                            logger.info(f"Completion test returned status {test_response.status_code}")
-                    except Exception as e:
-                        logger.info(f"Completion test failed: {str(e)}")
-                else:
+                elif response.status_code != 503:
+                    # 503 means the server is up but still loading the model
                     logger.info(f"Health check returned status {response.status_code}")
-            except requests.exceptions.ConnectionError:
-                # Server not ready yet, this is expected
-                pass
-            except requests.exceptions.Timeout:
+            except TransportTimeout:
                 logger.warning(f"Health check timed out after 30 seconds (attempt {attempt})")
-            except Exception as e:
-                logger.warning(f"Health check error: {str(e)}")
-            
-            time.sleep(5)  # Wait 5 seconds between attempts
-        
-        # Try alternative check - simple completion request
-        logger.info("Health check failed, trying completion endpoint...")
-        while time.time() - start_time < max_wait:
-            attempt += 1
-            elapsed = int(time.time() - start_time)
-            
-            try:
-                response = requests.post(
-                    f"http://127.0.0.1:{self.port}/completion",
-                    json={"prompt": "test", "n_predict": 1},
-                    timeout=60  # 60 seconds for test completion
-                )
-                if response.status_code in [200, 503]:  # 503 might mean still loading
-                    if response.status_code == 200:
-                        self.server_ready = True
-                        logger.info(f"Server is ready via completion endpoint! Took {elapsed} seconds")
-                        return
-                    elif "Loading model" not in response.text:
-                        self.server_ready = True
-                        logger.info(f"Server is ready (completion test passed)! Took {elapsed} seconds")
-                        return
-                    else:
-                        logger.info(f"Server still loading model... (elapsed: {elapsed}s)")
-                else:
-                    logger.info(f"Completion test returned status {response.status_code}")
-            except requests.exceptions.ConnectionError:
-                logger.info(f"Connection refused, server still starting... (elapsed: {elapsed}s)")
-            except requests.exceptions.Timeout:
-                logger.warning(f"Completion test timed out (elapsed: {elapsed}s)")
-            except Exception as e:
-                logger.warning(f"Completion test error: {str(e)}")
+            except TransportError:
+                # Server not listening yet, this is expected
+                pass
             
-            time.sleep(10)  # Wait 10 seconds between completion attempts
+            if self._startup_signal.wait(timeout=delay):
+                self._startup_signal.clear()
+            else:
+                delay = min(delay * 2, 1.0)
         
         logger.error(f"Server failed to start within {max_wait} seconds")
         raise Exception("Server failed to start within timeout period")
     
+    def _record_first_request(self, started):
+        """Complete the cold-start report with the first successful request."""
+        if self.cold_start is not None and self.cold_start["first_request_ms"] is None:
+            self.cold_start["first_request_ms"] = round((time.perf_counter() - started) * 1000, 2)
+            self.cold_start["total_ms"] = round((time.perf_counter() - self._spawn_started) * 1000, 2)
+            logger.info(f"Cold start report: {json.dumps(self.cold_start)}")
+    
+    def take_cold_start_report(self):
+        """Return the cold-start report once, after the first request completes."""
+        if self._cold_start_reported or self.cold_start is None or self.cold_start["first_request_ms"] is None:
+            return None
+        self._cold_start_reported = True
+        return self.cold_start
+    
+    def alive(self, grace=0):
+        """Whether the server process is still running.
+        
+        ``grace`` waits that many seconds for a process that is going down,
+        since a crash closes the connection before the exit can be reaped.
+        """
+        if self.process is None or not self.server_ready:
+            return False
+        if not grace:
+            return self.process.poll() is None
+        try:
+            self.process.wait(timeout=grace)
+        except subprocess.TimeoutExpired:
+            return True
+        return False
+    
+    def exit_code(self):
+        return self.process.returncode if self.process is not None else None
+    
+    def restart(self):
+        """Replace a dead server process with a fresh one."""
+        self.stop_server()
+        # The new process starts with empty slots and reports its load stages again
+        self.prefix_cache.forget_resident()
+        self.server_log.reset_stages()
+        try:
+            self.start_server(restart=True)
+        except Exception:
+            self.phase = "failed"
+            self.stop_server()
+            raise
+    
     def stop_server(self):
         """Stop the BitNet server process."""
         if self.process:
+            # Mark the stop first, so the output thread does not flush on EOF
+            self.phase = "stopped"
             try:
                 self.process.terminate()
                 self.process.wait(timeout=10)
@@ -191,76 +423,784 @@ class BitNetServer:
                 self.process.kill()
             self.process = None
             self.server_ready = False
+            self.phase = "stopped"
+        self.transport.close()
+    
+    def _completion_payload(self, prompt, n_predict, stream, slot=-1, sampling=None):
+        """Build the /completion request body."""
+        payload = {
+            "prompt": prompt,
+            "n_predict": n_predict,
+            "stream": stream,
+            # Reuse whatever prefix of the prompt is already evaluated in the slot
+            "cache_prompt": True,
+            "id_slot": slot
+        }
+        payload.update(DEFAULT_SAMPLING)
+        payload.update(sampling or {})
+        return payload
+    
+    def _prepare_prefix(self, prompt):
+        """Pin a prompt starting with a registered prefix to an idle slot holding it.
+        
+        Returns ``(entry, slot, info)``; ``entry`` is None when no registered
+        prefix matches, and ``slot`` is -1 when the server picks the slot.
+        A leased slot must be given back with ``_release_prefix``.
+        """
+        entry = self.prefix_cache.match(prompt)
+        if entry is None:
+            return None, -1, None
+        slot, state = self.prefix_cache.acquire(entry)
+        return entry, slot, {"prefix": entry.key, "slot": slot, "state": state}
     
-    def make_request(self, prompt, n_predict=50):
-        """Make a completion request to the BitNet server."""
+    def _release_prefix(self, entry, slot):
+        if entry is not None:
+            self.prefix_cache.release(slot)
+    
+    def _finish_prefix(self, result, entry, info):
+        """Record which prefix the request left in its slot."""
+        slot = result.get("id_slot", result.get("slot_id"))
+        self.prefix_cache.note_slot_used(slot, entry)
+        if info is not None:
+            result["prefix_cache"] = info
+    
+    def count_tokens(self, text):
+        """Number of tokens llama-server makes of ``text``."""
+        response = self.transport.post("/tokenize", {"content": text}, timeout=30)
+        if response.status_code != 200:
+            raise Exception(f"Tokenize returned status {response.status_code}: {response.text}")
+        return len(response.json()["tokens"])
+    
+    def embed(self, texts, timeout=REQUEST_TIMEOUT):
+        """llama-server's embeddings of ``texts``, in input order.
+        
+        Each is a pooled vector, or a list of per-token vectors from builds
+        that do not pool. Embedding evaluates the inputs in the slots,
+        replacing the prompt prefixes they held.
+        """
         if not self.server_ready:
             raise Exception("Server is not ready")
+        try:
+            response = self.transport.post("/embedding", {"content": texts}, timeout=timeout)
+        except TransportTimeout:
+            raise RequestTimeout("Embedding request timed out")
+        finally:
+            self.prefix_cache.forget_resident()
+        if response.status_code != 200:
+            raise Exception(f"Server returned status {response.status_code}: {response.text}")
+        results = response.json()
+        # A list of results in newer builds; older ones wrap it, or return a single result
+        if isinstance(results, dict):
+            results = results.get("results", [results])
+        results = sorted(results, key=lambda result: result.get("index", 0))
+        if len(results) != len(texts):
+            raise Exception(f"Server returned {len(results)} embeddings for {len(texts)} inputs")
+        return [result["embedding"] for result in results]
+    
+    def make_request(self, prompt, n_predict=50, sampling=None, timeout=REQUEST_TIMEOUT, slot=None):
+        """Make a completion request to the BitNet server.
         
+        ``slot`` pins the request to a slot (for sessions); otherwise a
+        registered prefix picks it, or llama-server does.
+        """
+        if not self.server_ready:
+            raise Exception("Server is not ready")
+        
+        started = time.perf_counter()
+        entry = None
         try:
-            response = requests.post(
-                f"http://127.0.0.1:{self.port}/completion",
-                json={
-                    "prompt": prompt,
-                    "n_predict": n_predict,
-                    "temperature": 0.8,
-                    "top_p": 0.95,
-                    "stream": False
-                },
-                timeout=720  # 12 minutes timeout for inference (within 15min Lambda limit)
+            entry, slot, info = self._prepare_prefix(prompt) if slot is None else (None, slot, None)
+            response = self.transport.post(
+                "/completion",
+                self._completion_payload(prompt, n_predict, stream=False, slot=slot, sampling=sampling),
+                timeout=timeout
             )
             
             if response.status_code == 200:
-                return response.json()
+                result = response.json()
+                self._finish_prefix(result, entry, info)
+                self._record_first_request(started)
+                return result
             else:
                 raise Exception(f"Server returned status {response.status_code}: {response.text}")
                 
-        except requests.exceptions.Timeout:
-            raise Exception("Request timed out")
+        except TransportTimeout:
+            raise RequestTimeout("Request timed out")
+        except TransportError as e:
+            raise ServerConnectionError(f"Request failed: {str(e)}")
         except Exception as e:
             raise Exception(f"Request failed: {str(e)}")
+        finally:
+            self._release_prefix(entry, slot)
+    
+    def stream_request(self, prompt, n_predict=50, sampling=None, timeout=REQUEST_TIMEOUT, slot=None):
+        """Stream a completion from the BitNet server.
+        
+        Yields each server-sent event from llama-server as a dict as soon as it
+        arrives. Intermediate events carry a single token in ``content``; the
+        final event has ``stop`` set and carries ``timings`` and stop details.
+        """
+        if not self.server_ready:
+            raise Exception("Server is not ready")
+        
+        started = time.perf_counter()
+        try:
+            entry, slot, info = self._prepare_prefix(prompt) if slot is None else (None, slot, None)
+        except TransportError as e:
+            raise ServerConnectionError(f"Request failed: {str(e)}")
+        chunks = self.transport.stream(
+            "/completion",
+            self._completion_payload(prompt, n_predict, stream=True, slot=slot, sampling=sampling),
+            timeout=timeout  # Applies per read, so a slow token never trips it early
+        )
+        try:
+            for chunk in chunks:
+                if chunk.get("stop"):
+                    self._finish_prefix(chunk, entry, info)
+                    self._record_first_request(started)
+                yield chunk
+        except TransportTimeout:
+            raise RequestTimeout("Request timed out")
+        except TransportError as e:
+            raise ServerConnectionError(f"Request failed: {str(e)}")
+        except ServerStatusError as e:
+            raise Exception(f"Request failed: {str(e)}")
+        finally:
+            # Closing early drops the connection, which aborts generation server-side
+            chunks.close()
+            self._release_prefix(entry, slot)
+
+
+def collect_stream(chunks, deadline=None):
+    """Drain a completion stream into a single result.
+    
+    The result has the same shape as a blocking ``/completion`` response, plus a
+    ``stream`` block recording time-to-first-token and the number of chunks.
+    With a ``deadline``, the stream is abandoned once it passes (which stops
+    generation in the engine) and the partial output is returned with
+    ``stop_type`` "deadline".
+    """
+    start_time = time.perf_counter()
+    first_token_ms = None
+    pieces = []
+    result = {}
+    count = 0
+    
+    try:
+        for chunk in chunks:
+            count += 1
+            if chunk.get("content") and first_token_ms is None:
+                first_token_ms = (time.perf_counter() - start_time) * 1000
+            pieces.append(chunk.get("content", ""))
+            if chunk.get("stop"):
+                result = chunk
+            elif deadline is not None and deadline.expired():
+                break
+    except RequestTimeout:
+        if deadline is None:
+            raise
+    finally:
+        chunks.close()
+    
+    if not result.get("stop"):
+        # Stopped at the deadline: only the tokens streamed so far are known
+        generated = sum(1 for piece in pieces if piece)
+        result = {
+            "stop": True,
+            "stop_type": "deadline",
+            "tokens_predicted": generated,
+            "timings": {
+                "predicted_n": generated,
+                "predicted_ms": round((time.perf_counter() - start_time) * 1000 - (first_token_ms or 0), 3)
+            }
+        }
+    
+    result = dict(result)
+    result["content"] = "".join(pieces)
+    result["stream"] = {
+        "ttft_ms": round(first_token_ms, 2) if first_token_ms is not None else None,
+        "total_ms": round((time.perf_counter() - start_time) * 1000, 2),
+        "chunks": count
+    }
+    return result
+
+class ServerStartup:
+    """Handle on a BitNet server being started in a background thread."""
+    
+    def __init__(self, server):
+        self.server = server
+        self.error = None
+        self.failed_phase = None
+        self.waited_ms = 0.0
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="bitnet-startup", daemon=True)
+    
+    def start(self):
+        self._thread.start()
+        return self
+    
+    def _run(self):
+        try:
+            self.server.start_server()
+        except Exception as e:
+            self.error = e
+            self.failed_phase = self.server.phase
+            self.server.phase = "failed"
+            self.server.stop_server()
+        finally:
+            self._done.set()
+    
+    @property
+    def phase(self):
+        """The startup phase still in progress, or its final state."""
+        return self.server.phase
+    
+    def done(self):
+        return self._done.is_set()
+    
+    def wait(self, timeout=None):
+        """Wait for startup to finish and return the ready server."""
+        started = time.perf_counter()
+        finished = self._done.wait(timeout)
+        self.waited_ms += (time.perf_counter() - started) * 1000
+        if not finished:
+            raise StartupPending(f"Server startup still pending after {timeout:g}s (phase: {self.phase})")
+        if self.error is not None:
+            raise Exception(f"Server startup failed during {self.failed_phase}: {self.error}")
+        return self.server
+
+
+class StartupPending(Exception):
+    """Raised when an invocation times out waiting for server startup."""
+
+
+class RequestTimeout(Exception):
+    """Raised when a request to the engine times out."""
 
-# Global server instance
+
+class ServerConnectionError(Exception):
+    """Raised when the connection to llama-server is refused or breaks, as when its process dies."""
+
+
+# Global server instance and the handle on its startup
 bitnet_server = None
+server_startup = None
+
+response_cache = ResponseCache(
+    max_entries=RESPONSE_CACHE_ENTRIES,
+    disk_dir=RESPONSE_CACHE_DIR,
+    max_disk_bytes=RESPONSE_CACHE_MAX_MB * 1024 * 1024,
+    namespace=f"{os.path.basename(runtime_config.model_path)}:{runtime_config.context_size}"
+)
+
+# Measured throughput of this container, for deadline budgets
+scheduler = ThroughputScheduler()
+
+sessions = SessionStore(
+    snapshot_dir=PREFIX_CACHE_DIR,
+    max_snapshot_bytes=SESSION_SNAPSHOT_MAX_MB * 1024 * 1024,
+    max_sessions=SESSION_MAX,
+    idle_ttl_s=SESSION_IDLE_S,
+    overflow=SESSION_OVERFLOW,
+    namespace=f"{os.path.basename(runtime_config.model_path)}:{runtime_config.context_size}"
+)
+
+# Restarts the server if it crashes between or during requests; a restarted
+# server's slots are empty
+supervisor = ServerSupervisor(max_restarts=SUPERVISOR_MAX_RESTARTS, window_s=SUPERVISOR_WINDOW_S,
+                              on_restart=sessions.forget_resident,
+                              connection_errors=(ServerConnectionError, TransportError))
+
+# Per-request metadata that must not be replayed from the response cache
+TRANSIENT_RESULT_KEYS = ('stream', 'prefix_cache', 'cold_start', 'cache', 'server_config', 'request_ms',
+                         'deadline', 'supervisor', 'session')
+
+# Invocations served by this container; the first one is the cold start
+invocation_count = 0
+
+def create_server():
+    """A new inference engine of the configured ENGINE type."""
+    if ENGINE == 'inproc':
+        return InProcessEngine(runtime_config, lib_path=ENGINE_LIB, server_log=new_server_log())
+    return BitNetServer()
+
+def start_server_async():
+    """Begin starting a fresh BitNet server in the background."""
+    global server_startup
+    logger.info(f"Starting BitNet server in the background (startup mode: {STARTUP_MODE}, engine: {ENGINE})")
+    server_startup = ServerStartup(create_server()).start()
+    return server_startup
+
+def get_server(context=None, timeout=None):
+    """Return the ready server, waiting for (or kicking off) its startup."""
+    global bitnet_server
+    if bitnet_server is not None:
+        return bitnet_server
+    
+    # Lazy mode starts here on the first invocation; a failed startup is retried
+    if server_startup is None or (server_startup.done() and server_startup.error is not None):
+        start_server_async()
+    
+    timeout = STARTUP_TIMEOUT if timeout is None else timeout
+    if context is not None:
+        # Leave a few seconds to report the pending phase before Lambda times out
+        timeout = min(timeout, max(context.get_remaining_time_in_millis() / 1000 - 5, 1))
+    bitnet_server = server_startup.wait(timeout)
+    return bitnet_server
+
+def flush_server_log(reason):
+    """Write llama-server's recent output to the log after a failure."""
+    if server_startup is not None:
+        server_startup.server.server_log.flush(reason)
+
+def server_log_report(event):
+    """On-demand view of llama-server's recent output (action "server_log")."""
+    if server_startup is None:
+        return bad_request('Server has not been started in this container')
+    server_log = server_startup.server.server_log
+    if event.get('flush'):
+        server_log.flush('requested')
+    report = server_log.snapshot(limit=event.get('lines'))
+    report['phase'] = server_startup.phase
+    report['supervisor'] = supervisor.stats()
+    return {
+        'statusCode': 200,
+        'body': json.dumps(report)
+    }
+
+def is_warmup(event):
+    """Warm-up pings: action "warmup", or an EventBridge scheduled event."""
+    return event.get('action') == 'warmup' or event.get('detail-type') == 'Scheduled Event'
+
+def warm_up(event, context):
+    """Bring the server up and keep the model (and optionally prompt prefixes) hot, without generating.
+    
+    Event fields:
+    - "wait" (default true): wait for startup; false kicks it off and returns at once
+    - "touch": "read" (default), "fadvise" or "off"; how model pages that
+      have left the page cache are brought back
+    - "prefixes" (default false): evaluate registered prompt prefixes into their slots
+    """
+    started = time.perf_counter()
+    touch = event.get('touch', 'read')
+    if touch not in PREFETCH_MODES:
+        return bad_request(f"Parameter touch must be one of {', '.join(PREFETCH_MODES)}")
+    
+    report = {'warmup': True, 'engine': ENGINE, 'invocations': invocation_count}
+    try:
+        server = get_server(context, timeout=None if event.get('wait', True) else 0)
+    except StartupPending:
+        # The startup carries on in the background; the next ping finds it further along
+        report.update(ready=False, phase=server_startup.phase,
+                      elapsed_ms=round((time.perf_counter() - started) * 1000, 2))
+        return {
+            'statusCode': 200,
+            'body': json.dumps(report)
+        }
+    report['restarted'] = supervisor.ensure(server)
+    report.update(ready=server.server_ready, phase=server.phase)
+    
+    # Pages of an mmapped model can be reclaimed between invocations
+    model = {'path': server.model_path, 'resident': resident_fraction(server.model_path)}
+    if touch != 'off' and model['resident'] != 1.0:
+        model['touch'] = ModelPrefetch(server.model_path, mode=touch,
+                                       workers=server.config.prefetch_threads).start().wait().report()
+        model['resident_after'] = resident_fraction(server.model_path)
+    report['model'] = model
+    
+    prefix_cache = getattr(server, 'prefix_cache', None)
+    if event.get('prefixes') and not COMPLETIONS_DISABLED and prefix_cache is not None and prefix_cache.entries:
+        try:
+            report['prefixes'] = [{'slot': slot, 'prefix': key, 'state': state}
+                                  for slot, (key, state) in sorted(prefix_cache.warm().items())]
+        except Exception as e:
+            logger.warning(f"Prefix warm-up failed: {str(e)}")
+            report['prefixes'] = {'error': str(e)}
+    
+    report['supervisor'] = supervisor.stats()
+    report['response_cache'] = cache_counters()
+    report['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 2)
+    return {
+        'statusCode': 200,
+        'body': json.dumps(report)
+    }
+
+def embeddings_response(event, context):
+    """Embed many texts in one invocation (action "embeddings").
+    
+    Event fields:
+    - "inputs": the texts to embed
+    - "normalize" (default true): scale each vector to unit length
+    - "format": "base64" (default), one little-endian float32 matrix, or "list" for JSON floats
+    """
+    texts, error = parse_inputs(event.get('inputs'), MAX_EMBEDDING_INPUTS)
+    if error:
+        return bad_request(error)
+    fmt = event.get('format', 'base64')
+    if fmt not in EMBEDDING_FORMATS:
+        return bad_request(f"Parameter format must be one of {', '.join(EMBEDDING_FORMATS)}")
+    
+    started = time.perf_counter()
+    server = get_server(context)
+    if not getattr(server, 'supports_embeddings', False):
+        return bad_request('Embeddings require ENGINE=http and EMBEDDINGS=1')
+    
+    def request(batch):
+        # A server that crashes mid-batch is restarted and the batch retried, as for completions
+        vectors, _ = supervisor.call(server, lambda: server.embed(batch))
+        return vectors
+    
+    try:
+        matrix, report = embed(texts, server.count_tokens, request, batch_tokens=EMBEDDING_BATCH_TOKENS,
+                               max_tokens=server.embedding_max_tokens, pooling=server.embedding_pooling,
+                               normalized=bool(event.get('normalize', True)), workers=max(4, server.n_slots))
+    finally:
+        # The inputs were evaluated in the slots, over whatever session they held
+        sessions.forget_resident()
+    report['embeddings'] = pack(matrix, fmt)
+    report['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 2)
+    return {
+        'statusCode': 200,
+        'body': json.dumps(report)
+    }
+
+def cache_counters():
+    """Response cache hit/miss counters for response metadata."""
+    return {'hits': response_cache.hits, 'misses': response_cache.misses}
+
+def startup_pending(error):
+    """The 503 for an invocation that gave up waiting on the server's startup."""
+    logger.warning(str(error))
+    return {
+        'statusCode': 503,
+        'body': json.dumps({
+            'error': str(error),
+            'phase': server_startup.phase
+        })
+    }
+
+def bad_request(message):
+    return {
+        'statusCode': 400,
+        'body': json.dumps({
+            'error': message
+        })
+    }
+
+def n_predict_error(value, name='n_predict'):
+    """Why ``value`` is not a usable n_predict, or None; -1 means no limit."""
+    if isinstance(value, bool) or not isinstance(value, int) or value < -1:
+        return f'Parameter {name} must be an integer of -1 or more'
+    return None
+
+def complete(prompt, n_predict, sampling, stream=False, use_cache=False, context=None, speculative=None,
+             session_id=None, append=False):
+    """Run one completion, answering from the response cache when possible.
+    
+    With ``session_id`` the completion is a turn of that session: ``prompt``
+    is the whole conversation, or with ``append`` just the new turn.
+    """
+    # Deterministic requests can be answered from the response cache,
+    # without waiting for the server at all. A session turn depends on the
+    # session's history, so it always goes to the server.
+    effective_sampling = dict(DEFAULT_SAMPLING, **sampling)
+    cache_key = None
+    if use_cache and session_id is None and is_deterministic(effective_sampling):
+        cache_key = response_cache.key(prompt, n_predict, effective_sampling)
+        cached, tier = response_cache.get(cache_key)
+        if cached is not None:
+            return dict(cached, cache=dict(hit=True, tier=tier, **cache_counters()))
+    
+    deadline = Deadline.from_context(context, reserve_ms=DEADLINE_RESERVE_MS) if DEADLINE_AWARE else None
+    
+    # Wait for the server started during INIT, or start it now
+    server = get_server(context)
+    
+    logger.info(f"Processing request with prompt length: {len(prompt)}")
+    
+    # Speculation never changes what is sampled, so it stays out of the cache key
+    speculative_options = parse_speculative(SPECULATIVE if speculative is None else speculative,
+                                            n_batch=getattr(server, 'n_batch', 512))
+    engine_options = {}
+    if speculative_options is not None and server.supports_speculative:
+        engine_options['speculative'] = speculative_options
+    
+    # Pin a session turn to its slot, and only budget for its new text
+    turn = None
+    if session_id is not None:
+        turn = sessions.begin(server, session_id, prompt, append=append, n_predict=n_predict)
+        prompt = turn.prompt
+        engine_options['slot'] = turn.slot
+    
+    plan = None
+    if deadline is not None:
+        plan = scheduler.plan(turn.uncached if turn is not None else prompt, n_predict, deadline)
+        n_predict = plan['n_predict']
+    
+    # Make the inference request. Streaming consumes tokens as llama-server
+    # produces them, so time-to-first-token is observable even though the
+    # Python runtime still returns a single buffered response. A request the
+    # plan says may not finish in time streams too, so it can be cut off at
+    # the deadline; one that fits stays blocking, bounded by the deadline.
+    def run_request():
+        if plan is not None and plan['clamped'] and n_predict == 0:
+            # No time left to generate anything
+            return {'content': '', 'stop': True, 'stop_type': 'deadline', 'tokens_predicted': 0}
+        timeout = min(REQUEST_TIMEOUT, max(deadline.remaining_s(), 1)) if deadline is not None else REQUEST_TIMEOUT
+        if stream or (plan is not None and plan['stream']):
+            result = collect_stream(server.stream_request(prompt, n_predict, sampling, timeout=timeout,
+                                                          **engine_options),
+                                    deadline=deadline)
+            if not stream:
+                del result['stream']
+            return result
+        try:
+            return server.make_request(prompt, n_predict, sampling, timeout=timeout, **engine_options)
+        except RequestTimeout:
+            if deadline is None:
+                raise
+            # Slower than estimated: the closed connection stops the generation
+            return {'content': '', 'stop': True, 'stop_type': 'deadline', 'tokens_predicted': 0}
+    
+    # A server that crashed is restarted first; one that dies mid-request is
+    # restarted and the request retried once
+    request_started = time.perf_counter()
+    try:
+        result, recovery = supervisor.call(server, run_request)
+    except Exception:
+        if turn is not None:
+            sessions.abort(turn)
+        raise
+    # Wall time of the server round trip, for the transport overhead metric
+    result['request_ms'] = round((time.perf_counter() - request_started) * 1000, 3)
+    if recovery is not None:
+        result['supervisor'] = recovery
+    if turn is not None:
+        sessions.finish(turn, result)
+        result['session'] = turn.info
+    else:
+        sessions.note_slot_used(result.get('id_slot', result.get('slot_id')))
+    
+    if speculative_options is not None and not engine_options:
+        result['speculative'] = {'enabled': False, 'reason': 'requires ENGINE=inproc'}
+    
+    if result.get('stop_type') != 'deadline':
+        scheduler.observe(result.get('timings'), result['request_ms'])
+    if plan is not None:
+        result['deadline'] = finish_plan(plan, prompt, result)
+        if result['deadline']['truncated']:
+            # A cut-short answer must not be replayed for the full request
+            cache_key = None
+    
+    if cache_key is not None:
+        response_cache.put(cache_key, {k: v for k, v in result.items() if k not in TRANSIENT_RESULT_KEYS})
+        result['cache'] = dict(hit=False, tier=None, **cache_counters())
+    elif use_cache:
+        result['cache'] = dict(hit=False, tier=None, bypassed='non-deterministic sampling', **cache_counters())
+    return result
+
+def finish_plan(plan, prompt, result):
+    """Complete a deadline plan with whether the output was cut short.
+    
+    Truncated results carry a ``continuation``: invoking again with that
+    prompt and n_predict picks up where this one stopped, and llama-server's
+    prompt cache makes the repeated prefix cheap.
+    """
+    stopped_by_deadline = result.get('stop_type') == 'deadline'
+    clamped_limit = plan['clamped'] and result.get('stop_type', 'limit') == 'limit'
+    plan = dict(plan, truncated=stopped_by_deadline or clamped_limit)
+    plan['reason'] = 'deadline' if stopped_by_deadline else 'clamped' if clamped_limit else None
+    if plan['truncated']:
+        requested = plan['requested_n_predict']
+        generated = result.get('tokens_predicted', 0)
+        plan['continuation'] = {
+            'prompt': prompt + result.get('content', ''),
+            'n_predict': max(requested - generated, 0) if requested >= 0 else -1
+        }
+    return plan
+
+def parse_batch(event):
+    """Normalise the "prompts" list of a batch event.
+    
+    Items are prompt strings or objects with their own "prompt", "n_predict",
+    "speculative", "session_id", "append" and sampling parameters; anything
+    not set per item comes from the event.
+    Returns ``(items, error)``.
+    """
+    prompts = event.get('prompts')
+    if not isinstance(prompts, list) or not prompts:
+        return None, 'Parameter prompts must be a non-empty list'
+    if len(prompts) > MAX_BATCH_SIZE:
+        return None, f'Batch of {len(prompts)} prompts exceeds the limit of {MAX_BATCH_SIZE}'
+    
+    defaults = {k: event[k] for k in SAMPLING_PARAMS if k in event}
+    items = []
+    for index, item in enumerate(prompts):
+        if isinstance(item, str):
+            item = {'prompt': item}
+        if not isinstance(item, dict) or not item.get('prompt'):
+            return None, f'Batch item {index} is missing a prompt'
+        n_predict = item.get('n_predict', event.get('n_predict', 50))
+        error = n_predict_error(n_predict, f'n_predict of batch item {index}')
+        if error:
+            return None, error
+        items.append({
+            'prompt': item['prompt'],
+            'n_predict': n_predict,
+            'sampling': dict(defaults, **{k: item[k] for k in SAMPLING_PARAMS if k in item}),
+            'speculative': item.get('speculative', event.get('speculative')),
+            'session_id': item.get('session_id'),
+            'append': bool(item.get('append', event.get('append', False)))
+        })
+    return items, None
+
+def complete_batch(items, use_cache=False, context=None):
+    """Run a batch of completions concurrently, one per llama-server slot.
+    
+    llama-server's continuous batching decodes the in-flight requests
+    together, so N prompts cost far less than N sequential invocations.
+    Results keep the input order; a failed item carries an "error" instead of
+    failing the whole batch.
+    """
+    server = get_server(context)
+    started = time.perf_counter()
+    
+    def run(indexed_item):
+        index, item = indexed_item
+        item_started = time.perf_counter()
+        try:
+            result = complete(item['prompt'], item['n_predict'], item['sampling'], use_cache=use_cache,
+                              context=context, speculative=item['speculative'], session_id=item['session_id'],
+                              append=item['append'])
+        except Exception as e:
+            logger.error(f"Batch item {index} failed: {str(e)}")
+            flush_server_log(f"batch item {index} failed")
+            result = {'error': str(e)}
+        result['index'] = index
+        result['elapsed_ms'] = round((time.perf_counter() - item_started) * 1000, 2)
+        return result
+    
+    with ThreadPoolExecutor(max_workers=min(server.n_slots, len(items))) as pool:
+        results = list(pool.map(run, enumerate(items)))
+    
+    return {
+        'results': results,
+        'batch': {
+            'count': len(items),
+            'slots': server.n_slots,
+            'total_ms': round((time.perf_counter() - started) * 1000, 2)
+        }
+    }
 
 def lambda_handler(event, context):
     """AWS Lambda handler function."""
-    global bitnet_server
+    global invocation_count
+    invocation_count += 1
+    metrics = InvocationMetrics(context, cold_start=invocation_count == 1, enabled=EMF_METRICS)
+    waited_before = server_startup.waited_ms if server_startup is not None else 0
+    
+    response = handle_event(event, context, metrics)
     
+    if server_startup is not None:
+        metrics.startup_wait_ms = max(server_startup.waited_ms - waited_before, 0)
+    try:
+        metrics.finish(response['statusCode'])
+    except Exception as e:
+        logger.warning(f"Could not emit metrics: {str(e)}")
+    return response
+
+def handle_event(event, context, metrics):
+    """Serve one event, recording what was served on ``metrics``."""
     try:
-        # Initialize server if not already done
-        if bitnet_server is None:
-            bitnet_server = BitNetServer()
-            bitnet_server.start_server()
-        
         # Parse the event
         if isinstance(event, str):
             event = json.loads(event)
         
-        # Extract prompt and parameters
-        prompt = event.get('prompt', '')
-        n_predict = event.get('n_predict', 50)
-        
-        if not prompt:
+        action = event.get('action')
+        if is_warmup(event):
+            metrics.kind = 'warmup'
+            return warm_up(event, context)
+        elif action == 'server_log':
+            metrics.kind = action
+            return server_log_report(event)
+        elif action == 'end_session':
+            metrics.kind = action
+            if not event.get('session_id'):
+                return bad_request('Missing required parameter: session_id')
             return {
-                'statusCode': 400,
-                'body': json.dumps({
-                    'error': 'Missing required parameter: prompt'
-                })
+                'statusCode': 200,
+                'body': json.dumps({'session_id': event['session_id'], 'ended': sessions.end(event['session_id']),
+                                    'sessions': sessions.stats()})
             }
+        elif action == 'embeddings':
+            metrics.kind = action
+            try:
+                return embeddings_response(event, context)
+            except StartupPending as e:
+                return startup_pending(e)
+        elif action is not None:
+            return bad_request(f'Unknown action: {action}')
         
-        logger.info(f"Processing request with prompt length: {len(prompt)}")
+        if COMPLETIONS_DISABLED:
+            return bad_request(COMPLETIONS_DISABLED)
         
-        # Make the inference request
-        result = bitnet_server.make_request(prompt, n_predict)
+        use_cache = bool(event.get('cache', RESPONSE_CACHE))
+        try:
+            fields = parse_fields(event.get('fields', RESPONSE_FIELDS))
+            encoding = parse_encoding(event.get('encoding', RESPONSE_ENCODING))
+        except ValueError as e:
+            return bad_request(str(e))
         
-        return {
-            'statusCode': 200,
-            'body': json.dumps(result)
-        }
+        try:
+            if 'prompts' in event:
+                items, error = parse_batch(event)
+                if error:
+                    return bad_request(error)
+                result = complete_batch(items, use_cache=use_cache, context=context)
+                metrics.kind = 'batch'
+                metrics.results = result['results']
+            else:
+                # Extract prompt and parameters
+                prompt = event.get('prompt', '')
+                n_predict = event.get('n_predict', 50)
+                stream = bool(event.get('stream', False))
+                sampling = {k: event[k] for k in SAMPLING_PARAMS if k in event}
+                speculative = event.get('speculative')
+                session_id = event.get('session_id')
+                
+                if not prompt:
+                    return bad_request('Missing required parameter: prompt')
+                error = n_predict_error(n_predict)
+                if error:
+                    return bad_request(error)
+                if session_id is not None and not isinstance(session_id, str):
+                    return bad_request('Parameter session_id must be a string')
+                
+                result = complete(prompt, n_predict, sampling, stream=stream, use_cache=use_cache, context=context,
+                                  speculative=speculative, session_id=session_id,
+                                  append=bool(event.get('append', False)))
+                metrics.kind = 'stream' if stream else 'completion'
+                metrics.results = [result]
+        except SessionOverflow as e:
+            return bad_request(str(e))
+        except StartupPending as e:
+            return startup_pending(e)
+        
+        if bitnet_server is not None:
+            result['server_config'] = dict(bitnet_server.config.as_dict(), engine=ENGINE)
+            cold_start = bitnet_server.take_cold_start_report()
+            if cold_start is not None:
+                result['cold_start'] = dict(
+                    cold_start,
+                    startup_mode=STARTUP_MODE,
+                    handler_wait_ms=round(server_startup.waited_ms, 2)
+                )
+        
+        return encode(shape(result, fields), encoding=encoding, gzip_min_bytes=RESPONSE_GZIP_MIN_BYTES)
         
     except Exception as e:
         logger.error(f"Error processing request: {str(e)}")
+        flush_server_log('request failed')
         return {
             'statusCode': 500,
             'body': json.dumps({
@@ -271,10 +1211,16 @@ def lambda_handler(event, context):
 # Cleanup function for Lambda container reuse
 def cleanup():
     """Cleanup function called when Lambda container is being destroyed."""
-    global bitnet_server
-    if bitnet_server:
-        bitnet_server.stop_server()
+    if server_startup is not None:
+        server_startup.server.stop_server()
 
 # Register cleanup function
 import atexit
 atexit.register(cleanup)
+
+if COMPLETIONS_DISABLED:
+    logger.warning(COMPLETIONS_DISABLED)
+
+# Kick off model loading while the Lambda runtime client is still bootstrapping
+if STARTUP_MODE == 'init':
+    start_server_async()
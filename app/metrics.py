@@ -0,0 +1,164 @@
+"""
+Per-invocation performance metrics in CloudWatch Embedded Metric Format.
+
+Each invocation prints one JSON log line that CloudWatch turns into metrics
+under ``METRICS_NAMESPACE``, with the function name and cold/warm start as
+dimensions. EMF lines must be bare JSON, so they are printed to stdout rather
+than going through the logger, which prefixes every line.
+
+``bench/emf_report.py`` parses captured logs and computes the same
+aggregates locally.
+"""
+
+import json
+import os
+import sys
+import time
+
+NAMESPACE = os.environ.get("METRICS_NAMESPACE", "BitNetLambda")
+
+# Metric name -> CloudWatch unit
+METRIC_UNITS = {
+    "ColdStart": "Count",
+    "Error": "Count",
+    "HandlerDuration": "Milliseconds",
+    "StartupWait": "Milliseconds",
+    "ServerCompute": "Milliseconds",
+    "Overhead": "Milliseconds",
+    "PromptTokens": "Count",
+    "PromptTokensPerSecond": "Count/Second",
+    "GeneratedTokens": "Count",
+    "GenerationTokensPerSecond": "Count/Second",
+    "TokensCached": "Count",
+    "PromptCacheReuse": "Percent",
+    "PrefixCacheHit": "Count",
+    "ResponseCacheHit": "Count",
+    "DeadlineTruncated": "Count",
+    "BatchSize": "Count",
+    "RemainingTime": "Milliseconds",
+    "Headroom": "Percent",
+    "ServerRestart": "Count",
+    "RequestRetry": "Count",
+}
+
+
+def completion_metrics(results):
+    """Throughput, overhead and cache metrics summed over completion results."""
+    prompt_tokens = generated = cached = evaluated = 0
+    prompt_ms = predicted_ms = request_ms = 0.0
+    prefix_hits = response_hits = truncated = restarts = retries = 0
+    for result in results:
+        recovery = result.get("supervisor") or {}
+        restarts += int(bool(recovery.get("restarted")))
+        retries += int(bool(recovery.get("retried")))
+        if "error" in result:
+            continue
+        cache = result.get("cache") or {}
+        if cache.get("hit"):
+            response_hits += 1
+            continue
+        truncated += int(bool((result.get("deadline") or {}).get("truncated")))
+        timings = result.get("timings") or {}
+        prompt_tokens += timings.get("prompt_n") or 0
+        generated += timings.get("predicted_n") or 0
+        prompt_ms += timings.get("prompt_ms") or 0
+        predicted_ms += timings.get("predicted_ms") or 0
+        request_ms += result.get("request_ms") or 0
+        cached += result.get("tokens_cached") or 0
+        evaluated += result.get("tokens_evaluated") or timings.get("prompt_n") or 0
+        if (result.get("prefix_cache") or {}).get("state") in ("resident", "restored"):
+            prefix_hits += 1
+
+    metrics = {
+        "PromptTokens": prompt_tokens,
+        "GeneratedTokens": generated,
+        "TokensCached": cached,
+        "PrefixCacheHit": prefix_hits,
+        "ResponseCacheHit": response_hits,
+        "DeadlineTruncated": truncated,
+        "ServerRestart": restarts,
+        "RequestRetry": retries,
+        "ServerCompute": round(prompt_ms + predicted_ms, 3),
+    }
+    if prompt_ms > 0:
+        metrics["PromptTokensPerSecond"] = round(prompt_tokens * 1000 / prompt_ms, 3)
+    if predicted_ms > 0:
+        metrics["GenerationTokensPerSecond"] = round(generated * 1000 / predicted_ms, 3)
+    if evaluated > 0:
+        metrics["PromptCacheReuse"] = round(cached * 100 / evaluated, 3)
+    if request_ms > 0:
+        # Everything the request spent outside llama-server's own compute:
+        # queueing for a slot, HTTP, JSON encoding and decoding
+        metrics["Overhead"] = round(max(request_ms - prompt_ms - predicted_ms, 0), 3)
+    return metrics
+
+
+def emit(metrics, dimensions, properties=None, stream=None):
+    """Print one EMF log line for ``metrics`` with the given dimension values."""
+    record = {
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [{
+                "Namespace": NAMESPACE,
+                "Dimensions": [list(dimensions)],
+                "Metrics": [{"Name": name, "Unit": METRIC_UNITS.get(name, "None")}
+                            for name in metrics]
+            }]
+        }
+    }
+    record.update(dimensions)
+    record.update(properties or {})
+    record.update(metrics)
+    print(json.dumps(record), file=stream or sys.stdout, flush=True)
+    return record
+
+
+class InvocationMetrics:
+    """Collects the metrics of one handler invocation and emits them as EMF."""
+
+    def __init__(self, context, cold_start, enabled=True):
+        self.context = context
+        self.cold_start = cold_start
+        self.enabled = enabled
+        self.started = time.perf_counter()
+        self.remaining_at_start = self._remaining()
+        self.startup_wait_ms = 0.0
+        # Set by the handler once it knows what it served
+        self.kind = "completion"
+        self.results = []
+
+    def _remaining(self):
+        if self.context is None or not hasattr(self.context, "get_remaining_time_in_millis"):
+            return None
+        return self.context.get_remaining_time_in_millis()
+
+    def finish(self, status_code):
+        """Emit the invocation's metrics; returns the EMF record, or None when disabled."""
+        if not self.enabled:
+            return None
+        metrics = {
+            "ColdStart": int(self.cold_start),
+            "Error": int(status_code >= 500),
+            "HandlerDuration": round((time.perf_counter() - self.started) * 1000, 3),
+            "StartupWait": round(self.startup_wait_ms, 3),
+        }
+        metrics.update(completion_metrics(self.results))
+        if self.kind == "batch":
+            metrics["BatchSize"] = len(self.results)
+        remaining = self._remaining()
+        if remaining is not None:
+            metrics["RemainingTime"] = remaining
+            if self.remaining_at_start:
+                metrics["Headroom"] = round(remaining * 100 / self.remaining_at_start, 3)
+
+        dimensions = {
+            "FunctionName": getattr(self.context, "function_name", None)
+            or os.environ.get("AWS_LAMBDA_FUNCTION_NAME", "local"),
+            "StartType": "cold" if self.cold_start else "warm",
+        }
+        properties = {
+            "RequestId": getattr(self.context, "aws_request_id", None),
+            "RequestKind": self.kind,
+            "StatusCode": status_code,
+        }
+        return emit(metrics, dimensions, properties)
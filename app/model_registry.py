@@ -0,0 +1,181 @@
+"""
+Registry of the model variants this project can ship.
+
+One entry per GGUF quantization layout of BitNet b1.58 2B-4T. The download
+(``cdk/download_model.py``), image build (``Dockerfile.lambda``), runtime
+(``MODEL_VARIANT``) and benchmarks all resolve files through it, so adding a
+layout means adding an entry here.
+
+- ``i2_s`` is Microsoft's published GGUF and runs on x86 and ARM. Its kernels
+  do not depend on the TL1 tiles.
+- ``tl1`` is the ARM lookup-table layout. Hugging Face does not publish it, so
+  it is converted locally from the bf16 checkpoint with BitNet's converter.
+  It needs TL1 kernels generated for the 2B-4T shapes (``tl1_params.json``
+  with model ``bitnet_b1_58-2B-4T``, see ``bench/tune_tl1.py``).
+
+``size_bytes`` and ``sha256`` pin the exact file: the download and the
+stage step both check them when they are set. A published GGUF without a
+pinned digest cannot be downloaded unless one is given explicitly
+(``MODEL_SHA256``, the LFS SHA-256 shown on its Hugging Face file page). A
+locally converted one stays unpinned.
+
+Usage (from the image build):
+    python model_registry.py stage --variant tl1 --source temp/models --dest /app/BitNet/models
+    python model_registry.py path --variant i2_s
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+
+DEFAULT_VARIANT = "i2_s"
+MODELS_DIR = "/app/models"
+MODEL_DIRECTORY = "BitNet-b1.58-2B-4T"
+
+VARIANTS = {
+    "i2_s": {
+        "description": "2-bit packed ternary weights, portable kernels",
+        "directory": MODEL_DIRECTORY,
+        "filename": "ggml-model-i2_s.gguf",
+        "source": "download",
+        "repo_id": "microsoft/bitnet-b1.58-2B-4T-gguf",
+        "architectures": ["x86_64", "arm64"],
+        "kernels": "i2_s",
+        # Not pinned in the tree: download_model.py refuses to fetch it without
+        # MODEL_SHA256 (or --sha256) and verifies the download against it
+        "size_bytes": None,
+        "sha256": None
+    },
+    "tl1": {
+        "description": "ARM lookup-table kernels (BITNET_ARM_TL1)",
+        "directory": MODEL_DIRECTORY,
+        "filename": "ggml-model-tl1.gguf",
+        "source": "convert",
+        "repo_id": "microsoft/bitnet-b1.58-2B-4T-bf16",
+        # Run inside the BitNet checkout; {model_dir} holds the bf16 checkpoint
+        "convert": ["utils/convert-hf-to-gguf-bitnet.py", "{model_dir}", "--outtype", "tl1"],
+        "architectures": ["arm64"],
+        "kernels": "tl1",
+        "tl1_model": "bitnet_b1_58-2B-4T",
+        # Converted locally, so the bytes depend on the BitNet converter version
+        # and there is no published checksum to pin
+        "size_bytes": None,
+        "sha256": None
+    }
+}
+
+
+def get_variant(name):
+    """Registry entry for ``name``, with its name filled in."""
+    if name not in VARIANTS:
+        raise ValueError(f"Unknown model variant {name!r}; choose from {', '.join(sorted(VARIANTS))}")
+    return dict(VARIANTS[name], name=name)
+
+
+def relative_path(name):
+    variant = get_variant(name)
+    return os.path.join(variant["directory"], variant["filename"])
+
+
+def model_path(name, models_dir=MODELS_DIR):
+    """Where ``name`` lives under ``models_dir`` (in the image, /app/models)."""
+    return os.path.join(models_dir, relative_path(name))
+
+
+def sha256_file(path, chunk_bytes=8 * 1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_bytes), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def expected_sha256(name, given=None):
+    """The digest ``name`` must have: the registry's, else ``given``.
+
+    Raises ValueError when both are set and differ, or when a published
+    variant has neither, since its download could then not be verified.
+    """
+    variant = get_variant(name)
+    given = given.lower() if given else None
+    if variant["sha256"] and given and given != variant["sha256"]:
+        raise ValueError(f"Given sha256 {given} differs from the registry's {variant['sha256']} for {name}")
+    expected = variant["sha256"] or given
+    if expected is None and variant["source"] == "download":
+        raise ValueError(f"No sha256 pinned for {name}; set MODEL_SHA256 to the SHA-256 shown on "
+                         f"https://huggingface.co/{variant['repo_id']}/blob/main/{variant['filename']}")
+    return expected
+
+
+def verify(name, path, sha256=None):
+    """Check ``path`` against the recorded size and checksum; returns its sha256.
+
+    ``sha256`` is checked when the registry has no digest. Raises ValueError
+    on a mismatch. Unrecorded fields are not checked.
+    """
+    variant = get_variant(name)
+    size = os.path.getsize(path)
+    if variant["size_bytes"] is not None and size != variant["size_bytes"]:
+        raise ValueError(f"{path} is {size} bytes, expected {variant['size_bytes']} for {name}")
+    expected = variant["sha256"] or sha256
+    checksum = sha256_file(path)
+    if expected is not None and checksum != expected:
+        raise ValueError(f"{path} has sha256 {checksum}, expected {expected} for {name}")
+    return checksum
+
+
+def check_kernels(name, tl1_params_path):
+    """Raise ValueError when a TL1 variant would be built with kernels for other shapes."""
+    variant = get_variant(name)
+    if variant["kernels"] != "tl1":
+        return
+    with open(tl1_params_path) as f:
+        params = json.load(f)
+    if params.get("model") != variant["tl1_model"]:
+        raise ValueError(f"Variant {name} needs TL1 kernels for {variant['tl1_model']}, but "
+                         f"{tl1_params_path} is for {params.get('model')}; run bench/tune_tl1.py first")
+
+
+def stage(name, source_dir, dest_dir):
+    """Verify the variant's file under ``source_dir`` and move it to the same place under ``dest_dir``."""
+    source = os.path.join(source_dir, relative_path(name))
+    if not os.path.exists(source):
+        raise ValueError(f"{source} not found; run cdk/download_model.py --variant {name}")
+    checksum = verify(name, source)
+    dest = os.path.join(dest_dir, relative_path(name))
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    shutil.move(source, dest)
+    print(f"Staged {name}: {dest} ({os.path.getsize(dest) / 1024 / 1024:.1f} MiB, sha256 {checksum})")
+    return dest
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=("path", "stage", "show"))
+    parser.add_argument("--variant", default=os.environ.get("MODEL_VARIANT", DEFAULT_VARIANT))
+    parser.add_argument("--models-dir", default=MODELS_DIR, help="models root for path")
+    parser.add_argument("--source", help="models root to stage from")
+    parser.add_argument("--dest", help="models root to stage into")
+    parser.add_argument("--tl1-params", default=None, help="check TL1 kernels match the variant when staging")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "path":
+            print(model_path(args.variant, args.models_dir))
+        elif args.command == "show":
+            print(json.dumps(get_variant(args.variant), indent=2))
+        else:
+            if args.tl1_params:
+                check_kernels(args.variant, args.tl1_params)
+            stage(args.variant, args.source, args.dest)
+    except ValueError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,281 @@
+/*
+ * Flat C interface over llama.cpp for the in-process engine (app/engine.py).
+ *
+ * ctypes cannot safely mirror llama.cpp's structs, which change between
+ * versions and are passed by value, so this shim takes and returns only
+ * scalars, pointers and token arrays. The compiler checks it against the
+ * llama.h the library was built from. Sampling (repeat penalty,
+ * temperature, top-k, top-p, min-p) is done here over the raw logits, so it
+ * does not depend on which sampling API the llama.cpp fork has.
+ *
+ * Built by Dockerfile.lambda, linked against the static libllama/libggml:
+ *   clang -O2 -shared -fPIC bitnet_engine.c -I<llama>/include -I<llama>/ggml/include \
+ *       libllama.a libggml.a -lstdc++ -lm -lpthread -o libbitnet_engine.so
+ */
+
+#include <math.h>
+#include <stdint.h>
+#include <stdlib.h>
+#include <string.h>
+
+#include "llama.h"
+
+typedef void (*be_log_fn)(int level, const char * text);
+
+typedef struct {
+    struct llama_model * model;
+    struct llama_context * ctx;
+    struct llama_batch batch;
+    int32_t n_batch;
+    int32_t n_vocab;
+    /* scratch space for sampling, n_vocab entries */
+    float * logits;
+    int32_t * ids;
+} be_engine;
+
+static be_log_fn be_log_callback = NULL;
+
+static void be_log_forward(enum ggml_log_level level, const char * text, void * user_data) {
+    (void) user_data;
+    if (be_log_callback != NULL) {
+        be_log_callback((int) level, text);
+    }
+}
+
+void be_set_log(be_log_fn fn) {
+    be_log_callback = fn;
+    llama_log_set(be_log_forward, NULL);
+}
+
+void * be_load(const char * path, int32_t n_ctx, int32_t n_batch, int32_t n_threads, int32_t n_threads_batch,
+               int32_t use_mmap, int32_t use_mlock) {
+    llama_backend_init();
+
+    struct llama_model_params model_params = llama_model_default_params();
+    model_params.n_gpu_layers = 0;
+    model_params.use_mmap = use_mmap != 0;
+    model_params.use_mlock = use_mlock != 0;
+
+    struct llama_model * model = llama_load_model_from_file(path, model_params);
+    if (model == NULL) {
+        return NULL;
+    }
+
+    struct llama_context_params ctx_params = llama_context_default_params();
+    ctx_params.n_ctx = (uint32_t) n_ctx;
+    ctx_params.n_batch = (uint32_t) n_batch;
+    ctx_params.n_ubatch = (uint32_t) n_batch;
+    ctx_params.n_threads = n_threads;
+    ctx_params.n_threads_batch = n_threads_batch;
+
+    struct llama_context * ctx = llama_new_context_with_model(model, ctx_params);
+    if (ctx == NULL) {
+        llama_free_model(model);
+        return NULL;
+    }
+
+    be_engine * engine = calloc(1, sizeof(be_engine));
+    engine->model = model;
+    engine->ctx = ctx;
+    engine->n_batch = n_batch;
+    engine->n_vocab = llama_n_vocab(model);
+    engine->batch = llama_batch_init(n_batch, 0, 1);
+    engine->logits = malloc(sizeof(float) * engine->n_vocab);
+    engine->ids = malloc(sizeof(int32_t) * engine->n_vocab);
+    return engine;
+}
+
+void be_free(void * handle) {
+    be_engine * engine = handle;
+    if (engine == NULL) {
+        return;
+    }
+    llama_batch_free(engine->batch);
+    llama_free(engine->ctx);
+    llama_free_model(engine->model);
+    free(engine->logits);
+    free(engine->ids);
+    free(engine);
+}
+
+int32_t be_n_ctx(void * handle) {
+    return (int32_t) llama_n_ctx(((be_engine *) handle)->ctx);
+}
+
+int32_t be_n_vocab(void * handle) {
+    return ((be_engine *) handle)->n_vocab;
+}
+
+/* Returns the token count, or minus the required size when max_tokens is too small. */
+int32_t be_tokenize(void * handle, const char * text, int32_t text_len, int32_t * tokens, int32_t max_tokens,
+                    int32_t add_special) {
+    be_engine * engine = handle;
+    return llama_tokenize(engine->model, text, text_len, tokens, max_tokens, add_special != 0, false);
+}
+
+int32_t be_token_to_piece(void * handle, int32_t token, char * buf, int32_t length) {
+    be_engine * engine = handle;
+    return llama_token_to_piece(engine->model, token, buf, length, 0, false);
+}
+
+int32_t be_is_eog(void * handle, int32_t token) {
+    be_engine * engine = handle;
+    return llama_token_is_eog(engine->model, token) ? 1 : 0;
+}
+
+/* Drop every cached position from n_keep on. */
+int32_t be_kv_trim(void * handle, int32_t n_keep) {
+    be_engine * engine = handle;
+    return llama_kv_cache_seq_rm(engine->ctx, 0, n_keep, -1) ? 0 : 1;
+}
+
+/*
+ * Evaluate tokens at positions n_past.. in batches of n_batch. Logits are kept
+ * for the last token only, or for every token of the final batch when
+ * all_logits is set (used to verify draft tokens). Returns 0 on success.
+ */
+int32_t be_decode(void * handle, const int32_t * tokens, int32_t n_tokens, int32_t n_past, int32_t all_logits) {
+    be_engine * engine = handle;
+    for (int32_t start = 0; start < n_tokens; start += engine->n_batch) {
+        int32_t n = n_tokens - start < engine->n_batch ? n_tokens - start : engine->n_batch;
+        int32_t last_batch = start + n == n_tokens;
+        engine->batch.n_tokens = n;
+        for (int32_t i = 0; i < n; i++) {
+            engine->batch.token[i] = tokens[start + i];
+            engine->batch.pos[i] = n_past + start + i;
+            engine->batch.n_seq_id[i] = 1;
+            engine->batch.seq_id[i][0] = 0;
+            engine->batch.logits[i] = last_batch && (all_logits || i == n - 1);
+        }
+        int32_t status = llama_decode(engine->ctx, engine->batch);
+        if (status != 0) {
+            return status;
+        }
+    }
+    return 0;
+}
+
+static uint64_t be_next_random(uint64_t * state) {
+    /* xorshift64* */
+    uint64_t x = *state ? *state : 0x9E3779B97F4A7C15ULL;
+    x ^= x >> 12;
+    x ^= x << 25;
+    x ^= x >> 27;
+    *state = x;
+    return x * 0x2545F4914F6CDD1DULL;
+}
+
+static void be_sift_down(const float * logits, int32_t * heap, int32_t size, int32_t i) {
+    /* min-heap on logits, so the root is the weakest of the current top-k */
+    for (;;) {
+        int32_t smallest = i;
+        int32_t left = 2 * i + 1;
+        int32_t right = left + 1;
+        if (left < size && logits[heap[left]] < logits[heap[smallest]]) smallest = left;
+        if (right < size && logits[heap[right]] < logits[heap[smallest]]) smallest = right;
+        if (smallest == i) return;
+        int32_t tmp = heap[i];
+        heap[i] = heap[smallest];
+        heap[smallest] = tmp;
+        i = smallest;
+    }
+}
+
+static const float * be_sort_logits;
+
+static int be_compare_desc(const void * a, const void * b) {
+    float la = be_sort_logits[*(const int32_t *) a];
+    float lb = be_sort_logits[*(const int32_t *) b];
+    return (la < lb) - (la > lb);
+}
+
+/*
+ * Sample the next token from the logits of batch position idx (-1 for the
+ * last evaluated token). Non-positive temperature means greedy.
+ */
+int32_t be_sample(void * handle, int32_t idx, float temperature, int32_t top_k, float top_p, float min_p,
+                  float repeat_penalty, const int32_t * last_tokens, int32_t n_last, uint64_t * rng_state) {
+    be_engine * engine = handle;
+    const int32_t n_vocab = engine->n_vocab;
+    float * logits = engine->logits;
+    int32_t * ids = engine->ids;
+
+    const float * raw = llama_get_logits_ith(engine->ctx, idx);
+    if (raw == NULL) {
+        return -1;
+    }
+    memcpy(logits, raw, sizeof(float) * n_vocab);
+
+    if (repeat_penalty != 1.0f) {
+        for (int32_t i = 0; i < n_last; i++) {
+            int32_t token = last_tokens[i];
+            if (token >= 0 && token < n_vocab) {
+                logits[token] = logits[token] > 0 ? logits[token] / repeat_penalty : logits[token] * repeat_penalty;
+            }
+        }
+    }
+
+    if (temperature <= 0.0f) {
+        int32_t best = 0;
+        for (int32_t i = 1; i < n_vocab; i++) {
+            if (logits[i] > logits[best]) best = i;
+        }
+        return best;
+    }
+
+    /* Candidates, strongest first: a k-sized heap for top-k, else a full sort */
+    int32_t n = 0;
+    if (top_k > 0 && top_k < n_vocab) {
+        for (int32_t i = 0; i < n_vocab; i++) {
+            if (n < top_k) {
+                ids[n++] = i;
+                if (n == top_k) {
+                    for (int32_t j = n / 2 - 1; j >= 0; j--) be_sift_down(logits, ids, n, j);
+                }
+            } else if (logits[i] > logits[ids[0]]) {
+                ids[0] = i;
+                be_sift_down(logits, ids, n, 0);
+            }
+        }
+    } else {
+        for (int32_t i = 0; i < n_vocab; i++) ids[i] = i;
+        n = n_vocab;
+    }
+    be_sort_logits = logits;
+    qsort(ids, n, sizeof(int32_t), be_compare_desc);
+
+    /* Softmax with temperature, reusing logits[] for the probabilities */
+    float max_logit = logits[ids[0]];
+    double sum = 0.0;
+    for (int32_t i = 0; i < n; i++) {
+        float p = expf((logits[ids[i]] - max_logit) / temperature);
+        logits[ids[i]] = p;
+        sum += p;
+    }
+
+    /* top-p and min-p shrink the candidate list */
+    double cumulative = 0.0;
+    int32_t keep = n;
+    float floor_p = min_p > 0.0f ? (float) (min_p * logits[ids[0]] / sum) : 0.0f;
+    for (int32_t i = 0; i < n; i++) {
+        float p = (float) (logits[ids[i]] / sum);
+        if (i > 0 && p < floor_p) {
+            keep = i;
+            break;
+        }
+        cumulative += p;
+        if (top_p < 1.0f && cumulative >= top_p) {
+            keep = i + 1;
+            break;
+        }
+    }
+
+    double kept_sum = 0.0;
+    for (int32_t i = 0; i < keep; i++) kept_sum += logits[ids[i]];
+    double r = (double) (be_next_random(rng_state) >> 11) / (double) (1ULL << 53) * kept_sum;
+    for (int32_t i = 0; i < keep; i++) {
+        r -= logits[ids[i]];
+        if (r <= 0.0) return ids[i];
+    }
+    return ids[keep - 1];
+}
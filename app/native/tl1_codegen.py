@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Generate BitNet's TL1 LUT kernels with tile parameters from a JSON file.
+
+BitNet's ``utils/codegen_tl1.py`` only knows the layer shapes of a few preset
+models, and the 2B-4T model we ship is not one of them. This wrapper runs the
+script with our shapes added to its ``ModelShapeDict``, without editing the
+checkout. ``tl1_params.json`` holds the model name and one BM/BK/bm per
+shape; ``bench/tune_tl1.py`` writes it, and ``Dockerfile.lambda`` reads it.
+
+Usage:
+    python app/native/tl1_codegen.py --bitnet-dir temp/BitNet --params app/native/tl1_params.json
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+
+DEFAULT_PARAMS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tl1_params.json")
+
+# (M, K) of every ternary matmul, in codegen_tl1.py's order. 2B-4T: q/o
+# projections, k/v projections (5 KV heads of 128), gate/up, down.
+MODEL_SHAPES = {
+    "bitnet_b1_58-2B-4T": [[2560, 2560], [640, 2560], [6912, 2560], [2560, 6912]],
+}
+
+# Constraints codegen_tl1.py asserts (plus BM being whole SIMD blocks)
+SIMD_BLOCKS = (32, 64)
+
+
+def validate(shapes, BM, BK, bm):
+    """Raise ValueError unless the tiles fit ``shapes`` the way codegen_tl1.py requires."""
+    if not len(shapes) == len(BM) == len(BK) == len(bm):
+        raise ValueError(f"Need one BM/BK/bm per shape ({len(shapes)}), got {len(BM)}/{len(BK)}/{len(bm)}")
+    for (M, K), block_m, block_k, simd in zip(shapes, BM, BK, bm):
+        if simd not in SIMD_BLOCKS:
+            raise ValueError(f"bm must be one of {SIMD_BLOCKS}, got {simd}")
+        if M % block_m or block_m % simd:
+            raise ValueError(f"BM {block_m} must divide M {M} and be a multiple of bm {simd}")
+        if K % block_k:
+            raise ValueError(f"BK {block_k} must divide K {K}")
+
+
+def model_shapes(model, source):
+    """Shapes for ``model``: ours, or the preset parsed from codegen_tl1.py's source."""
+    if model in MODEL_SHAPES:
+        return MODEL_SHAPES[model]
+    match = re.search(r'"%s"\s*:\s*(\[[\d\s,\[\]]*\])' % re.escape(model), source)
+    if match is None:
+        raise ValueError(f"Unknown TL1 model {model}")
+    return json.loads(match.group(1))
+
+
+def load_params(path=DEFAULT_PARAMS):
+    with open(path) as f:
+        return json.load(f)
+
+
+def run_codegen(bitnet_dir, model, BM, BK, bm):
+    """Run ``utils/codegen_tl1.py`` in-process, writing BitNet's include/ headers."""
+    script = os.path.join(os.path.abspath(bitnet_dir), "utils", "codegen_tl1.py")
+    with open(script) as f:
+        source = f.read()
+    validate(model_shapes(model, source), BM, BK, bm)
+
+    if model in MODEL_SHAPES and f'"{model}"' not in source:
+        anchor = re.search(r"ModelShapeDict\s*=\s*\{", source)
+        if anchor is None:
+            raise Exception(f"No ModelShapeDict in {script}; cannot add {model}")
+        entry = f"\n        {json.dumps(model)}: {json.dumps(MODEL_SHAPES[model])},"
+        source = source[:anchor.end()] + entry + source[anchor.end():]
+
+    argv = sys.argv
+    sys.argv = [script, "--model", model, "--BM", ",".join(map(str, BM)),
+                "--BK", ",".join(map(str, BK)), "--bm", ",".join(map(str, bm))]
+    try:
+        # __file__ must point at the real script: it writes ../include relative to it
+        exec(compile(source, script, "exec"), {"__name__": "__main__", "__file__": script})
+    finally:
+        sys.argv = argv
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bitnet-dir", default=".", help="BitNet checkout")
+    parser.add_argument("--params", default=DEFAULT_PARAMS, help="tile parameters JSON")
+    args = parser.parse_args()
+
+    params = load_params(args.params)
+    print(f"TL1 kernels for {params['model']}: BM={params['BM']} BK={params['BK']} bm={params['bm']}"
+          f" ({'tuned' if params.get('tuned') else 'preset'})")
+    run_codegen(args.bitnet_dir, params["model"], params["BM"], params["BK"], params["bm"])
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
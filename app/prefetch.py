@@ -0,0 +1,156 @@
+"""
+Model file prefetch into the page cache.
+
+Lambda lazily fetches container image blocks, and llama-server's mmap then
+faults the weights in page by page from a single thread. Prefetching reads
+the GGUF into the page cache from several threads while llama-server is
+still spawning, so its page faults mostly hit memory.
+
+Modes:
+- ``read``: parallel ``preadv`` of fixed-size chunks; forces the fetch and
+  works on any filesystem
+- ``fadvise``: ``POSIX_FADV_WILLNEED``, which asks the kernel to read ahead
+  asynchronously and returns at once
+- ``off``: no prefetch
+"""
+
+import ctypes
+import logging
+import mmap
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger()
+
+PREFETCH_MODES = ("read", "fadvise", "off")
+
+
+def read_file(path, workers=4, chunk_bytes=8 * 1024 * 1024):
+    """Read ``path`` in ``chunk_bytes`` chunks from ``workers`` threads; returns bytes read."""
+    size = os.path.getsize(path)
+    chunk_bytes = max(1, min(chunk_bytes, size))
+    workers = max(1, min(workers, -(-size // chunk_bytes)))
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        offsets = iter(range(0, size, chunk_bytes))
+        lock = threading.Lock()
+
+        def worker():
+            # One reusable buffer per thread; preadv releases the GIL
+            buffer = bytearray(chunk_bytes)
+            total = 0
+            while True:
+                with lock:
+                    offset = next(offsets, None)
+                if offset is None:
+                    return total
+                total += os.preadv(fd, [buffer], offset)
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(worker) for _ in range(workers)]
+            return sum(future.result() for future in futures)
+    finally:
+        os.close(fd)
+
+
+def advise_file(path, advice):
+    """Apply ``posix_fadvise`` to the whole of ``path``."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.posix_fadvise(fd, 0, 0, advice)
+    finally:
+        os.close(fd)
+
+
+def evict_file(path):
+    """Drop ``path``'s clean pages from the page cache (for cold-load benchmarks)."""
+    advise_file(path, os.POSIX_FADV_DONTNEED)
+
+
+def resident_fraction(path):
+    """Fraction of ``path``'s pages in the page cache, from ``mincore``; None where unsupported."""
+    size = os.path.getsize(path)
+    if size == 0:
+        return 1.0
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        libc.mmap.restype = ctypes.c_void_p
+        libc.mmap.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_int, ctypes.c_int, ctypes.c_int,
+                              ctypes.c_long]
+        libc.munmap.argtypes = [ctypes.c_void_p, ctypes.c_size_t]
+        libc.mincore.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_void_p]
+    except (OSError, AttributeError):
+        return None
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        # Mapping does not fault anything in; mincore only reports residency
+        address = libc.mmap(None, size, mmap.PROT_READ, mmap.MAP_SHARED, fd, 0)
+        if address in (None, ctypes.c_void_p(-1).value):
+            return None
+        try:
+            pages = -(-size // mmap.PAGESIZE)
+            vector = (ctypes.c_ubyte * pages)()
+            if libc.mincore(address, size, vector) != 0:
+                return None
+            # Only the low bit is defined; the rest are reserved and zero
+            return (pages - bytes(vector).count(0)) / pages
+        finally:
+            libc.munmap(address, size)
+    finally:
+        os.close(fd)
+
+
+class ModelPrefetch:
+    """Prefetch of one model file, run in a background thread."""
+
+    def __init__(self, path, mode="read", workers=4, chunk_bytes=8 * 1024 * 1024):
+        self.path = path
+        self.mode = mode if mode in PREFETCH_MODES else "read"
+        self.workers = workers
+        self.chunk_bytes = chunk_bytes
+        self.bytes = 0
+        self.elapsed_ms = None
+        self.error = None
+        self._thread = None
+
+    def start(self):
+        if self.mode == "off":
+            return self
+        self._thread = threading.Thread(target=self._run, name="model-prefetch", daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        started = time.perf_counter()
+        try:
+            if self.mode == "fadvise":
+                advise_file(self.path, os.POSIX_FADV_WILLNEED)
+            else:
+                self.bytes = read_file(self.path, workers=self.workers, chunk_bytes=self.chunk_bytes)
+        except Exception as e:
+            self.error = str(e)
+            logger.warning(f"Model prefetch ({self.mode}) failed: {self.error}")
+        self.elapsed_ms = round((time.perf_counter() - started) * 1000, 2)
+        if self.error is None:
+            logger.info(f"Model prefetch ({self.mode}) of {self.bytes / 1024 / 1024:.0f} MiB "
+                        f"took {self.elapsed_ms:.0f} ms")
+
+    def wait(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return self
+
+    def report(self):
+        report = {"mode": self.mode}
+        if self.mode != "off":
+            report.update({
+                "workers": self.workers,
+                "bytes": self.bytes,
+                "ms": self.elapsed_ms,
+                "done": self._thread is not None and not self._thread.is_alive()
+            })
+            if self.error is not None:
+                report["error"] = self.error
+        return report
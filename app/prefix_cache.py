@@ -0,0 +1,268 @@
+"""
+Prompt-prefix KV cache for llama-server.
+
+Registered prefixes (typically a shared system prompt and chat scaffolding)
+are kept evaluated in llama-server slots, and each prefix's KV state is
+snapshotted to disk with llama-server's slot save/restore API. A request that
+starts with a registered prefix leases an idle slot and is pinned to it with
+``cache_prompt`` set, so only the suffix is evaluated. A slot already holding
+the prefix is preferred; otherwise the snapshot is restored into the leased
+slot, so concurrent requests sharing a prefix (a batch with one system
+prompt) each get a slot of their own. With every slot leased, a request is
+left to llama-server's slot choice.
+
+Snapshots live in ``snapshot_dir`` (passed to llama-server as
+``--slot-save-path``), which is bounded by ``max_bytes`` with least recently
+used eviction. ``/tmp`` does not survive a container recycle, so snapshots
+found in ``seed_dir`` (for example baked into the image) are copied in at
+startup.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger()
+
+
+class PrefixEntry:
+    """A registered prompt prefix and the state of its snapshot."""
+
+    def __init__(self, key, text, slot):
+        self.key = key
+        self.text = text
+        # Preferred slot when it is idle, so warm-up spreads prefixes over the slots
+        self.slot = slot
+        self.snapshot_bytes = 0
+        self.last_used = 0.0
+        # Held while the prefix is evaluated and snapshotted, so it is evaluated once
+        self.lock = threading.Lock()
+
+    @property
+    def filename(self):
+        return f"prefix-{self.key}.bin"
+
+
+class PrefixCache:
+    """Keeps registered prompt prefixes warm in llama-server slots."""
+
+    def __init__(self, transport, n_slots=1, snapshot_dir="/tmp/bitnet-slots", seed_dir=None,
+                 max_bytes=256 * 1024 * 1024, max_prefixes=16, namespace=""):
+        self.transport = transport
+        self.n_slots = max(1, n_slots)
+        self.snapshot_dir = snapshot_dir
+        self.seed_dir = seed_dir
+        self.max_bytes = max_bytes
+        self.max_prefixes = max_prefixes
+        # Mixed into every key so snapshots from another model or context size never match
+        self.namespace = namespace
+        self.entries = OrderedDict()
+        # slot id -> key of the prefix whose KV state is resident in that slot
+        self._resident = {}
+        # Guards the registry and ``_resident`` only; never held across HTTP calls
+        self._lock = threading.Lock()
+        # Slots leased to a request, and when each slot was last released
+        self._leased = set()
+        self._released_at = {}
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+
+    def _key(self, text):
+        return hashlib.sha256(f"{self.namespace}\0{text}".encode("utf-8")).hexdigest()[:20]
+
+    def register(self, text):
+        """Register a prompt prefix and return its entry."""
+        key = self._key(text)
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                while len(self.entries) >= self.max_prefixes:
+                    _, evicted = self.entries.popitem(last=False)
+                    self._drop_snapshot(evicted)
+                    logger.info(f"Prefix cache: unregistered {evicted.key} to stay within {self.max_prefixes} prefixes")
+                # Spread prefixes over the slots round-robin
+                entry = PrefixEntry(key, text, len(self.entries) % self.n_slots)
+                self.entries[key] = entry
+                self._seed(entry)
+            entry.last_used = time.time()
+            return entry
+
+    def register_from_file(self, path):
+        """Register every prefix in a JSON file holding a list of strings."""
+        with open(path) as f:
+            prefixes = json.load(f)
+        for text in prefixes:
+            self.register(text)
+        logger.info(f"Prefix cache: registered {len(prefixes)} prefixes from {path}")
+
+    def match(self, prompt):
+        """Return the longest registered prefix of ``prompt``, or None."""
+        best = None
+        for entry in self.entries.values():
+            if prompt.startswith(entry.text) and (best is None or len(entry.text) > len(best.text)):
+                best = entry
+        return best
+
+    def acquire(self, entry):
+        """Lease an idle slot and make ``entry``'s KV state resident in it.
+
+        Returns ``(slot, state)``, where ``state`` is how the slot got the
+        prefix: ``resident`` (already there), ``restored`` (loaded from a
+        snapshot) or ``evaluated`` (computed and then snapshotted). With
+        every slot leased it returns ``(-1, "busy")`` and no lease. A lease
+        ends with ``release``. The cache lock is not held while llama-server
+        works, so a cold prefix does not hold up other requests.
+        """
+        with self._lock:
+            entry.last_used = time.time()
+            if entry.key in self.entries:
+                self.entries.move_to_end(entry.key)
+            slot = self._pick_slot(entry)
+            if slot is None:
+                return -1, "busy"
+            self._leased.add(slot)
+            if self._resident.get(slot) == entry.key:
+                return slot, "resident"
+            # Whatever the slot held is about to be replaced
+            self._resident.pop(slot, None)
+        try:
+            state = self._load(entry, slot)
+        except Exception:
+            self.release(slot)
+            raise
+        self._set_resident(slot, entry)
+        return slot, state
+
+    def release(self, slot):
+        """End the lease on ``slot`` taken by ``acquire``."""
+        if slot is None or slot < 0:
+            return
+        with self._lock:
+            self._leased.discard(slot)
+            self._released_at[slot] = time.time()
+
+    def _pick_slot(self, entry):
+        """An idle slot for ``entry``: one holding it, an empty one, or the least recently used."""
+        idle = [slot for slot in range(self.n_slots) if slot not in self._leased]
+        if not idle:
+            return None
+        for slot in idle:
+            if self._resident.get(slot) == entry.key:
+                return slot
+        empty = [slot for slot in idle if slot not in self._resident]
+        if empty:
+            return entry.slot if entry.slot in empty else empty[0]
+        return min(idle, key=lambda slot: self._released_at.get(slot, 0.0))
+
+    def _load(self, entry, slot):
+        """Bring ``entry`` into the leased ``slot``; returns ``restored`` or ``evaluated``."""
+        if self._restore(entry, slot):
+            return "restored"
+        with entry.lock:
+            # Another request may have evaluated and snapshotted it meanwhile
+            if self._restore(entry, slot):
+                return "restored"
+            response = self.transport.post("/completion", {
+                "prompt": entry.text,
+                "n_predict": 0,
+                "id_slot": slot,
+                "cache_prompt": True
+            }, timeout=600)
+            if response.status_code != 200:
+                raise Exception(f"Prefix evaluation returned status {response.status_code}: {response.text}")
+            self._save(entry, slot)
+            return "evaluated"
+
+    def _restore(self, entry, slot):
+        if not os.path.exists(os.path.join(self.snapshot_dir, entry.filename)):
+            return False
+        response = self.transport.post(f"/slots/{slot}?action=restore",
+                                       {"filename": entry.filename}, timeout=120)
+        if response.status_code == 200:
+            return True
+        logger.warning(f"Prefix cache: restore of {entry.key} into slot {slot} failed "
+                       f"({response.status_code}: {response.text})")
+        return False
+
+    def note_slot_used(self, slot, entry=None):
+        """Record which prefix (if any) a finished request left in ``slot``."""
+        if slot is None:
+            return
+        self._set_resident(slot, entry)
+
+    def _set_resident(self, slot, entry):
+        with self._lock:
+            if entry is None:
+                self._resident.pop(slot, None)
+            else:
+                self._resident[slot] = entry.key
+
+    def forget_resident(self):
+        """Forget slot contents, e.g. after the server process restarts."""
+        with self._lock:
+            self._resident.clear()
+
+    def warm(self):
+        """Make the most recently used prefixes resident, one per slot; returns slot -> (key, state)."""
+        warmed = {}
+        for entry in list(reversed(self.entries.values()))[:self.n_slots]:
+            slot, state = self.acquire(entry)
+            self.release(slot)
+            if slot >= 0:
+                warmed[slot] = (entry.key, state)
+        return warmed
+
+    def stats(self):
+        return {
+            "prefixes": len(self.entries),
+            "snapshot_bytes": sum(e.snapshot_bytes for e in self.entries.values()),
+            "resident": dict(self._resident),
+            "leased": sorted(self._leased)
+        }
+
+    def _save(self, entry, slot):
+        response = self.transport.post(f"/slots/{slot}?action=save",
+                                       {"filename": entry.filename}, timeout=120)
+        if response.status_code != 200:
+            logger.warning(f"Prefix cache: snapshot of {entry.key} failed ({response.status_code}: {response.text})")
+            return
+        try:
+            size = os.path.getsize(os.path.join(self.snapshot_dir, entry.filename))
+        except OSError:
+            size = 0
+        with self._lock:
+            entry.snapshot_bytes = size
+            self._evict(keep=entry)
+
+    def _seed(self, entry):
+        if not self.seed_dir:
+            return
+        source = os.path.join(self.seed_dir, entry.filename)
+        target = os.path.join(self.snapshot_dir, entry.filename)
+        if os.path.exists(source) and not os.path.exists(target):
+            shutil.copyfile(source, target)
+            entry.snapshot_bytes = os.path.getsize(target)
+            logger.info(f"Prefix cache: seeded snapshot {entry.filename} from {self.seed_dir}")
+
+    def _drop_snapshot(self, entry):
+        try:
+            os.remove(os.path.join(self.snapshot_dir, entry.filename))
+        except FileNotFoundError:
+            pass
+        entry.snapshot_bytes = 0
+
+    def _evict(self, keep):
+        """Delete least recently used snapshots until under ``max_bytes``."""
+        total = sum(e.snapshot_bytes for e in self.entries.values())
+        for entry in sorted(self.entries.values(), key=lambda e: e.last_used):
+            if total <= self.max_bytes:
+                break
+            if entry is keep or not entry.snapshot_bytes:
+                continue
+            total -= entry.snapshot_bytes
+            self._drop_snapshot(entry)
+            logger.info(f"Prefix cache: evicted snapshot {entry.key} to stay within {self.max_bytes} bytes")
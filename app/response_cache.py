@@ -0,0 +1,148 @@
+"""
+Completion result cache for deterministic requests.
+
+Results are keyed by a hash of the prompt, ``n_predict`` and sampling
+parameters, and only cached when the request is deterministic (temperature 0
+or a fixed seed). Lookups go through an in-memory LRU first and then a disk
+tier under ``/tmp`` that survives server restarts for the lifetime of the
+container. The disk tier is bounded by total bytes, evicting the least
+recently used files.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger()
+
+
+def is_deterministic(sampling):
+    """Whether a request with these sampling parameters always yields the same output."""
+    if sampling.get("temperature") == 0:
+        return True
+    seed = sampling.get("seed")
+    return isinstance(seed, int) and seed >= 0
+
+
+class ResponseCache:
+    """Two-tier (memory, then disk) cache of completion results."""
+
+    def __init__(self, max_entries=256, disk_dir="/tmp/bitnet-response-cache",
+                 max_disk_bytes=64 * 1024 * 1024, namespace=""):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.namespace = namespace
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        # key -> size in bytes of its file on disk, least recently used first
+        self._disk = OrderedDict()
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        if self.disk_dir:
+            self._load_disk_index()
+
+    def key(self, prompt, n_predict, sampling):
+        material = json.dumps({
+            "namespace": self.namespace,
+            "prompt": prompt,
+            "n_predict": n_predict,
+            "sampling": sampling
+        }, sort_keys=True)
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """Return ``(result, tier)`` for a cached key, or ``(None, None)``."""
+        with self._lock:
+            result = self._memory.get(key)
+            if result is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return result, "memory"
+
+            if key in self._disk:
+                path = self._path(key)
+                try:
+                    with open(path) as f:
+                        result = json.load(f)
+                    os.utime(path)
+                except (OSError, ValueError):
+                    self._forget_disk(key)
+                else:
+                    self._disk.move_to_end(key)
+                    self._remember(key, result)
+                    self.hits += 1
+                    return result, "disk"
+
+            self.misses += 1
+            return None, None
+
+    def put(self, key, result):
+        with self._lock:
+            self._remember(key, result)
+            if self.disk_dir:
+                self._write_disk(key, result)
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "memory_entries": len(self._memory),
+            "disk_entries": len(self._disk),
+            "disk_bytes": self._disk_bytes
+        }
+
+    def _remember(self, key, result):
+        self._memory[key] = result
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def _load_disk_index(self):
+        os.makedirs(self.disk_dir, exist_ok=True)
+        files = []
+        for entry in os.scandir(self.disk_dir):
+            if entry.name.endswith(".json"):
+                stat = entry.stat()
+                files.append((stat.st_mtime, entry.name[:-len(".json")], stat.st_size))
+        for _, key, size in sorted(files):
+            self._disk[key] = size
+            self._disk_bytes += size
+
+    def _write_disk(self, key, result):
+        data = json.dumps(result).encode("utf-8")
+        if len(data) > self.max_disk_bytes:
+            return
+        path = self._path(key)
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Response cache: could not write {path}: {str(e)}")
+            return
+        self._forget_disk(key, remove=False)
+        self._disk[key] = len(data)
+        self._disk_bytes += len(data)
+        while self._disk_bytes > self.max_disk_bytes:
+            oldest = next(iter(self._disk))
+            self._forget_disk(oldest)
+
+    def _forget_disk(self, key, remove=True):
+        size = self._disk.pop(key, None)
+        if size is None:
+            return
+        self._disk_bytes -= size
+        if remove:
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,127 @@
+"""
+Response shaping: field projection and body encoding.
+
+A llama-server result carries ``generation_settings``, the echoed prompt and
+other fields most callers never read. Returned as ``json.dumps`` inside the
+Lambda JSON envelope, every byte of it is encoded twice, and every quote in
+the prompt is escaped twice. ``project`` keeps only the requested fields,
+given as names or dotted paths into nested objects (``timings.prompt_n``).
+``encode`` builds the Lambda response in one of these encodings:
+
+- ``json``: the body as a JSON string (the original behaviour)
+- ``object``: the body as a structured value, encoded once by the runtime
+- ``gzip``: gzipped JSON, base64 encoded, once it reaches ``gzip_min_bytes``
+- ``msgpack``: MessagePack, base64 encoded (needs the ``msgpack`` package)
+
+The binary encodings set ``isBase64Encoded`` and ``Content-Type`` and
+``Content-Encoding`` headers, as API Gateway and function URLs expect.
+``bench/bench_response.py`` compares their sizes and costs.
+"""
+
+import base64
+import gzip
+import json
+
+# Content, why it stopped, and enough timings to compute throughput; plus
+# the blocks a caller needs to act on (deadline continuation, session state)
+COMPACT_FIELDS = (
+    "content", "stop_type", "tokens_predicted", "tokens_cached",
+    "timings.prompt_n", "timings.prompt_ms", "timings.predicted_n", "timings.predicted_ms",
+    "deadline", "session"
+)
+# Kept by every projection, so failed batch items stay identifiable
+ALWAYS_FIELDS = ("error", "index")
+ENCODINGS = ("json", "object", "gzip", "msgpack")
+
+
+def parse_fields(value):
+    """Field paths to keep from an event's ``fields``; None keeps everything.
+
+    Accepts ``"all"``, ``"compact"``, or a list or comma-separated string of
+    paths. Raises ValueError otherwise.
+    """
+    if value is None or value == "all":
+        return None
+    if value == "compact":
+        return COMPACT_FIELDS
+    if isinstance(value, str):
+        value = [field.strip() for field in value.split(",")]
+    if not isinstance(value, list) or not all(isinstance(field, str) and field for field in value):
+        raise ValueError('fields must be "all", "compact" or a list of field names')
+    return tuple(value)
+
+
+def parse_encoding(value):
+    """Validate an encoding name; raises ValueError for unknown ones or a missing msgpack."""
+    if value not in ENCODINGS:
+        raise ValueError(f"encoding must be one of {', '.join(ENCODINGS)}")
+    if value == "msgpack":
+        try:
+            import msgpack  # noqa: F401
+        except ImportError:
+            raise ValueError("msgpack encoding needs the msgpack package")
+    return value
+
+
+def project(result, fields):
+    """The parts of ``result`` named by ``fields``; everything when ``fields`` is None."""
+    if fields is None or not isinstance(result, dict):
+        return result
+    projected = {}
+    for path in fields + ALWAYS_FIELDS:
+        head, _, rest = path.partition(".")
+        if head not in result:
+            continue
+        if not rest:
+            projected[head] = result[head]
+        elif isinstance(result[head], dict):
+            nested = project(result[head], (rest,))
+            if nested:
+                projected.setdefault(head, {}).update(nested)
+    return projected
+
+
+def shape(body, fields):
+    """Project a completion result, or each result of a batch."""
+    if fields is None:
+        return body
+    if isinstance(body.get("results"), list):
+        return dict(body, results=[project(result, fields) for result in body["results"]])
+    return project(body, fields)
+
+
+def encode(body, status_code=200, encoding="json", gzip_min_bytes=1024):
+    """The Lambda response for ``body`` in ``encoding``."""
+    if encoding == "object":
+        return {"statusCode": status_code, "body": body}
+    if encoding == "msgpack":
+        import msgpack
+        return {
+            "statusCode": status_code,
+            "headers": {"Content-Type": "application/msgpack"},
+            "isBase64Encoded": True,
+            "body": base64.b64encode(msgpack.packb(body)).decode("ascii")
+        }
+
+    text = json.dumps(body, separators=(",", ":"))
+    if encoding != "gzip" or len(text) < gzip_min_bytes:
+        return {"statusCode": status_code, "body": text}
+    return {
+        "statusCode": status_code,
+        "headers": {"Content-Type": "application/json", "Content-Encoding": "gzip"},
+        "isBase64Encoded": True,
+        # Level 6 gets most of level 9's ratio at a fraction of the time
+        "body": base64.b64encode(gzip.compress(text.encode("utf-8"), compresslevel=6)).decode("ascii")
+    }
+
+
+def decode(response):
+    """The body of a response built by ``encode``, for clients and benchmarks."""
+    body = response["body"]
+    if not response.get("isBase64Encoded"):
+        return json.loads(body) if isinstance(body, str) else body
+    data = base64.b64decode(body)
+    if response["headers"].get("Content-Type") == "application/msgpack":
+        import msgpack
+        return msgpack.unpackb(data)
+    return json.loads(gzip.decompress(data))
@@ -0,0 +1,176 @@
+"""
+Bounded capture of llama-server output.
+
+llama-server logs every slot update, and passing each line through the
+logger costs GIL time on the core doing inference and CloudWatch ingestion
+for lines nobody reads. ``ServerLog`` reads the pipe in blocks instead of
+line by line, and handles each line as follows:
+
+- lines matching ``exclude`` are dropped;
+- everything else goes into a fixed-size ring buffer of recent lines;
+- lines at or above ``level``, or matching ``include``, are logged at once;
+- load progress, slot timings and errors are parsed into structured events.
+
+The buffered raw lines are only written to the log by ``flush()``, which the
+handler calls when startup or a request fails, or on demand.
+"""
+
+import logging
+import re
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger()
+
+LEVELS = {"debug": 10, "info": 20, "warning": 30, "error": 40}
+
+# Substrings of llama-server log lines that mark startup milestones. Both the
+# JSON-style logs of older builds and the plain logs of newer ones match.
+LOAD_STAGES = [
+    ("model_loaded", ("model loaded",)),
+    ("listening", ("listening", "all slots are idle")),
+    ("tensors_loaded", ("llm_load_tensors:",)),
+    ("metadata_loaded", ("loaded meta data",)),
+]
+ERROR_MARKERS = ("error", "failed", "fatal", "abort", "exception")
+WARNING_MARKERS = ("warn",)
+
+# "prompt eval time = 123.45 ms / 18 tokens", "eval time = ..." (print_timing)
+TIMING_PATTERN = re.compile(r"(prompt eval|eval) time\s*=\s*([\d.]+)\s*ms\s*/\s*(\d+)\s*(?:tokens|runs)")
+SLOT_PATTERN = re.compile(r"(?:id|slot)\s*[: ]\s*(\d+)")
+
+
+def line_level(lowered):
+    """Severity of a lower-cased log line, from llama-server's wording."""
+    if any(marker in lowered for marker in ERROR_MARKERS):
+        return "error"
+    if any(marker in lowered for marker in WARNING_MARKERS):
+        return "warning"
+    return "info"
+
+
+class ServerLog:
+    """Ring buffer, filters and structured events for llama-server output."""
+
+    def __init__(self, capacity=200, level="warning", include=None, exclude=None, event_capacity=100,
+                 on_event=None):
+        self.lines = deque(maxlen=capacity)
+        self.events = deque(maxlen=event_capacity)
+        self.threshold = LEVELS.get(level, LEVELS["warning"])
+        self.include = re.compile(include) if include else None
+        self.exclude = re.compile(exclude) if exclude else None
+        # Called with each structured event, from the capture thread
+        self.on_event = on_event
+        self.counts = {"lines": 0, "dropped": 0, "echoed": 0, "errors": 0, "flushed": 0}
+        self._stages_seen = set()
+        self._sequence = 0
+        self._flushed_through = 0
+        self._started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def capture(self, stream, block_size=65536):
+        """Read ``stream`` (a binary pipe) to EOF, feeding every line.
+
+        ``read1`` returns whatever is already in the pipe, so a burst of
+        lines costs one read instead of one per line.
+        """
+        self._started = time.perf_counter()
+        pending = b""
+        while True:
+            block = stream.read1(block_size)
+            if not block:
+                break
+            pending += block
+            *complete, pending = pending.split(b"\n")
+            for raw in complete:
+                self.feed(raw.decode("utf-8", "replace"))
+        if pending:
+            self.feed(pending.decode("utf-8", "replace"))
+
+    def feed(self, line):
+        """Handle one line of server output; returns its structured event, if any."""
+        line = line.strip()
+        if not line:
+            return None
+        if self.exclude is not None and self.exclude.search(line):
+            self.counts["dropped"] += 1
+            return None
+
+        lowered = line.lower()
+        level = line_level(lowered)
+        with self._lock:
+            self._sequence += 1
+            self.lines.append((self._sequence, level, line))
+            self.counts["lines"] += 1
+
+        if LEVELS[level] >= self.threshold or (self.include is not None and self.include.search(line)):
+            self.counts["echoed"] += 1
+            logger.log(logging.ERROR if level == "error" else logging.WARNING if level == "warning"
+                       else logging.INFO, f"BitNet Server: {line}")
+
+        event = self._parse(line, lowered, level)
+        if event is not None:
+            self.events.append(event)
+            if self.on_event is not None:
+                self.on_event(event)
+        return event
+
+    def _elapsed_ms(self):
+        return round((time.perf_counter() - self._started) * 1000, 2)
+
+    def _parse(self, line, lowered, level):
+        if "time =" in lowered:
+            match = TIMING_PATTERN.search(lowered)
+            if match:
+                slot = SLOT_PATTERN.search(lowered)
+                return {
+                    "type": "timing",
+                    "phase": "prompt" if match.group(1) == "prompt eval" else "generation",
+                    "slot": int(slot.group(1)) if slot else None,
+                    "ms": float(match.group(2)),
+                    "tokens": int(match.group(3)),
+                    "at_ms": self._elapsed_ms()
+                }
+        if level == "error":
+            self.counts["errors"] += 1
+            return {"type": "error", "message": line, "at_ms": self._elapsed_ms()}
+        if "listening" in self._stages_seen:
+            # Loading is over; "all slots are idle" now follows every request
+            return None
+        for stage, markers in LOAD_STAGES:
+            if stage not in self._stages_seen and any(marker in lowered for marker in markers):
+                self._stages_seen.add(stage)
+                at_ms = self._elapsed_ms()
+                logger.info(f"BitNet Server: {stage} after {at_ms:.0f} ms")
+                return {"type": "load", "stage": stage, "at_ms": at_ms}
+        return None
+
+    def reset_stages(self):
+        """Parse load stages again, for a restarted server process."""
+        self._stages_seen = set()
+
+    def recent(self, limit=None):
+        """The most recent buffered lines, oldest first."""
+        with self._lock:
+            lines = [line for _, _, line in self.lines]
+        return lines[-limit:] if limit else lines
+
+    def flush(self, reason):
+        """Log the buffered lines not flushed before, and return them."""
+        with self._lock:
+            pending = [(seq, line) for seq, _, line in self.lines if seq > self._flushed_through]
+            self._flushed_through = self._sequence
+        if pending:
+            logger.error(f"BitNet Server: last {len(pending)} output lines ({reason}):\n"
+                         + "\n".join(line for _, line in pending))
+            self.counts["flushed"] += len(pending)
+        return [line for _, line in pending]
+
+    def snapshot(self, limit=None):
+        """Recent lines, structured events and counters, for diagnostics."""
+        return {
+            "lines": self.recent(limit),
+            "events": list(self.events),
+            "counts": dict(self.counts)
+        }
@@ -0,0 +1,321 @@
+"""
+Multi-turn sessions pinned to llama-server slots.
+
+Chat clients resend the whole conversation every turn. With ``cache_prompt``
+llama-server only evaluates the part of a prompt that differs from what its
+slot already holds, so a turn costs only its new tokens. That holds only if
+the turn lands in the slot that holds the previous turn, and nothing else
+used the slot in between. ``SessionStore`` pins each session to a slot. When
+a new session needs a slot that another session holds, it snapshots that
+session's KV state with the slot save API, so the other session can restore
+it later instead of evaluating its history again.
+
+When a conversation outgrows the slot's context, the oldest part of the
+history is shifted out, as llama.cpp's own context shift does. The kept head
+is the registered prompt prefix (the system prompt), if the conversation
+starts with one, and about half of the rest is dropped at a line boundary.
+Later turns apply the same cut, so they reuse the slot again until it fills
+up next time. With the ``error`` policy the turn is refused instead.
+
+Sessions idle for ``idle_ttl_s``, or beyond ``max_sessions``, are dropped
+least recently used first, with their snapshots.
+"""
+
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger()
+
+OVERFLOW_POLICIES = ("shift", "error")
+
+
+class SessionOverflow(Exception):
+    """Raised when a turn does not fit the slot context and the policy is ``error``."""
+
+
+class Session:
+    """One conversation and what its slot holds."""
+
+    def __init__(self, session_id, key):
+        self.id = session_id
+        self.key = key
+        self.slot = None
+        # Everything said so far: the last prompt and the completion to it
+        self.conversation = ""
+        # The shifted-out span of the conversation, as (keep, resume) offsets:
+        # the text sent is conversation[:keep] + conversation[resume:]
+        self.cut = (0, 0)
+        self.turns = 0
+        self.tokens = 0
+        self.snapshot_bytes = 0
+        self.last_used = time.time()
+
+    @property
+    def filename(self):
+        return f"session-{self.key}.bin"
+
+    def sent_text(self, conversation):
+        keep, resume = self.cut
+        return conversation[:keep] + conversation[resume:]
+
+
+class SessionTurn:
+    """A turn in progress: holds the session's slot until ``SessionStore.finish``."""
+
+    def __init__(self, session, slot, conversation, prompt, uncached, info):
+        self.session = session
+        self.slot = slot
+        self.conversation = conversation
+        self.prompt = prompt
+        # The part of ``prompt`` the slot is not expected to hold already
+        self.uncached = uncached
+        self.info = info
+
+
+class SessionStore:
+    """Maps session ids to slots and keeps their state across turns."""
+
+    def __init__(self, snapshot_dir=None, max_snapshot_bytes=256 * 1024 * 1024, max_sessions=256,
+                 idle_ttl_s=1800, overflow="shift", namespace=""):
+        self.snapshot_dir = snapshot_dir
+        self.max_snapshot_bytes = max_snapshot_bytes
+        self.max_sessions = max_sessions
+        self.idle_ttl_s = idle_ttl_s
+        self.overflow = overflow if overflow in OVERFLOW_POLICIES else "shift"
+        self.namespace = namespace
+        self.sessions = OrderedDict()
+        # slot id -> id of the session whose state the slot holds
+        self._owners = {}
+        # slot id -> lock held for the length of a turn
+        self._slot_locks = {}
+        self._lock = threading.Lock()
+
+    def _key(self, session_id):
+        return hashlib.sha256(f"{self.namespace}\0{session_id}".encode("utf-8")).hexdigest()[:20]
+
+    def begin(self, server, session_id, prompt, append=False, n_predict=50):
+        """Prepare a turn: pick and lock the slot, bring the session's state into it, fit the context.
+
+        ``prompt`` is the whole conversation so far, or with ``append`` only
+        the new turn. Call ``finish`` with the result, or ``abort``, after.
+        """
+        with self._lock:
+            self._expire()
+            session = self.sessions.get(session_id)
+            if session is None:
+                session = self._create(session_id)
+            self.sessions.move_to_end(session_id)
+            session.last_used = time.time()
+
+            conversation = session.conversation + prompt if append else prompt
+            state = "resident"
+            if session.turns == 0:
+                state = "new"
+            elif not conversation.startswith(session.conversation):
+                # The client edited the history: start the session over
+                session.cut = (0, 0)
+                state = "reset"
+            slot = self._pick_slot(session, max(1, server.n_slots))
+            lock = self._slot_locks.setdefault(slot, threading.Lock())
+
+        lock.acquire()
+        try:
+            owner = self._owners.get(slot)
+            if owner != session.id:
+                if owner in self.sessions:
+                    self._save(server, self.sessions[owner])
+                if state == "resident":
+                    state = self._restore(server, session, slot)
+                self._owners[slot] = session.id
+            session.slot = slot
+            text, tokens, dropped = self._fit(server, session, conversation, n_predict)
+        except SessionOverflow:
+            # Nothing was sent; the slot holds what it held
+            lock.release()
+            raise
+        except Exception:
+            self._owners.pop(slot, None)
+            lock.release()
+            raise
+
+        info = {"id": session_id, "slot": slot, "turn": session.turns + 1, "state": state, "tokens": tokens}
+        uncached = text
+        if dropped:
+            info["shifted_chars"] = dropped
+        elif state in ("resident", "restored"):
+            uncached = conversation[len(session.conversation):]
+        return SessionTurn(session, slot, conversation, text, uncached, info)
+
+    def finish(self, turn, result):
+        """Record the turn's completion and release its slot."""
+        session = turn.session
+        try:
+            with self._lock:
+                session.conversation = turn.conversation + result.get("content", "")
+                session.tokens = (result.get("tokens_evaluated") or 0) + (result.get("tokens_predicted") or 0)
+                session.turns += 1
+                session.last_used = time.time()
+                self._owners[turn.slot] = session.id
+            turn.info["reused"] = result.get("tokens_cached")
+        finally:
+            self._slot_locks[turn.slot].release()
+
+    def abort(self, turn):
+        """Release the slot of a failed turn; what the slot holds is unknown."""
+        self._owners.pop(turn.slot, None)
+        self._slot_locks[turn.slot].release()
+
+    def end(self, session_id):
+        """Drop a session and its snapshot; returns whether it existed."""
+        with self._lock:
+            session = self.sessions.pop(session_id, None)
+            if session is None:
+                return False
+            self._drop(session)
+            return True
+
+    def note_slot_used(self, slot):
+        """Record that a request outside any session used ``slot``."""
+        if slot is not None:
+            self._owners.pop(slot, None)
+
+    def forget_resident(self):
+        """Forget slot contents, e.g. after the server process restarts."""
+        self._owners.clear()
+
+    def stats(self):
+        return {
+            "sessions": len(self.sessions),
+            "snapshot_bytes": sum(s.snapshot_bytes for s in self.sessions.values()),
+            "slots": {slot: owner for slot, owner in self._owners.items()}
+        }
+
+    def _create(self, session_id):
+        while len(self.sessions) >= self.max_sessions:
+            _, evicted = self.sessions.popitem(last=False)
+            self._drop(evicted)
+            logger.info(f"Sessions: evicted {evicted.id} to stay within {self.max_sessions} sessions")
+        session = Session(session_id, self._key(session_id))
+        self.sessions[session_id] = session
+        return session
+
+    def _expire(self):
+        cutoff = time.time() - self.idle_ttl_s
+        while self.sessions:
+            session = next(iter(self.sessions.values()))
+            if session.last_used >= cutoff:
+                break
+            del self.sessions[session.id]
+            self._drop(session)
+            logger.info(f"Sessions: expired {session.id} after {self.idle_ttl_s:g}s idle")
+
+    def _drop(self, session):
+        for slot, owner in list(self._owners.items()):
+            if owner == session.id:
+                del self._owners[slot]
+        self._remove_snapshot(session)
+
+    def _pick_slot(self, session, n_slots):
+        """The session's own slot, else a free one, else the least recently used session's."""
+        if session.slot is not None and self._owners.get(session.slot) == session.id:
+            return session.slot
+        free = [slot for slot in range(n_slots) if self._owners.get(slot) not in self.sessions]
+        if free:
+            return session.slot if session.slot in free else free[0]
+        for other in self.sessions.values():
+            if other is not session and other.slot is not None and self._owners.get(other.slot) == other.id:
+                return other.slot
+        return session.slot if session.slot is not None else 0
+
+    def _save(self, server, session):
+        """Snapshot an evicted session's slot, so it can come back without re-evaluating."""
+        transport = getattr(server, "transport", None)
+        if transport is None or not self.snapshot_dir or not self.max_snapshot_bytes:
+            return
+        response = transport.post(f"/slots/{session.slot}?action=save", {"filename": session.filename}, timeout=120)
+        if response.status_code != 200:
+            logger.warning(f"Sessions: snapshot of {session.id} failed ({response.status_code}: {response.text})")
+            return
+        try:
+            session.snapshot_bytes = os.path.getsize(os.path.join(self.snapshot_dir, session.filename))
+        except OSError:
+            session.snapshot_bytes = 0
+        self._evict_snapshots(keep=session)
+
+    def _restore(self, server, session, slot):
+        transport = getattr(server, "transport", None)
+        if transport is None or not session.snapshot_bytes:
+            return "evaluated"
+        response = transport.post(f"/slots/{slot}?action=restore", {"filename": session.filename}, timeout=120)
+        if response.status_code == 200:
+            return "restored"
+        logger.warning(f"Sessions: restore of {session.id} failed ({response.status_code}: {response.text}), "
+                       f"re-evaluating")
+        return "evaluated"
+
+    def _remove_snapshot(self, session):
+        if not session.snapshot_bytes or not self.snapshot_dir:
+            return
+        try:
+            os.remove(os.path.join(self.snapshot_dir, session.filename))
+        except FileNotFoundError:
+            pass
+        session.snapshot_bytes = 0
+
+    def _evict_snapshots(self, keep):
+        """Delete least recently used session snapshots until under ``max_snapshot_bytes``."""
+        with self._lock:
+            total = sum(s.snapshot_bytes for s in self.sessions.values())
+            for session in list(self.sessions.values()):
+                if total <= self.max_snapshot_bytes:
+                    break
+                if session is keep or not session.snapshot_bytes:
+                    continue
+                total -= session.snapshot_bytes
+                self._remove_snapshot(session)
+
+    def _fit(self, server, session, conversation, n_predict):
+        """The text to send, its token count and how many characters were shifted out.
+
+        Room is left for ``n_predict`` tokens (a quarter of the context when
+        it is unlimited).
+        """
+        n_ctx = server.context_size // server.n_slots
+        budget = n_ctx - (n_predict if 0 <= n_predict < n_ctx else n_ctx // 4)
+        text = session.sent_text(conversation)
+        tokens = server.count_tokens(text)
+        if tokens <= budget:
+            return text, tokens, 0
+        if self.overflow == "error":
+            raise SessionOverflow(f"Session {session.id} needs {tokens} tokens plus {n_ctx - budget} to "
+                                  f"generate, more than the {n_ctx}-token slot context")
+
+        keep, resume = session.cut
+        if keep == resume == 0:
+            keep = self._kept_head(server, conversation)
+            resume = keep
+        while tokens > budget and resume < len(conversation):
+            # Drop about half of what follows the kept head, like llama.cpp's
+            # context shift, so the next turns fit without shifting again
+            remaining = len(conversation) - resume
+            target = resume + max(remaining // 2, remaining - remaining * budget // tokens)
+            boundary = conversation.find("\n", target, len(conversation) - 1)
+            resume = boundary + 1 if boundary != -1 else target
+            text = conversation[:keep] + conversation[resume:]
+            tokens = server.count_tokens(text)
+        if tokens > budget:
+            raise SessionOverflow(f"The last turn of session {session.id} alone needs {tokens} tokens, "
+                                  f"more than the {budget} available in the slot context")
+        session.cut = (keep, resume)
+        logger.info(f"Sessions: shifted {resume - keep} characters out of {session.id} ({tokens} tokens left)")
+        return text, tokens, resume - keep
+
+    def _kept_head(self, server, conversation):
+        """Characters kept at the start across shifts: the registered prefix the conversation starts with."""
+        prefix_cache = getattr(server, "prefix_cache", None)
+        entry = prefix_cache.match(conversation) if prefix_cache is not None else None
+        return len(entry.text) if entry is not None else 0
@@ -0,0 +1,68 @@
+"""
+Prompt-lookup (n-gram) drafting for speculative decoding.
+
+Extraction and rewriting outputs copy long spans of their prompt. After each
+sampled token, ``NgramDrafter`` looks for the most recent earlier occurrence
+of the context's last ``ngram_max``..``ngram_min`` tokens and proposes the
+tokens that followed it as a draft. The engine verifies the whole draft in
+one batched forward pass and keeps the prefix the model agrees with, so a
+good draft yields several tokens for the cost of one decode. No draft model
+is needed.
+"""
+
+DEFAULT_OPTIONS = {"n_draft": 8, "ngram_min": 1, "ngram_max": 3}
+# Longer drafts are almost never accepted in full and only waste verification work
+MAX_DRAFT = 64
+MAX_NGRAM = 16
+
+
+def parse_options(value, n_batch=512):
+    """Normalise a request's ``speculative`` flag; returns options or None when off.
+
+    A draft is verified together with the token before it in one batch, and
+    logits are only kept for the last ``n_batch`` chunk of a decode, so
+    ``n_draft`` is clamped to ``n_batch - 1`` (and to ``MAX_DRAFT``).
+    """
+    if not value:
+        return None
+    options = dict(DEFAULT_OPTIONS)
+    if isinstance(value, dict):
+        options.update({k: int(v) for k, v in value.items() if k in DEFAULT_OPTIONS})
+    options["n_draft"] = min(max(1, options["n_draft"]), MAX_DRAFT, n_batch - 1)
+    options["ngram_min"] = min(max(1, options["ngram_min"]), MAX_NGRAM)
+    options["ngram_max"] = min(max(options["ngram_min"], options["ngram_max"]), MAX_NGRAM)
+    return options
+
+
+class NgramDrafter:
+    """Index of the n-grams of a token sequence, for prompt-lookup drafts."""
+
+    def __init__(self, tokens, n_draft=8, ngram_min=1, ngram_max=3):
+        self.n_draft = n_draft
+        self.ngram_min = ngram_min
+        self.ngram_max = ngram_max
+        self.tokens = []
+        # n-gram -> position of the token that followed its latest occurrence
+        self._follow = {}
+        for token in tokens:
+            self.append(token)
+
+    def append(self, token):
+        position = len(self.tokens)
+        for n in range(self.ngram_min, self.ngram_max + 1):
+            if position >= n:
+                self._follow[tuple(self.tokens[position - n:position])] = position
+        self.tokens.append(token)
+
+    def draft(self, limit=None):
+        """Tokens that followed the longest earlier match of the current suffix."""
+        size = min(self.n_draft, limit) if limit is not None else self.n_draft
+        if size <= 0:
+            return []
+        for n in range(self.ngram_max, self.ngram_min - 1, -1):
+            if len(self.tokens) < n:
+                continue
+            position = self._follow.get(tuple(self.tokens[-n:]))
+            if position is not None:
+                return self.tokens[position:position + size]
+        return []
@@ -0,0 +1,120 @@
+"""
+Supervision of the inference server process.
+
+llama-server runs as a child process, and a crash or an OOM kill leaves the
+handler holding a server that no longer answers. Before the supervisor,
+every later invocation failed until Lambda recycled the container.
+``ServerSupervisor`` checks the process is alive before each request and
+restarts it in place when it is not. The model file is still in the page
+cache, so a restart costs a model mmap and a health check rather than a
+cold start. A request that fails because the server died under it is
+retried once on the restarted server.
+
+Restarts are rate limited: a server that keeps crashing (a bad model file,
+a context too large for the memory size) fails requests instead of
+restarting forever.
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class ServerSupervisor:
+    """Restart a dead server in place and retry the request that found it dead.
+
+    The server needs ``alive(grace)`` and ``restart()``; ``exit_code()`` is
+    reported when it has one.
+    """
+
+    def __init__(self, max_restarts=3, window_s=300, exit_grace_s=1.0, on_restart=None,
+                 connection_errors=(ConnectionError,)):
+        self.max_restarts = max_restarts
+        self.window_s = window_s
+        # After a request fails with one of ``connection_errors``, how long to
+        # wait for the process to be reaped; other failures only poll it
+        self.exit_grace_s = exit_grace_s
+        self.connection_errors = connection_errors
+        # Called after each successful restart, e.g. to forget slot contents
+        self.on_restart = on_restart
+        self.counts = {"crashes": 0, "restarts": 0, "restart_failures": 0, "retries": 0}
+        self.last_exit_code = None
+        self.last_restart_ms = None
+        self._restart_times = deque()
+        self._given_up = False
+        self._lock = threading.Lock()
+
+    def ensure(self, server, grace=0):
+        """Restart ``server`` if its process has died; returns whether it restarted."""
+        if server.alive(grace):
+            return False
+        with self._lock:
+            # Another request may have restarted it while we waited for the lock
+            if server.alive():
+                return False
+            if not self._given_up:
+                # Once restarts are exhausted, the same dead process is found on every request
+                self.counts["crashes"] += 1
+                self.last_exit_code = server.exit_code() if hasattr(server, "exit_code") else None
+                logger.warning(f"Server process died (exit code {self.last_exit_code}), restarting")
+            self._restart(server)
+            return True
+
+    def _restart(self, server):
+        now = time.monotonic()
+        while self._restart_times and now - self._restart_times[0] > self.window_s:
+            self._restart_times.popleft()
+        if len(self._restart_times) >= self.max_restarts:
+            self._given_up = True
+            raise Exception(f"Server crashed {len(self._restart_times) + 1} times within {self.window_s:g}s; "
+                            f"not restarting it again")
+        self._restart_times.append(now)
+
+        started = time.perf_counter()
+        try:
+            server.restart()
+        except Exception:
+            self.counts["restart_failures"] += 1
+            raise
+        self.counts["restarts"] += 1
+        self._given_up = False
+        if self.on_restart is not None:
+            self.on_restart()
+        self.last_restart_ms = round((time.perf_counter() - started) * 1000, 2)
+        logger.info(f"Server restarted in {self.last_restart_ms:.0f} ms")
+
+    def call(self, server, request):
+        """Run ``request()`` against ``server``, recovering from a server crash.
+
+        Returns ``(result, recovery)``. ``recovery`` is None when nothing
+        happened, else a dict saying whether the server was restarted and the
+        request retried. A failure while the server is still alive is raised
+        unchanged, and so is a second failure after the retry.
+        """
+        restarted = self.ensure(server)
+        restarts_before = self.counts["restarts"]
+        try:
+            result = request()
+        except Exception as e:
+            # A refused or broken connection is what a dying process looks like; an
+            # error reply from a live server must not wait out the grace period
+            grace = self.exit_grace_s if isinstance(e, self.connection_errors) else 0
+            recovered = self.ensure(server, grace=grace)
+            # Concurrent requests that hit the same crash are retried after whichever restarts it
+            if not recovered and self.counts["restarts"] == restarts_before:
+                raise
+            # The server died under this request; it is back, so try once more
+            logger.warning(f"Retrying request after server restart: {str(e)}")
+            with self._lock:
+                self.counts["retries"] += 1
+            return request(), self._recovery(restarted=restarted or recovered, retried=True)
+        return result, self._recovery(restarted=True, retried=False) if restarted else None
+
+    def _recovery(self, restarted, retried):
+        return dict(self.stats(), restarted=restarted, retried=retried)
+
+    def stats(self):
+        return dict(self.counts, last_exit_code=self.last_exit_code, last_restart_ms=self.last_restart_ms)
@@ -0,0 +1,201 @@
+"""
+HTTP transport between the Lambda handler and the local llama-server.
+
+Built on ``http.client`` so the handler does not pay for importing
+``requests`` on cold start. Connections are kept alive and pooled, and the
+server can optionally be reached over a Unix domain socket instead of TCP.
+"""
+
+import http.client
+import json
+import socket
+import threading
+
+
+class TransportError(Exception):
+    """Raised when llama-server cannot be reached or the connection breaks."""
+
+
+class TransportTimeout(TransportError):
+    """Raised when llama-server does not answer within the timeout."""
+
+
+class ServerStatusError(Exception):
+    """Raised by ``stream`` when llama-server answers with an error status; the connection worked."""
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTP connection over a Unix domain socket."""
+
+    def __init__(self, socket_path, timeout=None):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+        except OSError:
+            sock.close()
+            raise
+        self.sock = sock
+
+
+class Response:
+    """A fully read HTTP response."""
+
+    def __init__(self, status_code, content):
+        self.status_code = status_code
+        self.content = content
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8", errors="replace")
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class ServerTransport:
+    """Pooled keep-alive HTTP client for llama-server.
+
+    Each request borrows an idle connection from the pool (or opens a new one)
+    and returns it afterwards, so concurrent callers never share a socket and
+    sequential callers skip the TCP handshake.
+    """
+
+    def __init__(self, host="127.0.0.1", port=8080, socket_path=None, pool_size=4):
+        self.host = host
+        self.port = port
+        self.socket_path = socket_path
+        self.pool_size = pool_size
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def _new_connection(self, timeout):
+        if self.socket_path:
+            return UnixHTTPConnection(self.socket_path, timeout=timeout)
+        return http.client.HTTPConnection(self.host, self.port, timeout=timeout)
+
+    def _acquire(self, timeout):
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+        if conn is None:
+            return self._new_connection(timeout)
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+        return conn
+
+    def _release(self, conn, response):
+        if response.will_close:
+            conn.close()
+            return
+        with self._lock:
+            if len(self._idle) < self.pool_size:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def _send(self, method, path, payload, timeout):
+        """Send a request and return ``(connection, response)`` with headers read."""
+        body = None
+        headers = {}
+        if payload is not None:
+            body = json.dumps(payload).encode("utf-8")
+            headers["Content-Type"] = "application/json"
+
+        for attempt in range(2):
+            conn = self._acquire(timeout)
+            reused = conn.sock is not None
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                self._quickack(conn)
+                return conn, conn.getresponse()
+            except socket.timeout:
+                conn.close()
+                raise TransportTimeout(f"{method} {path} timed out after {timeout}s")
+            except (OSError, http.client.HTTPException) as e:
+                conn.close()
+                # The server may have dropped an idle keep-alive connection;
+                # retry once on a fresh one before giving up.
+                if reused and attempt == 0:
+                    continue
+                raise TransportError(f"{method} {path} failed: {e}")
+
+    def request(self, method, path, payload=None, timeout=None):
+        """Send a request and return the fully read :class:`Response`."""
+        conn, response = self._send(method, path, payload, timeout)
+        try:
+            content = response.read()
+        except socket.timeout:
+            conn.close()
+            raise TransportTimeout(f"{method} {path} timed out after {timeout}s")
+        except (OSError, http.client.HTTPException) as e:
+            conn.close()
+            raise TransportError(f"{method} {path} failed: {e}")
+        self._release(conn, response)
+        return Response(response.status, content)
+
+    def get(self, path, timeout=None):
+        return self.request("GET", path, timeout=timeout)
+
+    def post(self, path, payload, timeout=None):
+        return self.request("POST", path, payload, timeout=timeout)
+
+    @staticmethod
+    def _quickack(conn):
+        # On a reused keep-alive connection our delayed ACK of the first
+        # response segment holds back the server's next small write (Nagle)
+        # by ~40 ms. Linux resets TCP_QUICKACK after each ACK, so re-arm it
+        # before every read we wait on.
+        if conn.sock is not None and hasattr(socket, "TCP_QUICKACK") and not isinstance(conn, UnixHTTPConnection):
+            conn.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_QUICKACK, 1)
+
+    def stream(self, path, payload, timeout=None):
+        """POST a request and yield each server-sent event as a dict.
+
+        ``timeout`` applies to each read, not to the whole stream. Closing the
+        generator early closes the connection, which makes llama-server stop
+        generating for this request.
+        """
+        conn, response = self._send("POST", path, payload, timeout)
+        finished = False
+        try:
+            if response.status != 200:
+                raise ServerStatusError(
+                    f"Server returned status {response.status}: "
+                    f"{response.read().decode('utf-8', errors='replace')}"
+                )
+            while True:
+                line = response.readline()
+                if not line:
+                    break
+                self._quickack(conn)
+                # llama-server frames every event as "data: {json}" followed by a blank line
+                if not line.startswith(b"data: "):
+                    continue
+                chunk = json.loads(line[len(b"data: "):])
+                yield chunk
+                if chunk.get("stop"):
+                    break
+            # Drain the chunked terminator so the connection can be reused
+            response.read()
+            finished = True
+        except socket.timeout:
+            raise TransportTimeout(f"POST {path} timed out after {timeout}s")
+        except (OSError, http.client.HTTPException) as e:
+            raise TransportError(f"POST {path} failed: {e}")
+        finally:
+            if finished:
+                self._release(conn, response)
+            else:
+                conn.close()
+
+    def close(self):
+        """Close all idle connections."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
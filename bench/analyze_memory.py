@@ -0,0 +1,387 @@
+#!/usr/bin/env python3
+"""
+Pick the Lambda memory size from benchmark results.
+
+Reads the output of ``scripts/5-benchmark.sh``, either the current CSV with
+millisecond timings, billed duration and memory used, or the older one with
+whole seconds. It also reads JSON written by ``bench/run_benchmark.py
+--memory-mb``. For each memory size it reports:
+
+- cold-start, time-to-first-token and generation tokens/s distributions
+- warm duration fitted as a fixed cost plus a time per generated token
+  (billed duration when the sweep captured it, round trip otherwise)
+- the cost of 1,000 generated tokens for requests of ``--n-predict``
+  tokens, at ``--arch`` prices or ``--price-gb-s`` and ``--price-request``,
+  with ``--cold-start-rate`` of requests paying the cold-start overhead
+
+Lambda gives CPU in proportion to memory: one vCPU at 1,769 MB, up to six at
+10,240 MB. Generation throughput is fitted against vCPUs with Amdahl's law,
+which shows how much a larger size can still speed generation up. The
+recommendation is the cheapest measured size that never failed. It must
+keep ``--min-headroom`` of its memory free and, when ``--max-latency-s`` is
+set, finish ``--n-predict`` tokens within it. ``--apply`` writes it to
+``LAMBDA_MEMORY_SIZE`` in ``cdk/env_config.py``.
+
+Usage:
+    ./scripts/5-benchmark.sh | tee sweep.csv
+    python bench/analyze_memory.py sweep.csv [--n-predict 100] [--max-latency-s 30] [--apply]
+    python bench/analyze_memory.py local-2048.json local-4096.json --json
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+
+from stats import summarize  # noqa: E402
+
+ENV_CONFIG = os.path.join(BENCH_DIR, "..", "cdk", "env_config.py")
+
+# USD per GB-second of duration (first pricing tier) and per request
+PRICES_GB_S = {"arm64": 0.0000133334, "x86_64": 0.0000166667}
+PRICE_PER_REQUEST = 0.20 / 1000000
+
+MB_PER_VCPU = 1769
+MAX_VCPUS = 6
+MAX_MEMORY_MB = 10240
+
+# Columns of 5-benchmark.sh output from before it printed a header with units
+LEGACY_COLUMNS = ["Memory(MB)", "Test_Type", "N_Predict", "Response_Time(s)", "Response"]
+
+
+def vcpus(memory_mb):
+    """The CPU share Lambda gives a function of ``memory_mb``."""
+    return min(memory_mb / MB_PER_VCPU, MAX_VCPUS)
+
+
+def number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def invocation(source, memory_mb, cold, n_predict, e2e_ms, tokens=None, billed_ms=None, init_ms=None,
+               max_memory_mb=None, ttft_ms=None, gen_tps=None, ok=True, resolution_ms=1):
+    return {
+        "source": source, "memory_mb": int(memory_mb), "cold": cold, "n_predict": n_predict,
+        # A response that stopped early still cost its tokens, not n_predict
+        "tokens": tokens if tokens else n_predict,
+        "e2e_ms": e2e_ms, "billed_ms": billed_ms, "init_ms": init_ms, "max_memory_mb": max_memory_mb,
+        "ttft_ms": ttft_ms, "gen_tps": gen_tps, "ok": ok, "resolution_ms": resolution_ms
+    }
+
+
+def parse_sweep(lines, source):
+    """Invocations from ``5-benchmark.sh`` output."""
+    columns = LEGACY_COLUMNS
+    invocations = []
+    for line in lines:
+        line = line.strip()
+        if line.startswith("Memory(MB),"):
+            columns = line.split(",")
+            continue
+        if not line[:1].isdigit():
+            continue
+        # The response text comes last and may contain commas
+        row = dict(zip(columns, line.split(",", len(columns) - 1)))
+        seconds = "Response_Time(s)" in row
+        e2e = number(row.get("Response_Time(s)" if seconds else "Response_Time(ms)"))
+        response = row.get("Response", "").strip()
+        invocations.append(invocation(
+            source,
+            memory_mb=number(row["Memory(MB)"]),
+            cold=row.get("Test_Type") == "COLD_START",
+            n_predict=number(row.get("N_Predict")),
+            e2e_ms=e2e * 1000 if seconds and e2e is not None else e2e,
+            tokens=number(row.get("Tokens_Predicted")),
+            billed_ms=number(row.get("Billed_Duration(ms)")),
+            init_ms=number(row.get("Init_Duration(ms)")),
+            max_memory_mb=number(row.get("Max_Memory_Used(MB)")),
+            ttft_ms=number(row.get("TTFT(ms)")),
+            gen_tps=number(row.get("Gen_Tokens_Per_s")),
+            ok=e2e is not None and not response.startswith(("ERROR", "null")),
+            resolution_ms=1000 if seconds else 1
+        ))
+    return invocations
+
+
+def parse_local(results, source):
+    """Invocations from a ``run_benchmark.py`` results document."""
+    memory_mb = results["meta"].get("memory_mb")
+    if not memory_mb:
+        raise SystemExit(f"{source} has no memory size; run run_benchmark.py with --memory-mb")
+    invocations = []
+    samples = [(True, s) for s in results["cold_start"]["samples"]]
+    samples += [(False, s) for cell in results["cells"] for s in cell["samples"]]
+    for cold, sample in samples:
+        invocations.append(invocation(
+            source, memory_mb, cold,
+            n_predict=sample.get("tokens_predicted"),
+            e2e_ms=sample["e2e_ms"],
+            tokens=sample.get("tokens_predicted"),
+            ttft_ms=sample.get("ttft_ms"),
+            gen_tps=sample.get("gen_tps")
+        ))
+    return invocations
+
+
+def read_invocations(path):
+    with open(path) as f:
+        text = f.read()
+    if text.lstrip().startswith("{"):
+        return parse_local(json.loads(text), path)
+    return parse_sweep(text.splitlines(), path)
+
+
+def fit_line(points):
+    """Least-squares ``(a, b)`` of ``y = a + b x``; None without two distinct x values."""
+    if len({x for x, _ in points}) < 2:
+        return None
+    n = len(points)
+    mean_x = sum(x for x, _ in points) / n
+    mean_y = sum(y for _, y in points) / n
+    slope = (sum((x - mean_x) * (y - mean_y) for x, y in points)
+             / sum((x - mean_x) ** 2 for x, _ in points))
+    return mean_y - slope * mean_x, slope
+
+
+def fit_amdahl(points):
+    """Fit ``tps(v) = t1 / ((1 - p) + p / v)`` to ``(vcpus, tokens/s)`` points.
+
+    ``p`` is the parallel fraction of generation, found by grid search; for
+    each ``p``, the best ``t1`` has a closed form.
+    """
+    if len(points) < 2:
+        return None
+    best = None
+    for step in range(1001):
+        p = step / 1000
+        gains = [1 / ((1 - p) + p / v) for v, _ in points]
+        t1 = sum(y * g for (_, y), g in zip(points, gains)) / sum(g * g for g in gains)
+        sse = sum((y - t1 * g) ** 2 for (_, y), g in zip(points, gains))
+        if best is None or sse < best[0]:
+            best = (sse, p, t1)
+    sse, p, t1 = best
+    mean_y = sum(y for _, y in points) / len(points)
+    sst = sum((y - mean_y) ** 2 for _, y in points)
+    return {"tps_1_vcpu": t1, "parallel_fraction": p, "r2": 1 - sse / sst if sst else 1.0}
+
+
+def predict_tps(curve, memory_mb):
+    p = curve["parallel_fraction"]
+    return curve["tps_1_vcpu"] / ((1 - p) + p / vcpus(memory_mb))
+
+
+def analyze_size(memory_mb, invocations, args, price_gb_s):
+    """Distributions, warm-duration fit and cost for one memory size."""
+    ok = [i for i in invocations if i["ok"]]
+    cold = [i for i in ok if i["cold"]]
+    warm = [i for i in ok if not i["cold"]]
+    max_used = max((i["max_memory_mb"] for i in invocations if i["max_memory_mb"]), default=None)
+    report = {
+        "memory_mb": memory_mb,
+        "vcpus": round(vcpus(memory_mb), 2),
+        "invocations": len(invocations),
+        "failed": len(invocations) - len(ok),
+        "cold_start_ms": summarize([i["e2e_ms"] for i in cold]),
+        "init_ms": summarize([i["init_ms"] for i in cold]),
+        "ttft_ms": summarize([i["ttft_ms"] for i in warm]),
+        "gen_tps": summarize([i["gen_tps"] for i in warm]),
+        "max_memory_used_mb": max_used,
+        "resolution_ms": max((i["resolution_ms"] for i in invocations), default=1),
+        "duration": None, "fixed_ms": None, "per_token_ms": None, "marginal_tps": None,
+        "cold_extra_ms": None, "latency_ms": None, "cost_per_1k_tokens": None
+    }
+    if not warm:
+        return report
+
+    # Billed duration is what costs money; the round trip adds the network
+    billed = all(i["billed_ms"] is not None for i in warm)
+    report["duration"] = "billed" if billed else "round trip"
+
+    def duration(i):
+        return i["billed_ms"] if billed and i["billed_ms"] is not None else i["e2e_ms"]
+
+    fit = fit_line([(i["tokens"], duration(i)) for i in warm])
+    if fit is None or fit[1] <= 0:
+        # A single output length cannot separate the fixed cost from the per-token one
+        fixed_ms = 0.0
+        per_token_ms = sum(duration(i) / i["tokens"] for i in warm) / len(warm)
+    else:
+        fixed_ms, per_token_ms = max(fit[0], 0.0), fit[1]
+    # What a cold invocation costs beyond a warm one of the same length
+    extras = sorted(max(duration(i) - fixed_ms - i["tokens"] * per_token_ms, 0.0) for i in cold)
+    cold_extra_ms = extras[len(extras) // 2] if extras else 0.0
+
+    gb = memory_mb / 1024
+    latency_ms = fixed_ms + args.n_predict * per_token_ms
+    cost = ((latency_ms + args.cold_start_rate * cold_extra_ms) / 1000 * gb * price_gb_s
+            + args.price_request)
+    report.update(
+        fixed_ms=round(fixed_ms, 1),
+        per_token_ms=round(per_token_ms, 2),
+        marginal_tps=round(1000 / per_token_ms, 3),
+        cold_extra_ms=round(cold_extra_ms, 1),
+        latency_ms=round(latency_ms, 1),
+        cost_per_1k_tokens=round(cost / args.n_predict * 1000, 8)
+    )
+    return report
+
+
+def recommend(reports, args):
+    """The cheapest measured size that never failed, has headroom and meets the latency target."""
+    candidates = []
+    for report in reports:
+        if report["cost_per_1k_tokens"] is None or report["failed"]:
+            continue
+        used = report["max_memory_used_mb"]
+        if used is not None and used > report["memory_mb"] * (1 - args.min_headroom):
+            continue
+        candidates.append(report)
+    if not candidates:
+        return None
+    within = [r for r in candidates if args.max_latency_s is None or r["latency_ms"] <= args.max_latency_s * 1000]
+    if within:
+        choice = min(within, key=lambda r: (r["cost_per_1k_tokens"], r["latency_ms"]))
+        reason = "cheapest per 1k generated tokens"
+        if args.max_latency_s is not None:
+            reason += f" within {args.max_latency_s:g} s for {args.n_predict} tokens"
+    else:
+        choice = min(candidates, key=lambda r: r["latency_ms"])
+        reason = f"fastest; no size finishes {args.n_predict} tokens within {args.max_latency_s:g} s"
+    return {"memory_mb": choice["memory_mb"], "reason": reason,
+            "cost_per_1k_tokens": choice["cost_per_1k_tokens"], "latency_ms": choice["latency_ms"]}
+
+
+def curve_report(curve, reports, knee_fraction):
+    """The fitted curve, its ceiling, and the smallest size reaching ``knee_fraction`` of it."""
+    if curve is None:
+        return None
+    ceiling = predict_tps(curve, MAX_MEMORY_MB)
+    # Below the model's footprint more CPU is moot: the peak memory used, or
+    # without it the smallest size that ran every request
+    floor = max((r["max_memory_used_mb"] or 0 for r in reports), default=0)
+    if not floor:
+        floor = min((r["memory_mb"] for r in reports if not r["failed"]), default=0)
+    knee = next((mb for mb in range(128, MAX_MEMORY_MB + 1, 64)
+                 if mb >= floor and predict_tps(curve, mb) >= knee_fraction * ceiling), MAX_MEMORY_MB)
+    return {
+        "tps_1_vcpu": round(curve["tps_1_vcpu"], 3),
+        "parallel_fraction": curve["parallel_fraction"],
+        "r2": round(curve["r2"], 4),
+        "tps_max": round(ceiling, 3),
+        "knee_fraction": knee_fraction,
+        "knee_mb": knee,
+        "predicted_tps": {mb: round(predict_tps(curve, mb), 3) for mb in (1024, 2048, 4096, 6144, 8192, 10240)}
+    }
+
+
+def apply_recommendation(memory_mb, path):
+    """Set ``LAMBDA_MEMORY_SIZE`` in the CDK environment config."""
+    with open(path) as f:
+        text = f.read()
+    line = (f"LAMBDA_MEMORY_SIZE = {memory_mb}   # {memory_mb / 1024:.3g}GB, "
+            f"bench/analyze_memory.py {time.strftime('%Y-%m-%d')}")
+    text, count = re.subn(r"^LAMBDA_MEMORY_SIZE = .*$", line, text, count=1, flags=re.M)
+    if not count:
+        raise SystemExit(f"No LAMBDA_MEMORY_SIZE setting found in {path}")
+    with open(path, "w") as f:
+        f.write(text)
+
+
+def fmt(value, spec, scale=1):
+    return format(value / scale, spec) if value is not None else "-"
+
+
+def print_table(analysis):
+    pricing = analysis["pricing"]
+    print(f"Cost per 1k generated tokens for {pricing['n_predict']}-token requests at "
+          f"${pricing['price_gb_s']:.10f}".rstrip("0") + f"/GB-s, ${pricing['price_request'] * 1e6:g}/M requests, "
+          f"{pricing['cold_start_rate'] * 100:g}% cold starts")
+    print(f"{'memory':>7} {'vCPU':>5} {'ok':>5} {'cold p50 s':>10} {'TTFT p50 ms':>11} {'gen tok/s':>9} "
+          f"{'marginal':>8} {'fixed s':>7} {'latency s':>9} {'$/1k tok':>10} {'used MB':>7}")
+    for r in analysis["memory"]:
+        print(f"{r['memory_mb']:>7} {r['vcpus']:>5.2f} {r['invocations'] - r['failed']:>2}/{r['invocations']:<2} "
+              f"{fmt(r['cold_start_ms']['p50'], '.1f', 1000):>10} {fmt(r['ttft_ms']['p50'], '.0f'):>11} "
+              f"{fmt(r['gen_tps']['p50'], '.2f'):>9} {fmt(r['marginal_tps'], '.2f'):>8} "
+              f"{fmt(r['fixed_ms'], '.2f', 1000):>7} {fmt(r['latency_ms'], '.1f', 1000):>9} "
+              f"{fmt(r['cost_per_1k_tokens'], '.6f'):>10} {fmt(r['max_memory_used_mb'], '.0f'):>7}")
+    if any(r["resolution_ms"] > 1 for r in analysis["memory"]):
+        print("(whole-second timings from an older 5-benchmark.sh; rerun it for millisecond resolution)")
+
+    curve = analysis["curve"]
+    if curve is not None:
+        print(f"\nThroughput vs vCPU (Amdahl fit, R^2 {curve['r2']:.3f}): {curve['tps_1_vcpu']:.2f} tok/s "
+              f"at 1 vCPU, {curve['parallel_fraction'] * 100:.1f}% parallel, {curve['tps_max']:.2f} tok/s at "
+              f"{MAX_VCPUS} vCPUs; {curve['knee_fraction'] * 100:g}% of that from {curve['knee_mb']} MB")
+
+    recommendation = analysis["recommendation"]
+    if recommendation is None:
+        print("\nNo memory size qualifies for a recommendation")
+    else:
+        print(f"\nRecommended LAMBDA_MEMORY_SIZE = {recommendation['memory_mb']} ({recommendation['reason']})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("results", nargs="+", help="5-benchmark.sh output or run_benchmark.py JSON files")
+    parser.add_argument("--n-predict", type=int, default=100, help="tokens generated by a typical request")
+    parser.add_argument("--arch", choices=sorted(PRICES_GB_S), default="arm64", help="pricing architecture")
+    parser.add_argument("--price-gb-s", type=float, default=None, help="USD per GB-second (overrides --arch)")
+    parser.add_argument("--price-request", type=float, default=PRICE_PER_REQUEST, help="USD per request")
+    parser.add_argument("--cold-start-rate", type=float, default=0.0,
+                        help="fraction of requests that are cold starts")
+    parser.add_argument("--max-latency-s", type=float, default=None,
+                        help="longest acceptable warm request of --n-predict tokens")
+    parser.add_argument("--min-headroom", type=float, default=0.05,
+                        help="fraction of memory that must stay unused at the peak")
+    parser.add_argument("--knee", type=float, default=0.9, help="fraction of peak throughput for the knee size")
+    parser.add_argument("--json", action="store_true", help="print the analysis as JSON")
+    parser.add_argument("--apply", nargs="?", const=ENV_CONFIG, default=None, metavar="ENV_CONFIG",
+                        help="write the recommendation to LAMBDA_MEMORY_SIZE (default: cdk/env_config.py)")
+    args = parser.parse_args()
+
+    invocations = []
+    for path in args.results:
+        invocations.extend(read_invocations(path))
+    if not invocations:
+        print("No benchmark results found", file=sys.stderr)
+        return 1
+
+    price_gb_s = args.price_gb_s if args.price_gb_s is not None else PRICES_GB_S[args.arch]
+    by_memory = {}
+    for i in invocations:
+        by_memory.setdefault(i["memory_mb"], []).append(i)
+    reports = [analyze_size(mb, members, args, price_gb_s) for mb, members in sorted(by_memory.items())]
+    curve = fit_amdahl([(r["vcpus"], r["marginal_tps"]) for r in reports if r["marginal_tps"]])
+    analysis = {
+        "pricing": {"price_gb_s": price_gb_s, "price_request": args.price_request, "n_predict": args.n_predict,
+                    "cold_start_rate": args.cold_start_rate},
+        "memory": reports,
+        "curve": curve_report(curve, reports, args.knee),
+        "recommendation": recommend(reports, args)
+    }
+
+    if args.json:
+        print(json.dumps(analysis, indent=2))
+    else:
+        print_table(analysis)
+
+    if args.apply:
+        if analysis["recommendation"] is None:
+            print("Nothing to apply", file=sys.stderr)
+            return 1
+        apply_recommendation(analysis["recommendation"]["memory_mb"], args.apply)
+        print(f"Set LAMBDA_MEMORY_SIZE = {analysis['recommendation']['memory_mb']} in {args.apply}",
+              file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Cost and payload size of the embeddings action's response.
+
+Builds llama-server style embeddings (one pooled vector per input, as parsed
+from its JSON) for a number of inputs. It then turns them into a response
+body two ways: normalizing input by input in pure Python and returning JSON
+float lists, or stacking and normalizing in bulk with NumPy and returning
+base64 float32, as ``app/embeddings.py`` does. It reports the time each
+takes, the body bytes, and how long a client takes to decode them.
+``per-token bytes`` is the size of the JSON llama-server would send if it
+returned every token's vector for the handler to pool (``--pooling none``).
+
+Usage:
+    python bench/bench_embeddings.py [--inputs 32,256] [--tokens 64] [--dim 2560] [--repeats 5]
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from embeddings import normalize, pack, pool, unpack  # noqa: E402
+from stats import summarize  # noqa: E402
+
+
+def pooled_embeddings(n_inputs, dim, seed=0):
+    """One vector per input, as Python floats like a parsed llama-server response."""
+    rng = random.Random(seed)
+    return [[rng.gauss(0, 1) for _ in range(dim)] for _ in range(n_inputs)]
+
+
+def python_body(embeddings):
+    """Normalize input by input without NumPy and return JSON float lists."""
+    rows = []
+    for vector in embeddings:
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        rows.append([v / norm for v in vector])
+    return json.dumps({"embeddings": rows})
+
+
+def numpy_body(embeddings):
+    """Stack, normalize and pack in bulk, as the handler does."""
+    return json.dumps({"embeddings": pack(normalize(pool(embeddings)[0]), "base64")})
+
+
+def time_ms(function, repeats):
+    samples = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        function()
+        samples.append((time.perf_counter() - started) * 1000)
+    return summarize(samples)["p50"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--inputs", default="32,256", help="input counts to try")
+    parser.add_argument("--tokens", type=int, default=64, help="tokens per input, for the per-token size")
+    parser.add_argument("--dim", type=int, default=2560, help="embedding size (BitNet b1.58 2B: 2560)")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--output", default=None, help="also write the rows as JSON here")
+    args = parser.parse_args()
+
+    rows = []
+    print(f"{'inputs':>6} {'python ms':>10} {'numpy ms':>9} {'list bytes':>11} {'b64 bytes':>10} "
+          f"{'list dec ms':>11} {'b64 dec ms':>10} {'per-token bytes':>15}")
+    for n_inputs in [int(v) for v in args.inputs.split(",") if v]:
+        embeddings = pooled_embeddings(n_inputs, args.dim)
+        as_list = python_body(embeddings)
+        as_base64 = numpy_body(embeddings)
+        # Same vector size as the pooled ones, times the tokens of every input
+        per_token_bytes = len(json.dumps(embeddings)) * args.tokens
+        row = {
+            "inputs": n_inputs,
+            "python_ms": time_ms(lambda: python_body(embeddings), args.repeats),
+            "numpy_ms": time_ms(lambda: numpy_body(embeddings), args.repeats),
+            "list_bytes": len(as_list),
+            "base64_bytes": len(as_base64),
+            "list_decode_ms": time_ms(lambda: unpack(json.loads(as_list)["embeddings"]), args.repeats),
+            "base64_decode_ms": time_ms(lambda: unpack(json.loads(as_base64)["embeddings"]), args.repeats),
+            "per_token_bytes": per_token_bytes,
+        }
+        rows.append(row)
+        print(f"{n_inputs:>6} {row['python_ms']:>10.1f} {row['numpy_ms']:>9.1f} {row['list_bytes']:>11} "
+              f"{row['base64_bytes']:>10} {row['list_decode_ms']:>11.1f} {row['base64_decode_ms']:>10.1f} "
+              f"{per_token_bytes:>15}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(rows, f, indent=2)
+            f.write("\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
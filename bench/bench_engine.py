@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Side-by-side latency and memory of the HTTP and in-process engines.
+
+Runs the handler once per engine, each in a fresh Python process, and reports
+per-request latency (p50/p95/p99) plus resident memory: the handler process
+and, for the HTTP engine, the llama-server process. Both peak (VmHWM) and
+current (VmRSS) are reported. Lambda bills the sum, so that is the figure to
+compare against the function's memory size.
+
+``--variants`` repeats the comparison for each model variant from
+``app/model_registry.py`` (e.g. ``i2_s,tl1``), resolved under ``--models-dir``,
+to find the quantization layout that is fastest on the machine at hand.
+
+The engine name ``inproc-spec`` runs the in-process engine with prompt-lookup
+speculative decoding, and also reports the draft acceptance rate. It gains
+most on the ``rewrite`` prompt, whose answer copies the prompt.
+
+Usage:
+    python bench/bench_engine.py --server-bin /app/bin/llama-server \\
+        --engine-lib /app/lib/libbitnet_engine.so \\
+        --model /app/models/BitNet-b1.58-2B-4T/ggml-model-i2_s.gguf
+
+    # Compare model variants on the in-process engine
+    python bench/bench_engine.py --engines inproc --variants i2_s,tl1 --models-dir temp/models
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.join(BENCH_DIR, "..", "app")
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, APP_DIR)
+
+import model_registry  # noqa: E402
+from stats import summarize  # noqa: E402
+
+
+def memory_kb(pid="self"):
+    """``(VmRSS, VmHWM)`` of a process in KiB, from /proc."""
+    values = {}
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in ("VmRSS", "VmHWM"):
+                    values[key] = int(value.split()[0])
+    except OSError:
+        pass
+    return values.get("VmRSS"), values.get("VmHWM")
+
+
+def worker(args):
+    """Run the requests with one engine and print the measurements as JSON."""
+    engine, _, variant = args.engine.partition("-")
+    os.environ.update({
+        "ENGINE": engine,
+        "SERVER_BIN": args.server_bin,
+        "MODEL_PATH": args.model,
+        "STARTUP_MODE": "lazy",
+        "EMF_METRICS": "0"
+    })
+    if args.variant:
+        os.environ["MODEL_VARIANT"] = args.variant
+    if args.engine_lib:
+        os.environ["ENGINE_LIB"] = args.engine_lib
+    from run_benchmark import FakeContext, PROMPTS
+    import lambda_handler as handler
+
+    event = {"prompt": PROMPTS[args.prompt], "n_predict": args.n_predict, "temperature": 0,
+             "speculative": variant == "spec"}
+    latencies, gen_tps, acceptance = [], [], []
+    for i in range(args.warmup + args.repeats):
+        started = time.perf_counter()
+        response = handler.lambda_handler(dict(event, prompt=f"[{i}]\n{event['prompt']}"), FakeContext())
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if response["statusCode"] != 200:
+            raise SystemExit(f"{args.engine}: invocation failed: {response['body']}")
+        if i >= args.warmup:
+            latencies.append(elapsed_ms)
+            timings = json.loads(response["body"]).get("timings", {})
+            gen_tps.append(timings.get("predicted_per_second"))
+            acceptance.append(timings.get("draft_acceptance"))
+
+    handler_rss, handler_hwm = memory_kb()
+    server_rss = server_hwm = 0
+    process = getattr(handler.bitnet_server, "process", None)
+    if process is not None:
+        server_rss, server_hwm = memory_kb(process.pid)
+    handler.cleanup()
+    print(json.dumps({
+        "engine": args.engine,
+        "variant": args.variant,
+        "model_mb": round(os.path.getsize(args.model) / 1024 / 1024, 1) if os.path.exists(args.model) else None,
+        "e2e_ms": summarize(latencies),
+        "gen_tps": summarize(gen_tps),
+        "draft_acceptance": summarize(acceptance),
+        "handler_rss_mb": round(handler_rss / 1024, 1),
+        "handler_peak_mb": round(handler_hwm / 1024, 1),
+        "server_rss_mb": round((server_rss or 0) / 1024, 1),
+        "server_peak_mb": round((server_hwm or 0) / 1024, 1),
+        "total_rss_mb": round((handler_rss + (server_rss or 0)) / 1024, 1)
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--engines", default="http,inproc", help="comma-separated engines to compare "
+                        "(http, inproc, inproc-spec)")
+    parser.add_argument("--server-bin", default="/app/bin/llama-server")
+    parser.add_argument("--engine-lib", default="/app/lib/libbitnet_engine.so")
+    parser.add_argument("--model", default="/app/models/BitNet-b1.58-2B-4T/ggml-model-i2_s.gguf")
+    parser.add_argument("--variants", default=None,
+                        help="comma-separated model variants to compare instead of --model")
+    parser.add_argument("--models-dir", default=model_registry.MODELS_DIR, help="where --variants are resolved")
+    parser.add_argument("--prompt", default="short", choices=("short", "medium", "long", "rewrite"))
+    parser.add_argument("--n-predict", type=int, default=50)
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--output", default=None, help="also write results JSON here")
+    parser.add_argument("--worker", dest="engine", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--worker-variant", dest="variant", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.engine:
+        worker(args)
+        return 0
+
+    runs = [(engine, None, args.model) for engine in args.engines.split(",")]
+    if args.variants:
+        runs = [(engine, variant, model_registry.model_path(variant, args.models_dir))
+                for variant in args.variants.split(",") for engine in args.engines.split(",")]
+
+    results = []
+    for engine, variant, model in runs:
+        command = [sys.executable, os.path.abspath(__file__), "--worker", engine,
+                   "--server-bin", args.server_bin, "--engine-lib", args.engine_lib, "--model", model,
+                   "--prompt", args.prompt, "--n-predict", str(args.n_predict),
+                   "--repeats", str(args.repeats), "--warmup", str(args.warmup)]
+        if variant:
+            command += ["--worker-variant", variant]
+        completed = subprocess.run(command, capture_output=True, text=True)
+        if completed.returncode != 0:
+            print(f"{engine} {variant or ''}: failed\n{completed.stderr.strip()[-2000:]}", file=sys.stderr)
+            continue
+        results.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+    print(f"{'engine':<12} {'variant':<8} {'e2e p50':>9} {'e2e p95':>9} {'e2e p99':>9} {'gen tok/s':>10} {'accepted':>9} "
+          f"{'handler peak':>13} {'server peak':>12} {'total RSS':>10} {'model MB':>9}")
+    for r in results:
+        accepted = r['draft_acceptance']['p50']
+        print(f"{r['engine']:<12} {r['variant'] or '-':<8} {r['e2e_ms']['p50']:>9.1f} {r['e2e_ms']['p95']:>9.1f} {r['e2e_ms']['p99']:>9.1f} "
+              f"{r['gen_tps']['p50'] or 0:>10.2f} {'-' if accepted is None else f'{accepted:.0%}':>9} "
+              f"{r['handler_peak_mb']:>13.1f} {r['server_peak_mb']:>12.1f} {r['total_rss_mb']:>10.1f} "
+              f"{r['model_mb'] or 0:>9.1f}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Cold model-load time per load strategy.
+
+Starts the handler's ``BitNetServer`` once per strategy and repeat, after
+evicting the model file from the page cache with ``POSIX_FADV_DONTNEED``, and
+reports the spawn-to-ready and spawn-to-model-loaded times, plus how long the
+prefetch itself took. A strategy is a load mode (``mmap``, ``mlock``,
+``no-mmap``) and a prefetch mode (``off``, ``read``, ``fadvise``) joined by
+``+``.
+
+Eviction only drops clean, unmapped pages, so every server is stopped before
+the next eviction. On Lambda the first read additionally pulls blocks from
+the image store, which a local run cannot reproduce. Expect the local gaps
+between strategies to be smaller than on a real cold start.
+
+Usage:
+    # Real binary and model
+    python bench/bench_model_load.py --server real --server-bin /app/bin/llama-server \\
+        --model /app/models/BitNet-b1.58-2B-4T/ggml-model-i2_s.gguf
+
+    # Stub server reading any large file the way llama-server would
+    python bench/bench_model_load.py --model /path/to/large.gguf --speed 20
+"""
+
+import argparse
+import json
+import os
+import sys
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.join(BENCH_DIR, "..", "app")
+sys.path.insert(0, BENCH_DIR)
+
+from stats import summarize  # noqa: E402
+
+DEFAULT_STRATEGIES = "mmap+off,mmap+read,mmap+fadvise,no-mmap+off,no-mmap+read,mlock+read"
+
+
+def configure_environment(args):
+    """Set the handler's environment before it is imported."""
+    if args.server == "stub":
+        os.environ["SERVER_BIN"] = os.path.join(BENCH_DIR, "stub_server.py")
+        os.environ["STUB_SPEED"] = str(args.speed)
+        os.environ["STUB_TOUCH_MODEL"] = "1"
+    else:
+        os.environ["SERVER_BIN"] = args.server_bin
+    os.environ["MODEL_PATH"] = args.model
+    os.environ["STARTUP_MODE"] = "lazy"
+    os.environ["EMF_METRICS"] = "0"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--server", choices=("stub", "real"), default="stub")
+    parser.add_argument("--server-bin", default="/app/bin/llama-server", help="llama-server binary for --server real")
+    parser.add_argument("--model", default="/app/models/BitNet-b1.58-2B-4T/ggml-model-i2_s.gguf")
+    parser.add_argument("--speed", type=float, default=1.0, help="stub replay speed-up factor")
+    parser.add_argument("--strategies", default=DEFAULT_STRATEGIES, help="comma-separated LOAD_MODE+PREFETCH")
+    parser.add_argument("--prefetch-threads", type=int, default=8)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--no-evict", dest="evict", action="store_false",
+                        help="keep the page cache warm between runs")
+    parser.add_argument("--output", default=None, help="also write results JSON here")
+    args = parser.parse_args()
+
+    configure_environment(args)
+    sys.path.insert(0, APP_DIR)
+    import lambda_handler as handler
+    from config import RuntimeConfig
+    from prefetch import evict_file
+
+    size_mb = os.path.getsize(args.model) / 1024 / 1024
+    print(f"{args.model} ({size_mb:.0f} MiB), {args.repeats} runs per strategy, "
+          f"{'evicted' if args.evict else 'warm'} page cache")
+    print(f"{'strategy':<16} {'ready p50':>10} {'ready p95':>10} {'load p50':>10} {'prefetch p50':>13}")
+
+    results = []
+    for strategy in args.strategies.split(","):
+        load_mode, _, prefetch = strategy.partition("+")
+        samples = []
+        for _ in range(args.repeats):
+            if args.evict:
+                evict_file(args.model)
+            config = RuntimeConfig(model_path=args.model, server_bin=os.environ["SERVER_BIN"],
+                                   load_mode=load_mode, prefetch=prefetch or "off",
+                                   prefetch_threads=args.prefetch_threads)
+            server = handler.BitNetServer(config)
+            try:
+                server.start_server()
+                samples.append({
+                    "ready_ms": server.cold_start["ready_ms"],
+                    "model_load_ms": server.cold_start["model_load_ms"],
+                    "prefetch_ms": server.cold_start["prefetch"].get("ms")
+                })
+            finally:
+                server.stop_server()
+        entry = {"strategy": strategy, "load_mode": load_mode, "prefetch": prefetch or "off"}
+        for metric in ("ready_ms", "model_load_ms", "prefetch_ms"):
+            entry[metric] = summarize([s[metric] for s in samples])
+        entry["samples"] = samples
+        results.append(entry)
+
+        def fmt(metric, statistic, width):
+            value = entry[metric][statistic]
+            return f"{value:>{width}.0f}" if value is not None else f"{'-':>{width}}"
+        print(f"{strategy:<16} {fmt('ready_ms', 'p50', 10)} {fmt('ready_ms', 'p95', 10)} "
+              f"{fmt('model_load_ms', 'p50', 10)} {fmt('prefetch_ms', 'p50', 13)}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"model": args.model, "model_mb": round(size_mb, 1), "evict": args.evict,
+                       "server": args.server, "strategies": results}, f, indent=2)
+            f.write("\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
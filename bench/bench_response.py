@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Payload size and serialization cost of the handler's response encodings.
+
+Builds a llama-server style completion result (echoed prompt, full
+``generation_settings``, timings and the handler's metadata blocks) for each
+prompt size. It then encodes it every way ``app/response_format.py`` can:
+all fields or the compact projection, as a JSON string body (the original
+double encoding), a structured body, gzip or msgpack. The reported bytes and
+time include the Lambda runtime's own ``json.dumps`` of the returned
+envelope, since that is what goes over the wire. Decode time is what a
+client spends getting the body back.
+
+Usage:
+    python bench/bench_response.py [--prompt-chars 200,4000,16000] [--content-chars 800] [--repeats 200]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from response_format import decode, encode, parse_encoding, parse_fields, shape  # noqa: E402
+from stats import summarize  # noqa: E402
+
+SCAFFOLD = 'System: You are a helpful assistant. Quote sources "verbatim".\nUser: '
+WORDS = "the model answers with short sentences and \"quoted\" terms, then a newline\n".split(" ")
+
+
+def text_of(chars):
+    words = []
+    length = 0
+    while length < chars:
+        word = WORDS[len(words) % len(WORDS)]
+        words.append(word)
+        length += len(word) + 1
+    return " ".join(words)[:chars]
+
+
+def completion_result(prompt_chars, content_chars):
+    """A result shaped like llama-server's /completion response plus the handler's metadata."""
+    prompt = SCAFFOLD + text_of(max(prompt_chars - len(SCAFFOLD), 0)) + "\nAssistant:"
+    n_prompt = len(prompt) // 4
+    n_predicted = content_chars // 4
+    return {
+        "content": text_of(content_chars),
+        "id_slot": 0,
+        "stop": True,
+        "model": "/app/models/BitNet-b1.58-2B-4T/ggml-model-i2_s.gguf",
+        "tokens_predicted": n_predicted,
+        "tokens_evaluated": n_prompt,
+        "tokens_cached": n_prompt // 2,
+        "generation_settings": {
+            "n_ctx": 2048, "n_predict": -1, "model": "/app/models/BitNet-b1.58-2B-4T/ggml-model-i2_s.gguf",
+            "seed": 4294967295, "temperature": 0.8, "dynatemp_range": 0.0, "dynatemp_exponent": 1.0,
+            "top_k": 40, "top_p": 0.95, "min_p": 0.05, "tfs_z": 1.0, "typical_p": 1.0, "repeat_last_n": 64,
+            "repeat_penalty": 1.0, "presence_penalty": 0.0, "frequency_penalty": 0.0, "penalty_prompt_tokens": [],
+            "use_penalty_prompt_tokens": False, "mirostat": 0, "mirostat_tau": 5.0, "mirostat_eta": 0.1,
+            "penalize_nl": False, "stop": [], "max_tokens": n_predicted, "n_keep": 0, "n_discard": 0,
+            "ignore_eos": False, "stream": True, "logit_bias": [], "n_probs": 0, "min_keep": 0, "grammar": "",
+            "samplers": ["top_k", "tfs_z", "typical_p", "top_p", "min_p", "temperature"]
+        },
+        "prompt": prompt,
+        "stopped_eos": True,
+        "stopped_limit": False,
+        "stopped_word": False,
+        "stop_type": "eos",
+        "stopping_word": "",
+        "truncated": False,
+        "timings": {
+            "prompt_n": n_prompt, "prompt_ms": n_prompt * 8.3, "prompt_per_token_ms": 8.3,
+            "prompt_per_second": 120.5, "predicted_n": n_predicted, "predicted_ms": n_predicted * 48.1,
+            "predicted_per_token_ms": 48.1, "predicted_per_second": 20.8
+        },
+        "stream": {"ttft_ms": 412.7, "chunks": n_predicted, "inter_token_ms": {"p50": 47.9, "p99": 61.2}},
+        "request_ms": n_prompt * 8.3 + n_predicted * 48.1 + 3.2,
+        "server_config": {"threads": 6, "batch_threads": 6, "context_size": 2048, "engine": "http"}
+    }
+
+
+def legacy(result):
+    """The handler's original response: the result as a JSON string body."""
+    return {"statusCode": 200, "body": json.dumps(result)}
+
+
+def time_us(function, repeats):
+    samples = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        function()
+        samples.append((time.perf_counter() - started) * 1e6)
+    return summarize(samples)["p50"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--prompt-chars", default="200,4000,16000", help="echoed prompt sizes to try")
+    parser.add_argument("--content-chars", type=int, default=800, help="generated text size")
+    parser.add_argument("--repeats", type=int, default=200)
+    parser.add_argument("--gzip-min-bytes", type=int, default=1024)
+    parser.add_argument("--output", default=None, help="also write the rows as JSON here")
+    args = parser.parse_args()
+
+    encodings = ["json", "object", "gzip", "msgpack"]
+    try:
+        parse_encoding("msgpack")
+    except ValueError:
+        encodings.remove("msgpack")
+        print("(msgpack not installed, skipping msgpack)")
+
+    rows = []
+    print(f"{'prompt':>7} {'fields':<8} {'encoding':<8} {'bytes':>8} {'vs legacy':>9} {'encode us':>10} "
+          f"{'decode us':>10}")
+    for prompt_chars in [int(v) for v in args.prompt_chars.split(",") if v]:
+        result = completion_result(prompt_chars, args.content_chars)
+        variants = [("legacy", "all", lambda: legacy(result))]
+        for fields_name in ("all", "compact"):
+            fields = parse_fields(fields_name)
+            for encoding in encodings:
+                variants.append((encoding, fields_name, lambda f=fields, e=encoding: encode(
+                    shape(result, f), encoding=e, gzip_min_bytes=args.gzip_min_bytes)))
+
+        baseline = None
+        for encoding, fields_name, build in variants:
+            # What the Lambda runtime sends: its own json.dumps of the envelope
+            wire = json.dumps(build())
+            baseline = baseline or len(wire)
+            encode_us = time_us(lambda: json.dumps(build()), args.repeats)
+            decode_us = time_us(lambda: decode(json.loads(wire)), args.repeats)
+            row = {"prompt_chars": prompt_chars, "fields": fields_name, "encoding": encoding, "bytes": len(wire),
+                   "ratio": round(len(wire) / baseline, 3), "encode_us": encode_us, "decode_us": decode_us}
+            rows.append(row)
+            print(f"{prompt_chars:>7} {fields_name:<8} {encoding:<8} {row['bytes']:>8} {row['ratio']:>9.3f} "
+                  f"{encode_us:>10.1f} {decode_us:>10.1f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(rows, f, indent=2)
+            f.write("\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+CPU cost of capturing llama-server output in the handler process.
+
+Spawns a child that writes ``--lines`` lines of llama-server style output
+(slot updates, timings and the occasional warning) and measures the handler
+process CPU time spent consuming them, two ways:
+
+- ``legacy``: line-buffered text pipe, every line through ``logger.info``
+  (the handler's original behaviour)
+- ``server_log``: block reads into ``ServerLog``'s ring buffer, logging only
+  warnings and errors
+
+Log records go to a stream handler on /dev/null formatted like the Lambda
+runtime's, so formatting and write costs are included but nothing is printed.
+
+Usage:
+    python bench/bench_server_log.py [--lines 20000] [--repeats 3]
+"""
+
+import argparse
+import logging
+import os
+import resource
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from server_log import ServerLog  # noqa: E402
+
+# Roughly the mix llama-server prints while serving requests
+GENERATOR = r"""
+import sys
+lines = [
+    "slot launch_slot_: id  0 | task {i} | processing task",
+    "slot update_slots: id  0 | task {i} | kv cache rm [0, end)",
+    "slot update_slots: id  0 | task {i} | prompt processing progress, n_past = 18, n_tokens = 18, progress = 1.000000",
+    "slot print_timing: id  0 | task {i} | prompt eval time =     148.67 ms /    18 tokens (    8.26 ms per token,   121.07 tokens per second)",
+    "slot print_timing: id  0 | task {i} | eval time =    1024.11 ms /    50 tokens (   20.48 ms per token,    48.82 tokens per second)",
+    "slot      release: id  0 | task {i} | stop processing: n_past = 67, truncated = 0",
+    "srv  update_slots: all slots are idle",
+    "srv  log_server_request: request: POST /completion 127.0.0.1 200",
+    "W warn: slot context shift, n_keep = 0, n_left = 2046, n_discard = 1023",
+]
+out = sys.stdout
+for i in range(int(sys.argv[1])):
+    out.write(lines[i % len(lines)].format(i=i // len(lines)) + "\n")
+out.flush()
+"""
+
+
+def cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def spawn(n_lines, text):
+    kwargs = {"text": True, "bufsize": 1} if text else {}
+    return subprocess.Popen([sys.executable, "-c", GENERATOR, str(n_lines)],
+                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, **kwargs)
+
+
+def run_legacy(n_lines):
+    process = spawn(n_lines, text=True)
+    logger = logging.getLogger()
+    for line in iter(process.stdout.readline, ''):
+        if line.strip():
+            logger.info(f"BitNet Server: {line.strip()}")
+    process.wait()
+    return {}
+
+
+def run_server_log(n_lines):
+    process = spawn(n_lines, text=False)
+    server_log = ServerLog()
+    server_log.capture(process.stdout)
+    process.wait()
+    return server_log.counts
+
+
+STRATEGIES = {"legacy": run_legacy, "server_log": run_server_log}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lines", type=int, default=20000)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    handler = logging.StreamHandler(open(os.devnull, "w"))
+    handler.setFormatter(logging.Formatter("[%(levelname)s]\t%(asctime)s.%(msecs)03dZ\t%(message)s"))
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(logging.INFO)
+
+    print(f"{args.lines} lines per run, best of {args.repeats}")
+    print(f"{'strategy':<12} {'cpu ms':>9} {'us/line':>9} {'wall ms':>9}  logged")
+    for name, strategy in STRATEGIES.items():
+        best = None
+        for _ in range(args.repeats):
+            cpu_before, wall_before = cpu_seconds(), time.perf_counter()
+            counts = strategy(args.lines)
+            cpu_ms = (cpu_seconds() - cpu_before) * 1000
+            wall_ms = (time.perf_counter() - wall_before) * 1000
+            if best is None or cpu_ms < best[0]:
+                best = (cpu_ms, wall_ms, counts)
+        cpu_ms, wall_ms, counts = best
+        logged = counts.get("echoed", args.lines) if counts else args.lines
+        print(f"{name:<12} {cpu_ms:>9.1f} {cpu_ms * 1000 / args.lines:>9.2f} {wall_ms:>9.1f}  {logged}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
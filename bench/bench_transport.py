@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Transport micro-benchmark.
+
+Measures per-call overhead of talking to llama-server the old way (a fresh
+``requests`` connection per call) against the pooled ``http.client``
+transport used by the handler, plus the import cost of each client on a cold
+interpreter.
+
+By default it runs against a local keep-alive HTTP server that answers like a
+finished llama-server completion, so only transport overhead is measured. Pass
+``--port`` to target a running llama-server's ``/health`` endpoint instead.
+
+Usage:
+    python bench/bench_transport.py [--calls 500] [--port 8080]
+"""
+
+import argparse
+import http.client
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from transport import ServerTransport  # noqa: E402
+
+# A short completion response, roughly what n_predict=10 returns
+CANNED_BODY = json.dumps({
+    "content": " 1-bit quantization stores each weight in a single bit.",
+    "stop": True,
+    "timings": {"prompt_n": 18, "prompt_ms": 410.0, "predicted_n": 10, "predicted_ms": 980.0},
+}).encode("utf-8")
+
+
+class _CannedHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(CANNED_BODY)))
+        self.end_headers()
+        self.wfile.write(CANNED_BODY)
+
+    def do_GET(self):
+        self._reply()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self._reply()
+
+
+def start_canned_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _CannedHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def time_calls(call, calls):
+    samples = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        call()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def import_cost(module, runs=5):
+    """Median wall time in ms to import ``module`` in a fresh interpreter."""
+    code = f"import time; t = time.perf_counter(); import {module}; print((time.perf_counter() - t) * 1000)"
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+        if out.returncode != 0:
+            return None
+        samples.append(float(out.stdout.strip()))
+    return statistics.median(samples)
+
+
+def summarize(name, samples):
+    samples = sorted(samples)
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    print(f"{name:<34} {statistics.median(samples):>9.3f} {statistics.mean(samples):>9.3f} {p99:>9.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=500, help="calls per transport")
+    parser.add_argument("--port", type=int, default=None, help="benchmark a running llama-server on this port")
+    args = parser.parse_args()
+
+    if args.port:
+        port, method, path, payload = args.port, "GET", "/health", None
+    else:
+        server = start_canned_server()
+        port = server.server_address[1]
+        method, path, payload = "POST", "/completion", {"prompt": "User: hi\n\nAssistant:", "n_predict": 10}
+
+    print(f"Target: 127.0.0.1:{port} {method} {path}, {args.calls} calls each")
+    print(f"{'transport':<34} {'p50 ms':>9} {'mean ms':>9} {'p99 ms':>9}")
+
+    def fresh_http_client():
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        body = json.dumps(payload).encode("utf-8") if payload is not None else None
+        conn.request(method, path, body=body, headers={"Content-Type": "application/json"})
+        conn.getresponse().read()
+        conn.close()
+
+    try:
+        import requests
+    except ImportError:
+        requests = None
+        print("(requests not installed, skipping the per-call requests baseline)")
+
+    if requests is not None:
+        url = f"http://127.0.0.1:{port}{path}"
+        if payload is None:
+            summarize("requests, new connection per call", time_calls(lambda: requests.get(url, timeout=30), args.calls))
+        else:
+            summarize("requests, new connection per call",
+                      time_calls(lambda: requests.post(url, json=payload, timeout=30), args.calls))
+
+    summarize("http.client, new connection", time_calls(fresh_http_client, args.calls))
+
+    transport = ServerTransport(port=port)
+    summarize("ServerTransport, pooled keep-alive",
+              time_calls(lambda: transport.request(method, path, payload, timeout=30), args.calls))
+    transport.close()
+
+    print()
+    print(f"{'cold import':<34} {'ms':>9}")
+    for module in ("requests", "http.client"):
+        cost = import_cost(module)
+        print(f"{module:<34} {cost:>9.2f}" if cost is not None else f"{module:<34} {'n/a':>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Aggregate the per-invocation EMF metric lines the handler writes.
+
+Reads captured logs and picks out every CloudWatch Embedded Metric Format
+record, then reports each metric's count, mean and p50/p95/p99 per group
+(cold vs warm start by default). The same numbers are available in
+CloudWatch, but this also works offline on logs from local runs.
+
+Accepted input, from files or stdin:
+  - raw handler stdout, one JSON record per line
+  - ``aws logs tail`` output (a timestamp and stream name before the JSON)
+  - ``aws logs filter-log-events --output json`` documents
+
+Usage:
+    aws logs tail /aws/lambda/<function> --since 1h > invocations.log
+    python bench/emf_report.py invocations.log
+    python bench/emf_report.py invocations.log --group-by RequestKind --json
+"""
+
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stats import summarize  # noqa: E402
+
+# Metrics shown in the table, in order; --json includes every metric found
+REPORTED_METRICS = [
+    "HandlerDuration",
+    "StartupWait",
+    "ServerCompute",
+    "Overhead",
+    "PromptTokensPerSecond",
+    "GenerationTokensPerSecond",
+    "PromptCacheReuse",
+    "Headroom",
+    "RemainingTime",
+]
+
+
+def parse_record(text):
+    """Return the EMF record in a log line, or None."""
+    start = text.find("{")
+    if start < 0 or '"_aws"' not in text:
+        return None
+    try:
+        record = json.loads(text[start:])
+    except ValueError:
+        return None
+    if not isinstance(record, dict) or "_aws" not in record:
+        return None
+    return record
+
+
+def read_records(stream):
+    text = stream.read()
+    # A filter-log-events document wraps each log line in an event's "message"
+    try:
+        document = json.loads(text)
+    except ValueError:
+        document = None
+    if isinstance(document, dict) and "events" in document:
+        lines = [event.get("message", "") for event in document["events"]]
+    else:
+        lines = text.splitlines()
+    return [record for record in map(parse_record, lines) if record is not None]
+
+
+def metric_names(record):
+    names = []
+    for directive in record["_aws"].get("CloudWatchMetrics", []):
+        names.extend(metric["Name"] for metric in directive.get("Metrics", []))
+    return names
+
+
+def aggregate(records, group_by):
+    """Per-group invocation counts, rates and metric summaries."""
+    groups = {}
+    for record in records:
+        groups.setdefault(str(record.get(group_by, "-")), []).append(record)
+
+    report = {}
+    for group, members in sorted(groups.items()):
+        names = []
+        for record in members:
+            names.extend(name for name in metric_names(record) if name not in names)
+        entry = {
+            "invocations": len(members),
+            "error_rate": round(sum(r.get("Error", 0) for r in members) / len(members), 4),
+            "cold_start_rate": round(sum(r.get("ColdStart", 0) for r in members) / len(members), 4),
+            "response_cache_hits": sum(r.get("ResponseCacheHit", 0) for r in members),
+            "prefix_cache_hits": sum(r.get("PrefixCacheHit", 0) for r in members),
+            "metrics": {}
+        }
+        for name in names:
+            entry["metrics"][name] = summarize([r.get(name) for r in members])
+        report[group] = entry
+    return report
+
+
+def print_table(report, group_by):
+    for group, entry in report.items():
+        print(f"{group_by}={group}: {entry['invocations']} invocations, "
+              f"error rate {entry['error_rate'] * 100:.1f}%, cold starts {entry['cold_start_rate'] * 100:.1f}%, "
+              f"cache hits {entry['response_cache_hits']} response / {entry['prefix_cache_hits']} prefix")
+        print(f"  {'metric':<28} {'count':>6} {'mean':>11} {'p50':>11} {'p95':>11} {'p99':>11}")
+        for name in REPORTED_METRICS:
+            summary = entry["metrics"].get(name)
+            if not summary or not summary["count"]:
+                continue
+            print(f"  {name:<28} {summary['count']:>6} {summary['mean']:>11.2f} {summary['p50']:>11.2f} "
+                  f"{summary['p95']:>11.2f} {summary['p99']:>11.2f}")
+        print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("logs", nargs="*", help="log files (default: stdin)")
+    parser.add_argument("--group-by", default="StartType",
+                        help="record field to group by, e.g. StartType, RequestKind, FunctionName")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    records = []
+    if args.logs:
+        for path in args.logs:
+            with open(path) as f:
+                records.extend(read_records(f))
+    else:
+        records = read_records(sys.stdin)
+    if not records:
+        print("No EMF records found", file=sys.stderr)
+        return 1
+
+    report = aggregate(records, args.group_by)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_table(report, args.group_by)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
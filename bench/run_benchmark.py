@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark of the Lambda handler, run locally and in-process.
+
+Drives ``lambda_handler.lambda_handler`` directly, against either the real
+llama-server binary or ``bench/stub_server.py`` replaying recorded timings.
+It measures cold start (first invocation on a fresh server), then, for every
+prompt x n_predict cell, end-to-end latency, time to first token, and prompt
+and generation tokens/s, each reported as mean and p50/p95/p99.
+
+Results are written as JSON. Passing ``--baseline`` compares them against a
+stored run and exits non-zero when any tracked metric regresses by more than
+``--tolerance``.
+
+Usage:
+    # Stub server, replayed 20x faster than the recorded 2 GB timings
+    python bench/run_benchmark.py --speed 20 --output bench-results.json
+
+    # Real binary and model, gated against a baseline
+    python bench/run_benchmark.py --server real --server-bin /app/bin/llama-server \\
+        --model /app/models/BitNet-b1.58-2B-4T/ggml-model-i2_s.gguf \\
+        --baseline bench/baselines/local.json
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import uuid
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.join(BENCH_DIR, "..", "app")
+sys.path.insert(0, BENCH_DIR)
+
+from stats import summarize  # noqa: E402
+
+QUESTION = "User: What's the difference between 1-bit and 8-bit quantization?\n\nAssistant:"
+CONTEXT_PARAGRAPH = (
+    "Quantization maps the weights of a neural network onto a small set of values so the model "
+    "needs less memory and less arithmetic. Eight-bit quantization keeps 256 levels per weight and "
+    "is close to lossless for most models. Ternary or 1.58-bit quantization keeps only -1, 0 and +1, "
+    "which turns matrix multiplication into additions and subtractions. "
+)
+PROMPTS = {
+    "short": QUESTION,
+    "medium": "Context: " + CONTEXT_PARAGRAPH * 3 + "\n\n" + QUESTION,
+    "long": "Context: " + CONTEXT_PARAGRAPH * 10 + "\n\n" + QUESTION,
+    # Output that mostly copies the prompt, where prompt-lookup drafts pay off
+    "rewrite": "User: Repeat this paragraph, fixing any typos:\n" + CONTEXT_PARAGRAPH + "\n\nAssistant:",
+}
+
+# (metric, statistic, direction): a regression is a move in the wrong direction
+TRACKED_METRICS = [
+    ("e2e_ms", "p50", "lower"),
+    ("e2e_ms", "p95", "lower"),
+    ("ttft_ms", "p50", "lower"),
+    ("prompt_tps", "p50", "higher"),
+    ("gen_tps", "p50", "higher"),
+]
+
+
+class FakeContext:
+    """Just enough of the Lambda context object for the handler."""
+
+    def __init__(self, timeout_ms=900000):
+        self.aws_request_id = str(uuid.uuid4())
+        self.function_name = "bitnet-lambda-local-bench"
+        self.memory_limit_in_mb = os.environ.get("AWS_LAMBDA_FUNCTION_MEMORY_SIZE", "0")
+        self._deadline = time.time() * 1000 + timeout_ms
+
+    def get_remaining_time_in_millis(self):
+        return int(self._deadline - time.time() * 1000)
+
+
+def configure_environment(args):
+    """Set the handler's environment before it is imported."""
+    if args.server == "stub":
+        os.environ["SERVER_BIN"] = os.path.join(BENCH_DIR, "stub_server.py")
+        os.environ["STUB_PROFILE"] = os.path.abspath(args.profile)
+        os.environ["STUB_SPEED"] = str(args.speed)
+    else:
+        os.environ["SERVER_BIN"] = args.server_bin
+    if args.model:
+        os.environ["MODEL_PATH"] = args.model
+    os.environ.setdefault("STARTUP_MODE", "lazy")
+    # EMF lines would interleave with the JSON results on stdout
+    os.environ.setdefault("EMF_METRICS", "0")
+    for item in args.env:
+        key, _, value = item.partition("=")
+        os.environ[key] = value
+
+
+def invoke(handler, event):
+    started = time.perf_counter()
+    response = handler.lambda_handler(event, FakeContext())
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    if response["statusCode"] != 200:
+        raise RuntimeError(f"Invocation failed ({response['statusCode']}): {response['body']}")
+    body = response["body"]
+    return elapsed_ms, json.loads(body) if isinstance(body, str) else body
+
+
+def sample_from(elapsed_ms, result):
+    timings = result.get("timings", {})
+    return {
+        "e2e_ms": round(elapsed_ms, 3),
+        "ttft_ms": (result.get("stream") or {}).get("ttft_ms"),
+        "prompt_tps": timings.get("prompt_per_second") or None,
+        "gen_tps": timings.get("predicted_per_second") or None,
+        "prompt_tokens": timings.get("prompt_n"),
+        "tokens_predicted": result.get("tokens_predicted", timings.get("predicted_n"))
+    }
+
+
+def reset_server(handler):
+    """Stop the running server so the next invocation is a cold start."""
+    handler.cleanup()
+    handler.bitnet_server = None
+    handler.server_startup = None
+    handler.invocation_count = 0
+
+
+def run(args):
+    configure_environment(args)
+    sys.path.insert(0, APP_DIR)
+    import lambda_handler as handler
+
+    prompt_names = args.prompts.split(",")
+    n_predicts = [int(n) for n in args.n_predict.split(",")]
+    unknown = [name for name in prompt_names if name not in PROMPTS]
+    if unknown:
+        raise SystemExit(f"Unknown prompts {unknown}; choose from {sorted(PROMPTS)}")
+
+    def event_for(name, n_predict, nonce):
+        prompt = PROMPTS[name]
+        if args.unique_prompts:
+            # A unique first line defeats llama-server's prompt cache, so every
+            # sample pays for prompt evaluation
+            prompt = f"[{nonce}]\n{prompt}"
+        return {"prompt": prompt, "n_predict": n_predict, "stream": args.stream}
+
+    cold_samples = []
+    for i in range(args.cold_starts):
+        reset_server(handler)
+        elapsed_ms, result = invoke(handler, event_for(prompt_names[0], n_predicts[0], f"cold-{i}"))
+        sample = sample_from(elapsed_ms, result)
+        sample.update(result.get("cold_start") or {})
+        cold_samples.append(sample)
+        print(f"cold start {i + 1}/{args.cold_starts}: {elapsed_ms:.0f} ms", file=sys.stderr)
+
+    server_config = handler.bitnet_server.config.as_dict() if handler.bitnet_server else None
+
+    cells = []
+    for name in prompt_names:
+        for n_predict in n_predicts:
+            for i in range(args.warmup):
+                invoke(handler, event_for(name, n_predict, f"warmup-{name}-{n_predict}-{i}"))
+            samples = []
+            for i in range(args.repeats):
+                elapsed_ms, result = invoke(handler, event_for(name, n_predict, f"{name}-{n_predict}-{i}"))
+                samples.append(sample_from(elapsed_ms, result))
+            cell = {"prompt": name, "prompt_chars": len(PROMPTS[name]), "n_predict": n_predict}
+            for metric in ("e2e_ms", "ttft_ms", "prompt_tps", "gen_tps"):
+                cell[metric] = summarize([s[metric] for s in samples])
+            cell["samples"] = samples
+            cells.append(cell)
+            print(f"{name:<8} n_predict={n_predict:<5} e2e p50 {cell['e2e_ms']['p50']} ms", file=sys.stderr)
+
+    reset_server(handler)
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "server": args.server,
+            "profile": os.path.relpath(args.profile) if args.server == "stub" else None,
+            "speed": args.speed if args.server == "stub" else None,
+            "memory_mb": args.memory_mb,
+            "stream": args.stream,
+            "repeats": args.repeats,
+            "server_config": server_config
+        },
+        "cold_start": {
+            "e2e_ms": summarize([s["e2e_ms"] for s in cold_samples]),
+            "ready_ms": summarize([s.get("ready_ms") for s in cold_samples]),
+            "model_load_ms": summarize([s.get("model_load_ms") for s in cold_samples]),
+            "samples": cold_samples
+        },
+        "cells": cells
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Return a list of regression messages against ``baseline``."""
+    regressions = []
+
+    def check(label, current, previous, direction):
+        if current is None or previous is None or previous == 0:
+            return
+        change = (current - previous) / previous
+        worse = change > tolerance if direction == "lower" else change < -tolerance
+        marker = "REGRESSION" if worse else "ok"
+        print(f"{label:<40} {previous:>12.2f} {current:>12.2f} {change * 100:>+8.1f}%  {marker}")
+        if worse:
+            regressions.append(f"{label} moved {change * 100:+.1f}% (baseline {previous:.2f}, now {current:.2f})")
+
+    print(f"{'metric':<40} {'baseline':>12} {'current':>12} {'change':>9}")
+    check("cold_start e2e_ms p50", results["cold_start"]["e2e_ms"]["p50"],
+          baseline.get("cold_start", {}).get("e2e_ms", {}).get("p50"), "lower")
+    previous_cells = {(c["prompt"], c["n_predict"]): c for c in baseline.get("cells", [])}
+    for cell in results["cells"]:
+        previous = previous_cells.get((cell["prompt"], cell["n_predict"]))
+        if previous is None:
+            continue
+        for metric, statistic, direction in TRACKED_METRICS:
+            check(f"{cell['prompt']}/{cell['n_predict']} {metric} {statistic}",
+                  cell[metric][statistic], previous.get(metric, {}).get(statistic), direction)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--server", choices=("stub", "real"), default="stub")
+    parser.add_argument("--server-bin", default="/app/bin/llama-server", help="llama-server binary for --server real")
+    parser.add_argument("--model", default=None, help="GGUF path (sets MODEL_PATH)")
+    parser.add_argument("--profile", default=os.path.join(BENCH_DIR, "profiles", "lambda-2048mb.json"),
+                        help="timing profile replayed by the stub server")
+    parser.add_argument("--speed", type=float, default=1.0, help="stub replay speed-up factor")
+    parser.add_argument("--prompts", default="short,medium", help=f"comma-separated, from {sorted(PROMPTS)}")
+    parser.add_argument("--n-predict", default="10,50", help="comma-separated n_predict values")
+    parser.add_argument("--repeats", type=int, default=5, help="measured invocations per cell")
+    parser.add_argument("--warmup", type=int, default=1, help="unmeasured invocations per cell")
+    parser.add_argument("--cold-starts", type=int, default=1)
+    parser.add_argument("--no-stream", dest="stream", action="store_false",
+                        help="use blocking completions (no time-to-first-token)")
+    parser.add_argument("--reuse-prompts", dest="unique_prompts", action="store_false",
+                        help="let llama-server's prompt cache serve repeated prompts")
+    parser.add_argument("--memory-mb", type=int, default=None, help="label results with a Lambda memory size")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="extra handler environment, e.g. --env THREADS=2")
+    parser.add_argument("--output", default=None, help="write results JSON here (default: stdout)")
+    parser.add_argument("--baseline", default=None, help="results JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed relative change before failing")
+    args = parser.parse_args()
+
+    results = run(args)
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.tolerance * 100:.0f}%:", file=sys.stderr)
+            for message in regressions:
+                print(f"  {message}", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,30 @@
+"""Small statistics helpers shared by the benchmark and analysis scripts."""
+
+import math
+
+
+def percentile(values, q):
+    """Linearly interpolated percentile, ``q`` in [0, 100]."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    if len(ordered) == 1:
+        return ordered[0]
+    rank = (len(ordered) - 1) * q / 100
+    low = math.floor(rank)
+    high = math.ceil(rank)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def summarize(values):
+    """Count, mean and p50/p95/p99 of a list of numbers (None values are dropped)."""
+    values = [v for v in values if v is not None]
+    if not values:
+        return {"count": 0, "mean": None, "p50": None, "p95": None, "p99": None}
+    return {
+        "count": len(values),
+        "mean": round(sum(values) / len(values), 3),
+        "p50": round(percentile(values, 50), 3),
+        "p95": round(percentile(values, 95), 3),
+        "p99": round(percentile(values, 99), 3)
+    }
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Stand-in for the Hugging Face file host, for testing ``cdk/model_fetch.py``.
+
+Serves one local file the way Hugging Face serves an LFS file: the
+``/<repo>/resolve/<revision>/<filename>`` URL answers with a redirect and
+``X-Linked-Size``/``X-Linked-Etag`` (the file's SHA-256), and the redirect
+target honours range requests. Faults can be injected to exercise resume and
+verification:
+
+- ``--drop-after BYTES`` closes the connection after sending that many
+  bytes of a response, so chunks fail partway. ``--drop-count`` limits how
+  many responses are cut (``-1``, the default, cuts all of them).
+- ``--corrupt`` flips a byte in what is served without changing the
+  advertised digest.
+- ``--no-ranges`` ignores Range headers, like a server without range support.
+- ``--throttle`` caps each response at that many KiB/s.
+- ``--no-digest`` leaves out ``X-Linked-Etag`` and ``ETag``, like a mirror or
+  proxy that does not pass them on.
+
+Usage:
+    python bench/stub_model_host.py --file temp/models/BitNet-b1.58-2B-4T/ggml-model-i2_s.gguf --port 8765
+    HF_ENDPOINT=http://127.0.0.1:8765 python cdk/model_fetch.py --repo-id microsoft/bitnet-b1.58-2B-4T-gguf \\
+        --filename ggml-model-i2_s.gguf --dest /tmp/model.gguf --cache-dir /tmp/model-cache
+"""
+
+import argparse
+import hashlib
+import os
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class ModelHostHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            sys.stderr.write(f"{self.address_string()} {format % args}\n")
+
+    def _send_headers(self, status, headers):
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, str(value))
+        self.end_headers()
+
+    def _resolve(self, head):
+        if not re.fullmatch(r"/.+/resolve/[^/]+/" + re.escape(self.server.filename), self.path):
+            self._send_headers(404, {"Content-Length": 0})
+            return
+        headers = {
+            "Location": f"/blobs/{self.server.digest}",
+            "X-Linked-Size": self.server.size,
+            "X-Linked-Etag": f'"{self.server.digest}"',
+            "Content-Length": 0
+        }
+        if self.server.no_digest:
+            del headers["X-Linked-Etag"]
+        self._send_headers(302, headers)
+
+    def _blob(self, head):
+        size = self.server.size
+        start, end = 0, size - 1
+        status = 200
+        match = re.fullmatch(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+        if match and not self.server.no_ranges:
+            start = int(match.group(1))
+            end = min(int(match.group(2)) if match.group(2) else size - 1, size - 1)
+            status = 206
+        headers = {"Content-Length": end + 1 - start}
+        if not self.server.no_digest:
+            headers["ETag"] = f'"{self.server.digest}"'
+        if not self.server.no_ranges:
+            headers["Accept-Ranges"] = "bytes"
+        if status == 206:
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        self._send_headers(status, headers)
+        if head:
+            return
+
+        limit = None
+        with self.server.lock:
+            if self.server.drops_left != 0:
+                self.server.drops_left -= 1
+                limit = self.server.drop_after
+        sent = 0
+        with open(self.server.path, "rb") as f:
+            f.seek(start)
+            offset = start
+            while offset <= end:
+                block = f.read(min(256 * 1024, end + 1 - offset))
+                if self.server.corrupt and offset <= size // 2 < offset + len(block):
+                    i = size // 2 - offset
+                    block = block[:i] + bytes([block[i] ^ 0xFF]) + block[i + 1:]
+                if limit is not None and sent + len(block) > limit:
+                    self.wfile.write(block[:limit - sent])
+                    self.close_connection = True
+                    return
+                self.wfile.write(block)
+                sent += len(block)
+                offset += len(block)
+                if self.server.throttle:
+                    time.sleep(len(block) / self.server.throttle)
+
+    def _dispatch(self, head):
+        if self.path.startswith("/blobs/"):
+            self._blob(head)
+        else:
+            self._resolve(head)
+
+    def do_HEAD(self):
+        self._dispatch(head=True)
+
+    def do_GET(self):
+        self._dispatch(head=False)
+
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(8 * 1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--file", required=True, help="file to serve")
+    parser.add_argument("--filename", default=None, help="name to serve it under (default: its basename)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--drop-after", type=int, default=None, help="cut responses after this many bytes")
+    parser.add_argument("--drop-count", type=int, default=-1, help="how many responses to cut (-1: all)")
+    parser.add_argument("--corrupt", action="store_true", help="serve one flipped byte")
+    parser.add_argument("--no-ranges", action="store_true", help="ignore Range headers")
+    parser.add_argument("--throttle", type=int, default=0, help="KiB/s per response (0: unlimited)")
+    parser.add_argument("--no-digest", action="store_true", help="send no X-Linked-Etag or ETag")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), ModelHostHandler)
+    server.daemon_threads = True
+    server.path = args.file
+    server.filename = args.filename or os.path.basename(args.file)
+    server.size = os.path.getsize(args.file)
+    server.digest = sha256_file(args.file)
+    server.drop_after = args.drop_after
+    server.drops_left = args.drop_count if args.drop_after is not None else 0
+    server.corrupt = args.corrupt
+    server.no_ranges = args.no_ranges
+    server.throttle = args.throttle * 1024
+    server.no_digest = args.no_digest
+    server.verbose = args.verbose
+    server.lock = threading.Lock()
+    print(f"Serving {server.filename} ({server.size} bytes, sha256 {server.digest}) "
+          f"on http://{args.host}:{server.server_address[1]}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
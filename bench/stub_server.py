@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+"""
+Stand-in for llama-server that replays recorded timings.
+
+Accepts the same command line as llama-server (unknown flags are ignored),
+prints llama-server style log lines and serves the endpoints the handler
+uses: ``/health``, ``/completion`` (blocking and streamed), ``/tokenize``,
+``/slots/<id>?action=save|restore`` and ``/embedding``. Instead of running a
+model it sleeps for as long as the recorded profile says the real server
+took, so the handler can be benchmarked locally without the binary or the
+GGUF.
+
+Point the handler at it with ``SERVER_BIN=bench/stub_server.py``. The
+timing profile is read from ``STUB_PROFILE`` (default
+``bench/profiles/lambda-2048mb.json``). ``STUB_SPEED`` divides every delay,
+so a speed of 10 replays ten times faster. With ``STUB_TOUCH_MODEL=1`` the
+stub also reads the model file the way llama-server loads it (page by page
+through mmap, or sequentially with ``--no-mmap``), so page-cache effects on
+load time show up.
+"""
+
+import json
+import mmap
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_PROFILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiles", "lambda-2048mb.json")
+
+
+def load_profile():
+    with open(os.environ.get("STUB_PROFILE", DEFAULT_PROFILE)) as f:
+        profile = json.load(f)
+    speed = float(os.environ.get("STUB_SPEED", "1"))
+    for key in ("load_ms", "prompt_ms_per_token", "predicted_ms_per_token", "request_overhead_ms"):
+        profile[key] = profile.get(key, 0) / speed
+    return profile
+
+
+def tokenize(text):
+    """Cheap stand-in tokenizer: one token per word piece of up to four characters."""
+    tokens = []
+    for word in text.split():
+        for i in range(0, len(word), 4):
+            tokens.append(word[i:i + 4])
+    return tokens
+
+
+def touch_model(path, no_mmap):
+    """Read the model file like llama-server's loader; returns bytes read."""
+    total = 0
+    with open(path, "rb") as f:
+        if no_mmap:
+            while True:
+                block = f.read(1024 * 1024)
+                if not block:
+                    return total
+                total += len(block)
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return 0
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            # One byte per page faults every page in, from a single thread
+            for offset in range(0, size, mmap.PAGESIZE):
+                total += mapped[offset] >= 0
+        return size
+
+
+def log(message):
+    print(message, flush=True)
+
+
+class StubState:
+    def __init__(self, args, profile):
+        self.args = args
+        self.profile = profile
+        self.ready = threading.Event()
+        self.lock = threading.Lock()
+        # slot id -> tokens whose KV state the slot holds
+        self.slots = {i: [] for i in range(max(1, args.parallel))}
+        self.busy = set()
+        self.active = 0
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state = None
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_GET(self):
+        if self.path == "/health":
+            if self.state.ready.is_set():
+                self._send_json(200, {"status": "ok"})
+            else:
+                self._send_json(503, {"error": {"code": 503, "message": "Loading model"}})
+        elif self.path == "/slots":
+            self._send_json(200, [{"id": i, "n_ctx": self.state.args.ctx_size // len(self.state.slots)}
+                                  for i in self.state.slots])
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        request = self._read_json()
+        if not self.state.ready.is_set():
+            self._send_json(503, {"error": {"code": 503, "message": "Loading model"}})
+        elif self.path == "/completion":
+            self._completion(request)
+        elif self.path == "/tokenize":
+            self._send_json(200, {"tokens": list(range(len(tokenize(request.get("content", "")))))})
+        elif self.path.startswith("/slots/"):
+            self._slot_action(request)
+        elif self.path in ("/embedding", "/embeddings"):
+            self._embedding(request)
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def _acquire_slot(self, requested):
+        state = self.state
+        while True:
+            with state.lock:
+                if requested is not None and requested >= 0:
+                    if requested not in state.busy:
+                        state.busy.add(requested)
+                        state.active += 1
+                        return requested
+                else:
+                    idle = [i for i in state.slots if i not in state.busy]
+                    if idle:
+                        slot = idle[0]
+                        state.busy.add(slot)
+                        state.active += 1
+                        return slot
+            time.sleep(0.001)
+
+    def _release_slot(self, slot):
+        with self.state.lock:
+            self.state.busy.discard(slot)
+            self.state.active -= 1
+
+    def _token_delay(self):
+        # Continuous batching shares one forward pass, so each extra active
+        # sequence only adds a fraction of a token's cost
+        profile = self.state.profile
+        extra = max(0, self.state.active - 1) * profile.get("batch_slowdown", 0.15)
+        return profile["predicted_ms_per_token"] * (1 + extra) / 1000
+
+    def _completion(self, request):
+        if self.state.args.embedding:
+            # As llama-server does once started with --embedding
+            self._send_json(501, {"error": {"code": 501, "type": "not_supported_error",
+                                            "message": "This server does not support completions. "
+                                                       "Start it without `--embedding`"}})
+            return
+        state = self.state
+        profile = state.profile
+        prompt_tokens = tokenize(request.get("prompt", ""))
+        n_predict = int(request.get("n_predict", -1))
+        if n_predict < 0:
+            n_predict = profile.get("default_n_predict", 64)
+        slot = self._acquire_slot(request.get("id_slot"))
+        try:
+            cached = state.slots[slot]
+            reused = 0
+            if request.get("cache_prompt"):
+                while reused < min(len(cached), len(prompt_tokens)) and cached[reused] == prompt_tokens[reused]:
+                    reused += 1
+            evaluated = len(prompt_tokens) - reused
+            prompt_ms = evaluated * profile["prompt_ms_per_token"]
+            time.sleep((profile["request_overhead_ms"] + prompt_ms) / 1000)
+
+            words = profile.get("vocabulary", ["token"])
+            pieces = [" " + words[i % len(words)] for i in range(n_predict)]
+            started = time.perf_counter()
+            if request.get("stream"):
+                if not self._stream_tokens(pieces):
+                    log(f"slot {slot}: client disconnected, generation cancelled")
+                    state.slots[slot] = prompt_tokens
+                    return
+            else:
+                time.sleep(self._token_delay() * n_predict)
+            predicted_ms = (time.perf_counter() - started) * 1000
+            state.slots[slot] = prompt_tokens + tokenize("".join(pieces))
+
+            timings = {
+                "prompt_n": evaluated,
+                "prompt_ms": round(prompt_ms, 3),
+                "prompt_per_token_ms": round(prompt_ms / evaluated, 3) if evaluated else 0,
+                "prompt_per_second": round(evaluated * 1000 / prompt_ms, 3) if prompt_ms else 0,
+                "predicted_n": n_predict,
+                "predicted_ms": round(predicted_ms, 3),
+                "predicted_per_token_ms": round(predicted_ms / n_predict, 3) if n_predict else 0,
+                "predicted_per_second": round(n_predict * 1000 / predicted_ms, 3) if predicted_ms else 0
+            }
+            log(f"slot print_timing: id {slot} | prompt eval time = {timings['prompt_ms']} ms / {evaluated} tokens")
+            log(f"slot print_timing: id {slot} | eval time = {timings['predicted_ms']} ms / {n_predict} tokens")
+            result = {
+                "content": "" if request.get("stream") else "".join(pieces),
+                "id_slot": slot,
+                "stop": True,
+                "model": state.args.model,
+                "tokens_predicted": n_predict,
+                "tokens_evaluated": len(prompt_tokens),
+                "tokens_cached": reused,
+                "generation_settings": {
+                    "n_ctx": state.args.ctx_size // len(state.slots),
+                    "n_predict": n_predict,
+                    "temperature": request.get("temperature", 0.8),
+                    "top_p": request.get("top_p", 0.95),
+                    "seed": request.get("seed", -1)
+                },
+                "prompt": request.get("prompt", ""),
+                "stopped_eos": False,
+                "stopped_limit": True,
+                "stopped_word": False,
+                "stop_type": "limit",
+                "stopping_word": "",
+                "truncated": False,
+                "timings": timings
+            }
+            if request.get("stream"):
+                try:
+                    self._write_chunk(b"data: " + json.dumps(result).encode("utf-8") + b"\n\n")
+                    self._write_chunk(b"")
+                except (BrokenPipeError, ConnectionResetError):
+                    log(f"slot {slot}: client disconnected before the final chunk")
+            else:
+                self._send_json(200, result)
+        finally:
+            self._release_slot(slot)
+
+    def _write_chunk(self, data):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def _stream_tokens(self, pieces):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for piece in pieces:
+                time.sleep(self._token_delay())
+                self._write_chunk(b"data: " + json.dumps({"content": piece, "stop": False}).encode("utf-8") + b"\n\n")
+        except (BrokenPipeError, ConnectionResetError):
+            return False
+        return True
+
+    def _slot_action(self, request):
+        slot = int(self.path.split("/")[2].split("?")[0])
+        filename = request.get("filename", "")
+        save_dir = self.state.args.slot_save_path
+        if not save_dir or slot not in self.state.slots:
+            self._send_json(400, {"error": "slot save path not set or unknown slot"})
+            return
+        path = os.path.join(save_dir, filename)
+        if "action=save" in self.path:
+            tokens = self.state.slots[slot]
+            with open(path, "w") as f:
+                json.dump(tokens, f)
+            self._send_json(200, {"id_slot": slot, "filename": filename, "n_saved": len(tokens)})
+        elif "action=restore" in self.path:
+            if not os.path.exists(path):
+                self._send_json(400, {"error": "failed to restore slot, could not read file"})
+                return
+            with open(path) as f:
+                self.state.slots[slot] = json.load(f)
+            self._send_json(200, {"id_slot": slot, "filename": filename, "n_restored": len(self.state.slots[slot])})
+        elif "action=erase" in self.path:
+            self.state.slots[slot] = []
+            self._send_json(200, {"id_slot": slot, "n_erased": 0})
+        else:
+            self._send_json(400, {"error": "unknown action"})
+
+    def _embedding(self, request):
+        content = request.get("content", request.get("input", ""))
+        texts = content if isinstance(content, list) else [content]
+        profile = self.state.profile
+        dim = profile.get("embedding_dim", 8)
+        n_tokens = sum(len(tokenize(t)) for t in texts)
+        time.sleep(n_tokens * profile["prompt_ms_per_token"] / 1000)
+        results = []
+        for index, text in enumerate(texts):
+            if self.state.args.pooling == "none":
+                # Like llama-server builds that leave pooling to the caller: one vector per token
+                vector = [[((len(text) + k + 1) * (i + 1)) % 7 - 3.0 for i in range(dim)]
+                          for k in range(max(len(tokenize(text)), 1))]
+            else:
+                vector = [((len(text) + 1) * (i + 1)) % 7 - 3.0 for i in range(dim)]
+            results.append({"index": index, "embedding": vector})
+        self._send_json(200, results if isinstance(content, list) else results[0])
+
+
+class StubArgs:
+    """The llama-server flags the stub cares about."""
+
+    # flag aliases -> (attribute, type)
+    FLAGS = {
+        ("-m", "--model"): ("model", str),
+        ("-c", "--ctx-size"): ("ctx_size", int),
+        ("-np", "--parallel"): ("parallel", int),
+        ("--host",): ("host", str),
+        ("--port",): ("port", int),
+        ("--slot-save-path",): ("slot_save_path", str),
+        ("--pooling",): ("pooling", str),
+    }
+
+    def __init__(self, argv):
+        self.model = "stub.gguf"
+        self.ctx_size = 2048
+        self.parallel = 1
+        self.host = "127.0.0.1"
+        self.port = 8080
+        self.slot_save_path = None
+        self.pooling = None
+        self.no_mmap = "--no-mmap" in argv
+        self.mlock = "--mlock" in argv
+        self.embedding = "--embedding" in argv
+        # llama-server flags such as -cb and -tb would trip argparse's
+        # short-option clustering, so match whole tokens only
+        lookup = {alias: spec for aliases, spec in self.FLAGS.items() for alias in aliases}
+        for flag, value in zip(argv, argv[1:]):
+            if flag in lookup:
+                name, kind = lookup[flag]
+                setattr(self, name, kind(value))
+
+
+def main():
+    args = StubArgs(sys.argv[1:])
+
+    profile = load_profile()
+    state = StubState(args, profile)
+    StubHandler.state = state
+
+    server = ThreadingHTTPServer((args.host, args.port), StubHandler)
+    server.daemon_threads = True
+
+    def load_model():
+        log(f"llama_model_loader: loaded meta data from {args.model}")
+        if os.environ.get("STUB_TOUCH_MODEL") == "1" and os.path.exists(args.model):
+            started = time.perf_counter()
+            size = touch_model(args.model, args.no_mmap)
+            log(f"llm_load_tensors: read {size} bytes in {(time.perf_counter() - started) * 1000:.1f} ms "
+                f"({'no-mmap' if args.no_mmap else 'mmap'})")
+        time.sleep(profile["load_ms"] / 1000)
+        log("llm_load_tensors: CPU buffer size = 1131.48 MiB")
+        state.ready.set()
+        log("main: model loaded")
+        log(f"main: server is listening on {args.host}:{args.port} - starting the main loop")
+        log("srv  update_slots: all slots are idle")
+
+    threading.Thread(target=load_model, daemon=True).start()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Tune the TL1 kernel tiles (BM, BK, bm) for the model we ship.
+
+``Dockerfile.lambda`` generates TL1 kernels from ``app/native/tl1_params.json``.
+This harness sweeps tile candidates for the 2B-4T layer shapes. For each
+variant it regenerates the kernels, rebuilds ``llama-bench`` incrementally
+and measures prompt and generation tokens/s against a GGUF. It then writes
+the winner back to ``tl1_params.json`` for the next image build.
+
+Each shape has its own kernel, so the sweep is coordinate-wise: one shape at
+a time over its candidates, keeping the best tiles found so far for the
+rest. That is a few dozen builds instead of the full cross product.
+
+TL1 kernels are only used for a TL1-quantized GGUF on ARM (convert with
+BitNet's ``setup_env.py -q tl1``). Against the default i2_s model every
+variant measures the same. Tune on the hardware Lambda runs on (Graviton),
+with the function's thread count.
+
+Usage:
+    python bench/tune_tl1.py --bitnet-dir temp/BitNet \\
+        --gguf temp/models/BitNet-b1.58-2B-4T/ggml-model-tl1.gguf --threads 6
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+NATIVE_DIR = os.path.join(BENCH_DIR, "..", "app", "native")
+sys.path.insert(0, NATIVE_DIR)
+
+from tl1_codegen import DEFAULT_PARAMS, MODEL_SHAPES, SIMD_BLOCKS, load_params, run_codegen  # noqa: E402
+
+MODEL = "bitnet_b1_58-2B-4T"
+# Same configuration as Dockerfile.lambda
+CMAKE_FLAGS = [
+    "-DBITNET_ARM_TL1=ON", "-DCMAKE_C_COMPILER=clang", "-DCMAKE_CXX_COMPILER=clang++",
+    "-DBUILD_SHARED_LIBS=OFF", "-DGGML_OPENMP=OFF", "-DCMAKE_BUILD_TYPE=Release"
+]
+DEFAULT_BM = "64,128,160,192,256,320,384,512,640"
+DEFAULT_BK = "64,128,256"
+
+
+def int_list(value):
+    return [int(v) for v in value.split(",") if v]
+
+
+def shape_candidates(M, K, BM_options, BK_options, bm_options):
+    """Every (BM, BK, bm) that satisfies codegen_tl1.py's constraints for an M x K weight."""
+    return [(block_m, block_k, simd)
+            for simd in bm_options if simd in SIMD_BLOCKS
+            for block_m in BM_options if M % block_m == 0 and block_m % simd == 0
+            for block_k in BK_options if K % block_k == 0]
+
+
+def starting_tiles(shapes, candidates, params):
+    """The tiles in ``params`` when they are for this model, else a preset-like guess per shape."""
+    if params.get("model") == MODEL:
+        return [list(t) for t in zip(params["BM"], params["BK"], params["bm"])]
+    tiles = []
+    for options in candidates:
+        # Closest to the 3B preset: BM up to 320, BK 64, bm 32
+        preset = [c for c in options if c[0] <= 320 and c[1] == 64 and c[2] == 32] or options
+        tiles.append(list(max(preset)))
+    return tiles
+
+
+def configure(bitnet_dir, build_dir):
+    subprocess.run(["cmake", "-B", build_dir, *CMAKE_FLAGS], cwd=bitnet_dir, check=True,
+                   capture_output=True, text=True)
+
+
+def build(bitnet_dir, build_dir, jobs):
+    """Rebuild llama-bench; only the LUT kernel translation units change between variants."""
+    subprocess.run(["cmake", "--build", build_dir, "--target", "llama-bench", "-j", str(jobs)],
+                   cwd=bitnet_dir, check=True, capture_output=True, text=True)
+    return os.path.join(bitnet_dir, build_dir, "bin", "llama-bench")
+
+
+def measure(bench_bin, gguf, threads, n_prompt, n_gen, repetitions, timeout=600):
+    """Prompt and generation tokens/s from llama-bench."""
+    command = [bench_bin, "-m", gguf, "-t", str(threads), "-p", str(n_prompt), "-n", str(n_gen),
+               "-r", str(repetitions), "-o", "json"]
+    output = subprocess.run(command, capture_output=True, text=True, timeout=timeout, check=True).stdout
+    result = {"prompt_tps": None, "gen_tps": None}
+    for run in json.loads(output):
+        if run.get("n_prompt", 0) > 0 and run.get("n_gen", 0) == 0:
+            result["prompt_tps"] = round(run["avg_ts"], 3)
+        elif run.get("n_gen", 0) > 0 and run.get("n_prompt", 0) == 0:
+            result["gen_tps"] = round(run["avg_ts"], 3)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bitnet-dir", default="temp/BitNet")
+    parser.add_argument("--gguf", default="temp/models/BitNet-b1.58-2B-4T/ggml-model-tl1.gguf")
+    parser.add_argument("--build-dir", default="build-tune", help="cmake build directory inside the checkout")
+    parser.add_argument("--threads", type=int, default=os.cpu_count())
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(), help="parallel build jobs")
+    parser.add_argument("--n-prompt", type=int, default=128)
+    parser.add_argument("--n-gen", type=int, default=32)
+    parser.add_argument("--repetitions", type=int, default=3)
+    parser.add_argument("--objective", choices=("gen", "prompt"), default="gen",
+                        help="tokens/s to maximise: generation dominates latency for short prompts")
+    parser.add_argument("--BM", default=DEFAULT_BM, help="BM candidates")
+    parser.add_argument("--BK", default=DEFAULT_BK, help="BK candidates")
+    parser.add_argument("--bm", default=",".join(map(str, SIMD_BLOCKS)), help="bm candidates")
+    parser.add_argument("--max-variants", type=int, default=None, help="stop after this many builds")
+    parser.add_argument("--params", default=DEFAULT_PARAMS, help="tile parameters JSON to start from and update")
+    parser.add_argument("--no-write", dest="write", action="store_false", help="report without updating --params")
+    parser.add_argument("--dry-run", action="store_true", help="list the candidates without building")
+    parser.add_argument("--output", default=None, help="also write every variant's results JSON here")
+    args = parser.parse_args()
+
+    shapes = MODEL_SHAPES[MODEL]
+    candidates = [shape_candidates(M, K, int_list(args.BM), int_list(args.BK), int_list(args.bm))
+                  for M, K in shapes]
+    for (M, K), options in zip(shapes, candidates):
+        print(f"shape {M}x{K}: {len(options)} candidates")
+        if not options:
+            raise SystemExit(f"No valid tiles for {M}x{K}; widen --BM/--BK/--bm")
+    if args.dry_run:
+        for (M, K), options in zip(shapes, candidates):
+            print(f"  {M}x{K}: " + " ".join(f"{bm_}/{bk}/{s}" for bm_, bk, s in options))
+        return 0
+    if "i2_s" in os.path.basename(args.gguf):
+        print("warning: an i2_s model does not use TL1 kernels; every variant will measure the same",
+              file=sys.stderr)
+
+    key = "gen_tps" if args.objective == "gen" else "prompt_tps"
+    configure(args.bitnet_dir, args.build_dir)
+    results = []
+
+    def evaluate(tiles):
+        BM, BK, bm = (list(column) for column in zip(*tiles))
+        variant = {"BM": BM, "BK": BK, "bm": bm}
+        started = time.perf_counter()
+        try:
+            run_codegen(args.bitnet_dir, MODEL, BM, BK, bm)
+            bench_bin = build(args.bitnet_dir, args.build_dir, args.jobs)
+            variant.update(measure(bench_bin, args.gguf, args.threads, args.n_prompt, args.n_gen, args.repetitions))
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired, ValueError, AssertionError) as e:
+            detail = getattr(e, "stderr", None) or str(e)
+            variant["error"] = detail.strip()[-500:]
+        variant["elapsed_s"] = round(time.perf_counter() - started, 1)
+        results.append(variant)
+        if "error" in variant:
+            outcome = "failed: " + (variant["error"].splitlines() or ["unknown error"])[-1]
+        else:
+            outcome = f"pp {variant['prompt_tps']} t/s, tg {variant['gen_tps']} t/s"
+        print(f"  BM={BM} BK={BK} bm={bm}: {outcome} [{variant['elapsed_s']}s]")
+        return variant.get(key) or 0
+
+    best_tiles = starting_tiles(shapes, candidates, load_params(args.params))
+    print(f"baseline ({args.threads} threads, objective {args.objective})")
+    best_score = evaluate(best_tiles)
+    for i, ((M, K), options) in enumerate(zip(shapes, candidates)):
+        print(f"shape {M}x{K}")
+        for tile in options:
+            if list(tile) == best_tiles[i]:
+                continue
+            if args.max_variants is not None and len(results) >= args.max_variants:
+                break
+            tiles = [list(t) for t in best_tiles]
+            tiles[i] = list(tile)
+            score = evaluate(tiles)
+            if score > best_score:
+                best_tiles, best_score = tiles, score
+
+    best = next(r for r in reversed(results)
+                if [r["BM"], r["BK"], r["bm"]] == [list(column) for column in zip(*best_tiles)])
+    baseline = results[0]
+    print(f"best: BM={best['BM']} BK={best['BK']} bm={best['bm']} "
+          f"pp {best.get('prompt_tps')} t/s, tg {best.get('gen_tps')} t/s "
+          f"(baseline pp {baseline.get('prompt_tps')}, tg {baseline.get('gen_tps')}) after {len(results)} builds")
+
+    # Leave the checkout's headers matching the winner, as the image build will
+    run_codegen(args.bitnet_dir, MODEL, best["BM"], best["BK"], best["bm"])
+    if args.write and "error" not in best:
+        params = {
+            "model": MODEL,
+            "BM": best["BM"],
+            "BK": best["BK"],
+            "bm": best["bm"],
+            "tuned": {
+                "date": time.strftime("%Y-%m-%d"),
+                "machine": platform.machine(),
+                "threads": args.threads,
+                "gguf": os.path.basename(args.gguf),
+                "objective": args.objective,
+                "prompt_tps": best.get("prompt_tps"),
+                "gen_tps": best.get("gen_tps"),
+                "baseline": {"prompt_tps": baseline.get("prompt_tps"), "gen_tps": baseline.get("gen_tps")}
+            }
+        }
+        with open(args.params, "w") as f:
+            json.dump(params, f, indent=2)
+            f.write("\n")
+        print(f"wrote {args.params}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
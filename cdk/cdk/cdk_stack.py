@@ -7,9 +7,11 @@ from aws_cdk import (
     aws_iam as iam,
     aws_logs as logs,
     aws_ecr_assets as ecr_assets,
+    aws_events as events,
+    aws_events_targets as targets,
 )
 from constructs import Construct
-from env_config import get_resource_name, APP_NAME, ENV_SUFFIX, LAMBDA_MEMORY_SIZE
+from env_config import get_resource_name, APP_NAME, ENV_SUFFIX, LAMBDA_MEMORY_SIZE, MODEL_VARIANT, KEEP_WARM_MINUTES
 import os
 
 class CdkStack(Stack):
@@ -22,6 +24,7 @@ class CdkStack(Stack):
             self, "BitNetImage",
             directory=os.path.join(os.path.dirname(__file__), "..", ".."),
             file="app/Dockerfile.lambda",
+            build_args={"MODEL_VARIANT": MODEL_VARIANT},
             exclude=[
                 "cdk/**",
                 "cdk.out/**",
@@ -71,12 +74,29 @@ class CdkStack(Stack):
             architecture=lambda_.Architecture.ARM_64,  # Keep ARM64
             log_group=log_group,
             environment={
-                "MODEL_PATH": "/app/models/BitNet-b1.58-2B-4T/ggml-model-i2_s.gguf",
+                "MODEL_VARIANT": MODEL_VARIANT,  # Resolved to /app/models/... by app/model_registry.py
                 "CONTEXT_SIZE": "2048",
-                "THREADS": "4"  # Increase threads for better performance with 10GB
+                "THREADS": "auto",  # One thread per available vCPU; "probe" benchmarks candidates at startup
+                "ENGINE": "http",  # llama-server subprocess; "inproc" loads llama.cpp into the handler
+                "MODEL_LOAD_MODE": "mmap",  # or "mlock" / "no-mmap"
+                "MODEL_PREFETCH": "read",  # Parallel page-cache prefetch of the GGUF while the server spawns
+                "STARTUP_MODE": "init"  # Load the model during the Lambda INIT phase
             }
         )
 
+        # Scheduled warm-up pings: no generation, just server readiness, model
+        # pages and prompt prefixes
+        if KEEP_WARM_MINUTES:
+            events.Rule(
+                self, "KeepWarmSchedule",
+                rule_name=get_resource_name("keep-warm"),
+                schedule=events.Schedule.rate(Duration.minutes(KEEP_WARM_MINUTES)),
+                targets=[targets.LambdaFunction(
+                    bitnet_function,
+                    event=events.RuleTargetInput.from_object({"action": "warmup", "prefixes": True})
+                )]
+            )
+
         # Output the Lambda function details
         self.lambda_function_arn = bitnet_function.function_arn
         
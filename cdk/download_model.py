@@ -2,15 +2,43 @@
 """
 BitNet Model Downloader
 Downloads the BitNet model from Hugging Face with proper authentication.
+
+The variant (``--variant`` or MODEL_VARIANT, default i2_s) comes from
+app/model_registry.py. Published GGUFs are downloaded directly; layouts that
+Hugging Face does not publish (tl1) are converted from the bf16 checkpoint
+with the BitNet checkout's converter.
+
+A published GGUF is only downloaded against a known SHA-256: the registry's,
+or MODEL_SHA256 (``--sha256``) when the registry has none pinned.
+
+Downloads go through model_fetch.py: parallel ranged chunks, resume after an
+interruption, SHA-256 verified while streaming, and a content-addressed cache
+(MODEL_CACHE_DIR) that later builds reuse without touching the network.
 """
 
+import argparse
 import os
+import shutil
+import subprocess
 import sys
 from pathlib import Path
-from huggingface_hub import hf_hub_download, login
+from huggingface_hub import login, snapshot_download
 from huggingface_hub.utils import HfHubHTTPError
 import getpass
 
+import model_fetch
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "app"))
+import model_registry  # noqa: E402
+
+def huggingface_token():
+    """The token saved by login(), for model_fetch's authenticated requests."""
+    try:
+        from huggingface_hub import get_token
+    except ImportError:  # older huggingface_hub
+        from huggingface_hub import HfFolder
+        return HfFolder.get_token()
+    return get_token()
+
 def authenticate_huggingface():
     """Authenticate with Hugging Face with retry loop."""
     # Check if already authenticated first
@@ -64,34 +92,64 @@ def authenticate_huggingface():
     
     return False
 
-def download_bitnet_model(model_dir):
-    """Download the BitNet model from the specified repository."""
-    repo_id = "microsoft/bitnet-b1.58-2B-4T-gguf"
-    filename = "ggml-model-i2_s.gguf"
+def convert_bitnet_model(variant, model_dir, project_root):
+    """Convert the bf16 checkpoint into the variant's GGUF layout with BitNet's converter."""
+    bitnet_dir = project_root / "temp" / "BitNet"
+    # Outside temp/models, so the checkpoint never ends up in the image build context
+    source_dir = project_root / "temp" / "hf" / variant["repo_id"].split("/")[-1]
+    print(f"📥 Downloading checkpoint {variant['repo_id']} for conversion to {variant['name']}...")
+    snapshot_download(repo_id=variant["repo_id"], local_dir=str(source_dir))
     
-    print(f"📥 Downloading BitNet model from {repo_id}...")
-    print("This may take several minutes (~750MB download)...")
+    command = [sys.executable] + [arg.format(model_dir=source_dir) for arg in variant["convert"]]
+    print(f"🔧 Converting with: {' '.join(command)}")
+    subprocess.run(command, cwd=str(bitnet_dir), check=True)
+    
+    # The converter writes ggml-model-<type>.gguf next to the checkpoint
+    converted = source_dir / variant["filename"]
+    if not converted.exists():
+        raise Exception(f"Converter did not produce {converted}")
+    shutil.move(str(converted), os.path.join(model_dir, variant["filename"]))
+
+def download_bitnet_model(model_dir, variant_name="i2_s", project_root=None, sha256=None):
+    """Download (or convert) the given model variant into model_dir.
+    
+    ``sha256`` is the expected digest from model_registry.expected_sha256.
+    """
+    variant = model_registry.get_variant(variant_name)
+    repo_id = variant["repo_id"]
+    filename = variant["filename"]
+    
+    print(f"📥 Fetching BitNet model variant {variant_name} ({variant['description']}) from {repo_id}...")
+    print("This may take several minutes...")
     
     try:
         # Create directory if it doesn't exist
         os.makedirs(model_dir, exist_ok=True)
         
-        # Download the model
-        downloaded_path = hf_hub_download(
-            repo_id=repo_id,
-            filename=filename,
-            local_dir=model_dir,
-            local_dir_use_symlinks=False
-        )
-        
-        # Verify download
         model_path = os.path.join(model_dir, filename)
+        if variant["source"] == "convert":
+            convert_bitnet_model(variant, model_dir, project_root or Path(__file__).parent.parent)
+            checksum = model_registry.verify(variant_name, model_path, sha256)
+        else:
+            # Verified against the expected digest while downloading
+            result = model_fetch.fetch(repo_id, filename, model_path, expected_sha256=sha256,
+                                       token=huggingface_token())
+            checksum = result["sha256"]
+            if result["cache"]:
+                print(f"♻️  Served from the model cache in {result['elapsed_s']}s")
+        
         if os.path.exists(model_path):
             file_size = os.path.getsize(model_path)
-            if file_size > 1000000:  # Should be > 1MB (actual model is ~750MB)
-                print(f"✅ Model downloaded successfully from {repo_id}")
+            if variant["size_bytes"] is not None and file_size != variant["size_bytes"]:
+                print(f"❌ Model is {file_size} bytes, registry expects {variant['size_bytes']}")
+                return False
+            if file_size > 1000000:  # Should be > 1MB (actual models are hundreds of MB)
+                print(f"✅ Model {variant_name} ready from {repo_id}")
                 print(f"   File path: {model_path}")
-                print(f"   File size: {file_size / (1024*1024):.1f} MB")
+                print(f"   File size: {file_size / (1024*1024):.1f} MB ({file_size} bytes)")
+                print(f"   SHA-256: {checksum}")
+                if sha256 is None:
+                    print("   (locally converted; no checksum to verify against)")
                 return True
             else:
                 print(f"❌ Downloaded file seems too small: {file_size} bytes")
@@ -113,28 +171,54 @@ def download_bitnet_model(model_dir):
         else:
             print(f"❌ HTTP Error: {e}")
         return False
+    except ValueError as e:
+        print(f"❌ Verification failed: {e}")
+        return False
+    except model_fetch.FetchError as e:
+        print(f"❌ Download failed: {e}")
+        if " 401" in str(e) or " 403" in str(e):
+            print(f"   Check your token and that you accepted the license at https://huggingface.co/{repo_id}")
+        return False
     except Exception as e:
         print(f"❌ Download failed: {e}")
         return False
 
 def main():
     """Main function."""
+    parser = argparse.ArgumentParser(description="Download a BitNet model variant")
+    parser.add_argument("--variant", default=os.getenv("MODEL_VARIANT", model_registry.DEFAULT_VARIANT),
+                        choices=sorted(model_registry.VARIANTS))
+    parser.add_argument("--sha256", default=os.getenv("MODEL_SHA256"),
+                        help="expected SHA-256 when the registry has none pinned (default: MODEL_SHA256)")
+    args = parser.parse_args()
+    
     print("🚀 BitNet Model Downloader")
     print("=" * 50)
     
+    try:
+        sha256 = model_registry.expected_sha256(args.variant, args.sha256)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return False
+    
     # Get project root directory
     script_dir = Path(__file__).parent
     project_root = script_dir.parent
-    model_dir = project_root / "temp" / "models" / "BitNet-b1.58-2B-4T"
+    model_file = Path(model_registry.model_path(args.variant, str(project_root / "temp" / "models")))
+    model_dir = model_file.parent
     
-    print(f"📁 Model will be saved to: {model_dir}")
+    print(f"📁 Model {args.variant} will be saved to: {model_dir}")
     
-    # Check if model already exists
-    model_file = model_dir / "ggml-model-i2_s.gguf"
+    # Check if model already exists; with a recorded checksum, only a verified file counts
     if model_file.exists() and model_file.stat().st_size > 1000000:
-        print("✅ Model already exists and appears valid")
-        print(f"   File size: {model_file.stat().st_size / (1024*1024):.1f} MB")
-        return True
+        try:
+            checksum = model_registry.verify(args.variant, str(model_file), sha256)
+            print("✅ Model already exists and " + ("matches the expected checksum" if sha256 else "appears valid"))
+            print(f"   File size: {model_file.stat().st_size / (1024*1024):.1f} MB, SHA-256: {checksum}")
+            return True
+        except ValueError as e:
+            print(f"⚠️  Existing model rejected ({e}); downloading again")
+            model_file.unlink()
     
     # Authenticate with Hugging Face
     if not authenticate_huggingface():
@@ -146,7 +230,7 @@ def main():
         return False
     
     # Download the model
-    if download_bitnet_model(str(model_dir)):
+    if download_bitnet_model(str(model_dir), args.variant, project_root, sha256):
         print("\n🎉 Model download completed successfully!")
         print("You can now deploy the Lambda function.")
         return True
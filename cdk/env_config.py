@@ -8,7 +8,8 @@ APP_NAME = "bitnet-lambda"
 # Environment suffix - allows multiple deployments (dev, staging, prod, etc.)
 ENV_SUFFIX = "dev"
 
-# Lambda memory size in MB
+# Lambda memory size in MB; `bench/analyze_memory.py --apply` sets it from a
+# scripts/5-benchmark.sh sweep
 #lets deploy againLAMBDA_MEMORY_SIZE = 1024     # 1GB
 LAMBDA_MEMORY_SIZE = 2048   # 2GB
 #LAMBDA_MEMORY_SIZE = 3008   # 3GB
@@ -16,6 +17,14 @@ LAMBDA_MEMORY_SIZE = 2048   # 2GB
 #LAMBDA_MEMORY_SIZE = 7168   # 7GB
 #LAMBDA_MEMORY_SIZE = 10240  # 10GB
 
+# Model variant baked into the image and loaded by the handler; see
+# app/model_registry.py ("i2_s", or "tl1" for ARM lookup-table kernels)
+MODEL_VARIANT = "i2_s"
+
+# Minutes between scheduled warm-up pings ({"action": "warmup"}) that keep a
+# container's model and prompt prefixes hot; None disables the schedule
+KEEP_WARM_MINUTES = None
+
 # Lambda Configuration
 LAMBDA_CONFIG = {
     "memory_size": 10240,  # Memory in MB (10GB)
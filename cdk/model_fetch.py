@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+"""
+Parallel, resumable, checksum-verified model download.
+
+Fetches a file from a Hugging Face repository (or any server honouring HTTP
+range requests) in fixed-size chunks over several connections:
+
+- Chunks are written in place into a ``.part`` file. A small state file
+  records which chunks are complete, so an interrupted download resumes where
+  it stopped instead of starting over.
+- The SHA-256 is computed while the download runs, in file order, as soon as
+  each chunk lands, so verification adds almost nothing at the end. The
+  expected digest comes from the registry or, failing that, from Hugging
+  Face's ``X-Linked-Etag`` header (the LFS object's SHA-256). A mismatch
+  discards the file, and a download with neither digest is refused, so a
+  mirror or proxy that drops the header cannot skip verification.
+- Verified files go into a content-addressed cache (``sha256/<digest>``
+  under ``MODEL_CACHE_DIR``) and are hard-linked into place. Later downloads
+  of the same digest, such as every CDK build on a CI runner that keeps the
+  cache directory, cost no network at all.
+
+``HF_ENDPOINT`` points it at a mirror or at ``bench/stub_model_host.py``.
+
+Usage:
+    python cdk/model_fetch.py --repo-id microsoft/bitnet-b1.58-2B-4T-gguf \\
+        --filename ggml-model-i2_s.gguf --dest temp/models/BitNet-b1.58-2B-4T/ggml-model-i2_s.gguf
+"""
+
+import argparse
+import hashlib
+import http.client
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_ENDPOINT = os.environ.get("HF_ENDPOINT", "https://huggingface.co")
+DEFAULT_CACHE_DIR = os.environ.get(
+    "MODEL_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "bitnet-lambda", "models"))
+CHUNK_BYTES = 16 * 1024 * 1024
+WORKERS = 8
+READ_BYTES = 1024 * 1024
+RETRIES = 5
+TIMEOUT = 60
+
+
+class FetchError(Exception):
+    pass
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    # Redirects are followed by hand, so the token is not forwarded to the CDN
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+_opener = urllib.request.build_opener(_NoRedirect)
+
+
+def resolve_url(repo_id, filename, revision="main", endpoint=DEFAULT_ENDPOINT):
+    return f"{endpoint.rstrip('/')}/{repo_id}/resolve/{revision}/{urllib.parse.quote(filename)}"
+
+
+def _headers_for(url, origin, token):
+    if token and urllib.parse.urlsplit(url).netloc == urllib.parse.urlsplit(origin).netloc:
+        return {"Authorization": f"Bearer {token}"}
+    return {}
+
+
+def _digest_from_etag(value):
+    value = (value or "").strip().strip('"')
+    if value.startswith("W/"):
+        return None
+    return value.lower() if len(value) == 64 and all(c in "0123456789abcdefABCDEF" for c in value) else None
+
+
+def probe(url, token=None, max_redirects=5):
+    """Follow redirects with HEAD; returns the final URL, size, digest hint and range support."""
+    origin = url
+    info = {"sha256": None, "size": None}
+    for _ in range(max_redirects + 1):
+        request = urllib.request.Request(url, method="HEAD", headers=_headers_for(url, origin, token))
+        try:
+            with _opener.open(request, timeout=TIMEOUT) as response:
+                headers = response.headers
+                redirect = None
+        except urllib.error.HTTPError as e:
+            if e.code not in (301, 302, 303, 307, 308):
+                raise FetchError(f"HEAD {url} returned {e.code}")
+            headers = e.headers
+            redirect = urllib.parse.urljoin(url, headers["Location"])
+        # Hugging Face puts the LFS object's size and SHA-256 on the resolve response
+        info["sha256"] = info["sha256"] or _digest_from_etag(headers.get("X-Linked-Etag"))
+        if headers.get("X-Linked-Size"):
+            info["size"] = info["size"] or int(headers["X-Linked-Size"])
+        if redirect is None:
+            if headers.get("Content-Length") is not None:
+                info["size"] = int(headers["Content-Length"])
+            info["sha256"] = info["sha256"] or _digest_from_etag(headers.get("ETag"))
+            info["url"] = url
+            info["headers"] = _headers_for(url, origin, token)
+            info["ranges"] = headers.get("Accept-Ranges", "").lower() == "bytes"
+            return info
+        url = redirect
+    raise FetchError(f"Too many redirects from {origin}")
+
+
+class ModelCache:
+    """Content-addressed store of verified files, plus refs from (repo, revision, file) to digests."""
+
+    def __init__(self, root=DEFAULT_CACHE_DIR):
+        self.root = root
+        for sub in ("sha256", "partial", "refs"):
+            os.makedirs(os.path.join(root, sub), exist_ok=True)
+
+    def blob_path(self, digest):
+        return os.path.join(self.root, "sha256", digest)
+
+    def has(self, digest, size=None):
+        path = self.blob_path(digest)
+        return os.path.exists(path) and (size is None or os.path.getsize(path) == size)
+
+    def partial_path(self, key):
+        return os.path.join(self.root, "partial", key + ".part")
+
+    def _ref_path(self, ref):
+        return os.path.join(self.root, "refs", hashlib.sha256(ref.encode("utf-8")).hexdigest())
+
+    def get_ref(self, ref):
+        try:
+            with open(self._ref_path(ref)) as f:
+                return json.load(f)["sha256"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def put_ref(self, ref, digest):
+        with open(self._ref_path(ref), "w") as f:
+            json.dump({"ref": ref, "sha256": digest}, f)
+
+    def store(self, path, digest):
+        """Move a verified file into the store."""
+        os.replace(path, self.blob_path(digest))
+
+    def link(self, digest, dest):
+        """Hard-link (or copy, across filesystems) a stored file to ``dest``."""
+        os.makedirs(os.path.dirname(os.path.abspath(dest)), exist_ok=True)
+        if os.path.exists(dest) and os.path.samefile(dest, self.blob_path(digest)):
+            return
+        tmp = dest + ".tmp"
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        try:
+            os.link(self.blob_path(digest), tmp)
+        except OSError:
+            shutil.copyfile(self.blob_path(digest), tmp)
+        os.replace(tmp, dest)
+
+
+class ChunkedDownload:
+    """One ranged, resumable download into a ``.part`` file."""
+
+    def __init__(self, url, headers, size, part_path, chunk_bytes=CHUNK_BYTES, ranges=True):
+        self.url = url
+        self.headers = headers
+        self.size = size
+        self.part_path = part_path
+        self.state_path = part_path + ".state"
+        # Without range support the file is one chunk, fetched in one request
+        self.chunk_bytes = chunk_bytes if ranges else max(size, 1)
+        self.n_chunks = max((size + self.chunk_bytes - 1) // self.chunk_bytes, 1)
+        self.done = set()
+        self.downloaded = 0
+        self._lock = threading.Lock()
+
+    def _load_state(self):
+        try:
+            with open(self.state_path) as f:
+                state = json.load(f)
+            if (state["size"] == self.size and state["chunk_bytes"] == self.chunk_bytes
+                    and os.path.getsize(self.part_path) == self.size):
+                return set(state["done"])
+        except (OSError, ValueError, KeyError):
+            pass
+        return set()
+
+    def _save_state(self):
+        tmp = self.state_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"size": self.size, "chunk_bytes": self.chunk_bytes, "done": sorted(self.done)}, f)
+        os.replace(tmp, self.state_path)
+
+    def _range(self, index):
+        start = index * self.chunk_bytes
+        return start, min(start + self.chunk_bytes, self.size) - 1
+
+    def _fetch_chunk(self, fd, index):
+        start, end = self._range(index)
+        for attempt in range(RETRIES):
+            try:
+                headers = dict(self.headers)
+                if self.n_chunks > 1:
+                    headers["Range"] = f"bytes={start}-{end}"
+                request = urllib.request.Request(self.url, headers=headers)
+                with _opener.open(request, timeout=TIMEOUT) as response:
+                    if self.n_chunks > 1 and response.status != 206:
+                        raise FetchError(f"Server ignored the range request (status {response.status})")
+                    offset = start
+                    while offset <= end:
+                        block = response.read(min(READ_BYTES, end + 1 - offset))
+                        if not block:
+                            break
+                        os.pwrite(fd, block, offset)
+                        offset += len(block)
+                if offset != end + 1:
+                    raise FetchError(f"Chunk {index} ended at byte {offset}, expected {end + 1}")
+                with self._lock:
+                    self.done.add(index)
+                    self.downloaded += end + 1 - start
+                    self._save_state()
+                return
+            except (OSError, http.client.HTTPException, FetchError) as e:
+                if attempt == RETRIES - 1:
+                    raise FetchError(f"Chunk {index} failed after {RETRIES} attempts: {e}")
+                time.sleep(min(2 ** attempt, 10))
+
+    def run(self, workers=WORKERS, progress=None):
+        """Download the missing chunks and return the file's SHA-256.
+
+        The main thread hashes chunks in file order while the workers run
+        ahead, so the digest is ready when the last chunk lands.
+        """
+        self.done = self._load_state()
+        if not self.done:
+            with open(self.part_path, "wb") as f:
+                f.truncate(self.size)
+        resumed = len(self.done)
+        digest = hashlib.sha256()
+        fd = os.open(self.part_path, os.O_RDWR)
+        futures = {}
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, min(workers, self.n_chunks))) as pool:
+                futures = {index: pool.submit(self._fetch_chunk, fd, index)
+                           for index in range(self.n_chunks) if index not in self.done}
+                for index in range(self.n_chunks):
+                    if index in futures:
+                        futures[index].result()
+                    start, end = self._range(index)
+                    offset = start
+                    while offset <= end:
+                        block = os.pread(fd, min(8 * READ_BYTES, end + 1 - offset), offset)
+                        digest.update(block)
+                        offset += len(block)
+                    if progress is not None:
+                        progress(index + 1, self.n_chunks, resumed)
+        except BaseException:
+            # Stop queued chunks; finished ones stay recorded for the next attempt
+            for future in futures.values():
+                future.cancel()
+            raise
+        finally:
+            os.close(fd)
+        return digest.hexdigest()
+
+    def discard(self):
+        for path in (self.part_path, self.state_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def _print_progress(done, total, resumed):
+    if done == total or done % max(total // 10, 1) == 0:
+        note = f", {resumed} resumed" if resumed else ""
+        print(f"   {done}/{total} chunks verified ({done * 100 // total}%{note})", flush=True)
+
+
+def fetch(repo_id, filename, dest, expected_sha256=None, revision="main", token=None, endpoint=DEFAULT_ENDPOINT,
+          cache_dir=DEFAULT_CACHE_DIR, workers=WORKERS, chunk_bytes=CHUNK_BYTES, progress=True):
+    """Download ``filename`` from ``repo_id`` to ``dest``, via the cache.
+
+    Returns a dict with the ``path``, ``sha256``, ``size``, whether it came
+    from the ``cache`` and the elapsed seconds. Raises FetchError on
+    network failure, checksum mismatch, or when neither ``expected_sha256``
+    nor the server gives a digest to verify against.
+    """
+    started = time.perf_counter()
+    cache = ModelCache(cache_dir)
+    ref = f"{endpoint}/{repo_id}@{revision}/{filename}"
+
+    def done(digest, cached):
+        cache.link(digest, dest)
+        cache.put_ref(ref, digest)
+        return {"path": dest, "sha256": digest, "size": os.path.getsize(dest), "cache": cached,
+                "elapsed_s": round(time.perf_counter() - started, 2)}
+
+    if expected_sha256 and cache.has(expected_sha256):
+        return done(expected_sha256, True)
+
+    url = resolve_url(repo_id, filename, revision, endpoint)
+    try:
+        info = probe(url, token)
+    except (OSError, http.client.HTTPException, FetchError) as e:
+        # Offline: the last digest seen for this file will do when it is still cached
+        known = expected_sha256 or cache.get_ref(ref)
+        if known and cache.has(known):
+            print(f"⚠️  {e}; using cached {known[:12]}")
+            return done(known, True)
+        raise FetchError(f"Cannot reach {url}: {e}")
+
+    expected = expected_sha256 or info["sha256"]
+    if expected is None:
+        raise FetchError(f"{url} reported no SHA-256 (X-Linked-Etag or ETag) and none was given; "
+                         f"pass the expected digest (--sha256)")
+    if expected_sha256 and info["sha256"] and info["sha256"] != expected_sha256:
+        raise FetchError(f"Server reports sha256 {info['sha256']}, registry expects {expected_sha256}")
+    if expected and cache.has(expected, info["size"]):
+        return done(expected, True)
+    if info["size"] is None:
+        raise FetchError(f"{url} did not report a size")
+
+    key = hashlib.sha256(f"{ref}:{info['size']}:{expected or ''}".encode("utf-8")).hexdigest()[:24]
+    download = ChunkedDownload(info["url"], info["headers"], info["size"], cache.partial_path(key),
+                               chunk_bytes=chunk_bytes, ranges=info["ranges"])
+    if progress:
+        print(f"   {info['size'] / 1024 / 1024:.1f} MiB in {download.n_chunks} chunks over "
+              f"{min(workers, download.n_chunks)} connections", flush=True)
+    digest = download.run(workers, _print_progress if progress else None)
+    if expected and digest != expected:
+        download.discard()
+        raise FetchError(f"sha256 mismatch for {filename}: got {digest}, expected {expected}")
+    cache.store(download.part_path, digest)
+    download.discard()
+    return done(digest, False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repo-id", required=True)
+    parser.add_argument("--filename", required=True)
+    parser.add_argument("--dest", required=True)
+    parser.add_argument("--revision", default="main")
+    parser.add_argument("--sha256", default=None, help="expected digest; required when the server sends none")
+    parser.add_argument("--endpoint", default=DEFAULT_ENDPOINT)
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR)
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--chunk-mb", type=int, default=CHUNK_BYTES // 1024 // 1024)
+    args = parser.parse_args()
+
+    try:
+        result = fetch(args.repo_id, args.filename, args.dest, expected_sha256=args.sha256, revision=args.revision,
+                       token=os.environ.get("HUGGINGFACE_HUB_TOKEN"), endpoint=args.endpoint,
+                       cache_dir=args.cache_dir, workers=args.workers, chunk_bytes=args.chunk_mb * 1024 * 1024)
+    except FetchError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 1
+    print(json.dumps(result))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -36,9 +36,10 @@ python download_model.py
 cd ../temp
 cd ..
 
-# Verify model download
-if [ -f "temp/models/BitNet-b1.58-2B-4T/ggml-model-i2_s.gguf" ]; then
-    MODEL_SIZE=$(stat -f%z "temp/models/BitNet-b1.58-2B-4T/ggml-model-i2_s.gguf" 2>/dev/null || stat -c%s "temp/models/BitNet-b1.58-2B-4T/ggml-model-i2_s.gguf" 2>/dev/null || echo "0")
+# Verify model download (MODEL_VARIANT picks the variant, see app/model_registry.py)
+MODEL_FILE=$(python app/model_registry.py path --variant "${MODEL_VARIANT:-i2_s}" --models-dir temp/models)
+if [ -f "$MODEL_FILE" ]; then
+    MODEL_SIZE=$(stat -f%z "$MODEL_FILE" 2>/dev/null || stat -c%s "$MODEL_FILE" 2>/dev/null || echo "0")
     if [ "$MODEL_SIZE" -gt 1000000 ]; then
         echo "✅ Model downloaded successfully"
     else
@@ -51,11 +52,11 @@ else
 fi
 
 # Verify files exist
-if [ -d "temp/BitNet" ] && [ -f "temp/models/BitNet-b1.58-2B-4T/ggml-model-i2_s.gguf" ]; then
+if [ -d "temp/BitNet" ] && [ -f "$MODEL_FILE" ]; then
     echo ""
     echo "🎉 Initialization complete!"
     echo "   - BitNet source: temp/BitNet/"
-    echo "   - Model file: temp/models/BitNet-b1.58-2B-4T/ggml-model-i2_s.gguf"
+    echo "   - Model file: $MODEL_FILE"
     echo ""
     echo "🚀 You can now run: ./scripts/2-deploy-lambda.sh"
 else
@@ -23,8 +23,9 @@ if [ ! -d "temp/BitNet" ]; then
     exit 1
 fi
 
-# Check if model file exists
-if [ ! -f "temp/models/BitNet-b1.58-2B-4T/ggml-model-i2_s.gguf" ]; then
+# Check if the model file for MODEL_VARIANT exists
+MODEL_FILE=$(python app/model_registry.py path --variant "${MODEL_VARIANT:-i2_s}" --models-dir temp/models)
+if [ ! -f "$MODEL_FILE" ]; then
     echo "❌ Error: Model file not found."
     echo "   Please run the initialization script first:"
     echo "   ./scripts/1-initialize.sh"
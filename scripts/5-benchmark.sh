@@ -4,14 +4,22 @@
 FUNCTION_NAME="bitnet-lambda-dev-function"
 REGION="us-east-1"
 
-# Memory configurations to test (in MB)
-MEMORIES=(2048 4096 6144 8192 10240)
+# Memory configurations to test (in MB); override with MEMORIES="3008 5120"
+MEMORIES=(${MEMORIES:-2048 4096 6144 8192 10240})
 
 # Test configurations: n_predict values for cold start + 3 warm tests
 N_PREDICT_VALUES=(10 10 50 100)
 TEST_LABELS=("COLD_START" "WARM_1" "WARM_2" "WARM_3")
 
-echo "Memory(MB),Test_Type,N_Predict,Response_Time(s),Response"
+# Millisecond wall clock: GNU date, or python3 where date has no %N (macOS)
+if [[ "$(date +%s%3N)" =~ ^[0-9]+$ ]]; then
+    now_ms() { date +%s%3N; }
+else
+    now_ms() { python3 -c 'import time; print(int(time.time() * 1000))'; }
+fi
+
+# Analyze the output with: python bench/analyze_memory.py <saved output>
+echo "Memory(MB),Test_Type,N_Predict,Response_Time(ms),Billed_Duration(ms),Init_Duration(ms),Max_Memory_Used(MB),Tokens_Predicted,TTFT(ms),Gen_Tokens_Per_s,Response"
 echo "========================================================"
 
 for memory in "${MEMORIES[@]}"; do
@@ -40,23 +48,33 @@ for memory in "${MEMORIES[@]}"; do
         n_predict=${N_PREDICT_VALUES[$i]}
         test_label=${TEST_LABELS[$i]}
         
-        # Create test payload
-        PROMPT='{"prompt":"User: What'\''s the difference between 1-bit and 8-bit quantization?\n\nAssistant:","n_predict":'$n_predict'}'
+        # Create test payload; streaming makes the handler report time to first token
+        PROMPT='{"prompt":"User: What'\''s the difference between 1-bit and 8-bit quantization?\n\nAssistant:","n_predict":'$n_predict',"stream":true}'
         
-        # Run test
-        start_time=$(date +%s)
-        echo "$PROMPT" | base64 | aws lambda invoke \
+        # Run test; --log-type Tail returns the REPORT line with billed duration and memory used
+        start_time=$(now_ms)
+        invoke_result=$(echo "$PROMPT" | base64 | aws lambda invoke \
             --function-name "$FUNCTION_NAME" \
             --region "$REGION" \
             --payload file:///dev/stdin \
             --cli-read-timeout 300 \
-            response.json > /dev/null
-        end_time=$(date +%s)
+            --log-type Tail \
+            response.json)
+        end_time=$(now_ms)
         
         duration=$((end_time - start_time))
-        response=$(cat response.json | jq -r '.body' | jq -r '.content' | head -c 30 2>/dev/null || echo "ERROR")
+        report=$(echo "$invoke_result" | jq -r '.LogResult // empty' | base64 --decode 2>/dev/null | grep -o 'REPORT.*')
+        billed=$(echo "$report" | sed -n 's/.*Billed Duration: \([0-9]*\) ms.*/\1/p')
+        init=$(echo "$report" | sed -n 's/.*Init Duration: \([0-9.]*\) ms.*/\1/p')
+        max_memory=$(echo "$report" | sed -n 's/.*Max Memory Used: \([0-9]*\) MB.*/\1/p')
+        body=$(jq -r '.body' response.json 2>/dev/null)
+        tokens=$(echo "$body" | jq -r '.tokens_predicted // empty' 2>/dev/null)
+        ttft=$(echo "$body" | jq -r '.stream.ttft_ms // empty' 2>/dev/null)
+        gen_tps=$(echo "$body" | jq -r '.timings.predicted_per_second // empty' 2>/dev/null)
+        response=$(echo "$body" | jq -r '.content // "ERROR"' 2>/dev/null | head -c 30 | tr ',\n' '  ')
+        response=${response:-ERROR}
         
-        echo "${memory},${test_label},${n_predict},${duration},${response}..."
+        echo "${memory},${test_label},${n_predict},${duration},${billed},${init},${max_memory},${tokens},${ttft},${gen_tps},${response}..."
         
         rm -f response.json
         
@@ -0,0 +1,7 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The handler and the CDK helpers import their siblings by bare module name
+for directory in ("app", "bench", "cdk"):
+    sys.path.insert(0, os.path.join(ROOT, directory))
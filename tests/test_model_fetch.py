@@ -0,0 +1,64 @@
+"""cdk/model_fetch.py against bench/stub_model_host.py."""
+
+import hashlib
+import os
+import socket
+import subprocess
+import sys
+
+import pytest
+
+from conftest import ROOT
+import model_fetch
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def model_file(tmp_path):
+    path = tmp_path / "ggml-model-i2_s.gguf"
+    path.write_bytes(os.urandom(3 * 1024 * 1024 + 17))
+    return path
+
+
+def serve(path, *flags):
+    port = free_port()
+    process = subprocess.Popen([sys.executable, os.path.join(ROOT, "bench", "stub_model_host.py"),
+                                "--file", str(path), "--port", str(port), *flags],
+                               stdout=subprocess.PIPE, text=True)
+    process.stdout.readline()  # "Serving ..." once it listens
+    return process, f"http://127.0.0.1:{port}"
+
+
+def fetch(endpoint, tmp_path, **kwargs):
+    return model_fetch.fetch("microsoft/bitnet-b1.58-2B-4T-gguf", "ggml-model-i2_s.gguf",
+                             str(tmp_path / "out" / "model.gguf"), endpoint=endpoint,
+                             cache_dir=str(tmp_path / "cache"), chunk_bytes=1024 * 1024, progress=False, **kwargs)
+
+
+def test_refuses_download_without_any_digest(model_file, tmp_path):
+    process, endpoint = serve(model_file, "--no-digest")
+    try:
+        with pytest.raises(model_fetch.FetchError, match="no SHA-256"):
+            fetch(endpoint, tmp_path)
+        assert not os.listdir(tmp_path / "cache" / "sha256")
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def test_given_digest_verifies_without_server_digest(model_file, tmp_path):
+    digest = hashlib.sha256(model_file.read_bytes()).hexdigest()
+    process, endpoint = serve(model_file, "--no-digest")
+    try:
+        result = fetch(endpoint, tmp_path, expected_sha256=digest)
+        assert result["sha256"] == digest
+        with pytest.raises(model_fetch.FetchError, match="mismatch"):
+            fetch(endpoint, tmp_path / "other", expected_sha256="0" * 64)
+    finally:
+        process.terminate()
+        process.wait()
@@ -0,0 +1,53 @@
+"""Prefix cache behaviour against bench/stub_server.py."""
+
+import importlib
+import json
+import os
+import sys
+
+import pytest
+
+from conftest import ROOT
+
+
+@pytest.fixture(scope="module")
+def handler(tmp_path_factory):
+    root = tmp_path_factory.mktemp("prefix")
+    model = root / "model.gguf"
+    model.write_bytes(b"\0" * 4096)
+    prefixes = root / "prefixes.json"
+    prefixes.write_text(json.dumps(["You are a helpful assistant. Answer briefly and precisely. " * 3]))
+    environ = dict(os.environ)
+    os.environ.update(
+        SERVER_BIN=os.path.join(ROOT, "bench", "stub_server.py"),
+        STUB_SPEED="20",
+        MODEL_PATH=str(model),
+        PARALLEL_SLOTS="4",
+        PROMPT_PREFIXES_FILE=str(prefixes),
+        PREFIX_CACHE_DIR=str(root / "slots"),
+        PREFIX_SEED_DIR=str(root / "seed"),
+        STARTUP_MODE="lazy",
+        EMF_METRICS="0",
+    )
+    sys.modules.pop("lambda_handler", None)
+    module = importlib.import_module("lambda_handler")
+    yield module
+    module.cleanup()
+    sys.modules.pop("lambda_handler", None)
+    os.environ.clear()
+    os.environ.update(environ)
+
+
+def test_shared_prefix_batch_uses_several_slots(handler):
+    from run_benchmark import FakeContext
+
+    prefix = json.loads(open(os.environ["PROMPT_PREFIXES_FILE"]).read())[0]
+    response = handler.lambda_handler({
+        "prompts": [prefix + f"Question {i}?" for i in range(4)],
+        "n_predict": 8,
+        "fields": ["id_slot", "prefix_cache"]
+    }, FakeContext())
+    assert response["statusCode"] == 200
+    results = json.loads(response["body"])["results"]
+    assert all(result["prefix_cache"]["state"] != "busy" for result in results)
+    assert len({result["id_slot"] for result in results}) > 1